@@ -1,35 +1,407 @@
+import time
+
+# Taken before anything heavy is imported so startup timings include it
+PROCESS_START = time.perf_counter()
+
 import pygame
 import sys
 import math
 import json
 import random
+import threading
+import statistics
+import contextlib
+from collections import deque
+import heapq
+import gc
+import marshal
+import zlib
+import os
+import queue
+import struct
+import tempfile
+import hashlib
+import mmap
+import tracemalloc
+from array import array
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from enum import Enum
 
-# Initialize Pygame
-pygame.init()
-pygame.mixer.init()  # Initialize the mixer for sound
-
-# --- Sound Loading ---
-# Create a "sounds" folder and add your audio files.
 try:
-    jump_sound = pygame.mixer.Sound("sounds/jump.wav")
-    walk_sound = pygame.mixer.Sound("sounds/walk.wav")
-    fireball_sound = pygame.mixer.Sound("sounds/fireball.wav")
-    # Music files will be loaded later depending on the game state
-except pygame.error as e:
-    print(f"Warning: Could not load sound files. {e}")
-    # Create dummy sound objects so the game doesn't crash
-    jump_sound = type('DummySound', (object,), {'play': lambda: None})()
-    walk_sound = type('DummySound', (object,), {'play': lambda: None})()
-    fireball_sound = type('DummySound', (object,), {'play': lambda: None})()
+    import numpy
+except ImportError:  # Only the batched physics tools need it
+    numpy = None
+
+
+class StartupTimer:
+    """Records named startup milestones relative to process start."""
+
+    def __init__(self, budget_ms=500):
+        self.budget_ms = budget_ms
+        self.marks = []
+        self.report_enabled = False
+        self.lock = threading.Lock()
+
+    def mark(self, name):
+        elapsed_ms = (time.perf_counter() - PROCESS_START) * 1000
+        with self.lock:
+            self.marks.append((name, elapsed_ms))
+        return elapsed_ms
+
+    def elapsed(self, name):
+        for mark_name, elapsed_ms in self.marks:
+            if mark_name == name:
+                return elapsed_ms
+        return None
+
+    def report(self):
+        with self.lock:
+            marks = sorted(self.marks, key=lambda mark: mark[1])
+        print("Startup timing (ms since process start):")
+        for name, elapsed_ms in marks:
+            print(f"  {elapsed_ms:8.1f}  {name}")
+        first_frame = self.elapsed("first frame")
+        if first_frame is not None and first_frame > self.budget_ms:
+            print(f"Warning: time to first frame {first_frame:.1f}ms exceeds the {self.budget_ms}ms budget")
+
+
+startup = StartupTimer()
+
+
+audio_init_lock = threading.Lock()
+# Reserved for decoded music and the audio monitor's probe, so sound effects never take them over
+MUSIC_CHANNEL = 0
+PROBE_CHANNEL = 1
+
+
+def init_audio():
+    """Initialize the mixer on first use; returns False if audio is unavailable."""
+    with audio_init_lock:
+        if pygame.mixer.get_init():
+            return True
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            print(f"Warning: Could not initialize audio. {e}")
+            return False
+        pygame.mixer.set_reserved(2)
+        startup.mark("mixer initialized")
+        return True
+
+
+def fade_out_music(ms):
+    if pygame.mixer.get_init():
+        pygame.mixer.music.fadeout(ms)
+        channel = pygame.mixer.Channel(MUSIC_CHANNEL)
+        if ms > 0:
+            channel.fadeout(ms)
+        else:
+            channel.stop()
+
+
+# Mixer setups from lowest latency to safest against dropouts
+AUDIO_PRESETS = {
+    'low_latency': {'frequency': 48000, 'size': -16, 'channels': 2, 'buffer': 256},
+    'balanced': {'frequency': 44100, 'size': -16, 'channels': 2, 'buffer': 512},
+    'safe': {'frequency': 44100, 'size': -16, 'channels': 2, 'buffer': 2048},
+}
+
+
+class AudioSetup:
+    """Chooses the mixer format before it starts, measures output latency and watches for dropouts.
+
+    pygame does not expose the device's underrun count, so with monitoring on
+    a background thread keeps timing a silent click on its own channel: the
+    mixer consumes it on its next callback, and a callback more than one
+    buffer late means the device ran dry, which is counted as a suspected
+    underrun.
+    """
+
+    def __init__(self, preset='balanced'):
+        self.settings = dict(AUDIO_PRESETS[preset])
+        self.preset = preset
+        self.report_enabled = False
+        self.monitoring = False
+        self.probes = deque(maxlen=10000)
+        self.suspected_underruns = 0
+
+    def configure(self, preset=None, **overrides):
+        if preset is not None:
+            self.preset = preset
+            self.settings = dict(AUDIO_PRESETS[preset])
+        self.settings.update({name: value for name, value in overrides.items() if value is not None})
+        pygame.mixer.pre_init(**self.settings)
+
+    @property
+    def buffer_ms(self):
+        frequency = pygame.mixer.get_init()[0] if pygame.mixer.get_init() else self.settings['frequency']
+        return self.settings['buffer'] / frequency * 1000
+
+    def click(self):
+        frequency, _, channels = pygame.mixer.get_init()
+        return pygame.mixer.Sound(buffer=bytes(channels * 2 * (frequency // 1000)))
+
+    def time_click(self, click, channel=None):
+        """Milliseconds until the mixer consumed the click, or None if no channel was free to play it."""
+        start = time.perf_counter()
+        if channel is None:
+            channel = click.play()
+            if channel is None:
+                return None
+        else:
+            channel.play(click)
+        while channel.get_busy():
+            time.sleep(0.0002)
+        return (time.perf_counter() - start) * 1000
+
+    def measure_latency(self, trials=50):
+        """Times play() of a one-millisecond click until the mixer has consumed it, in ms.
+
+        Works on any driver, including dummy. Audible delay is this plus the
+        buffer the device is still playing out.
+        """
+        click = self.click()
+        # The probe channel is never busy with anything else, so no trial times a click that never played
+        channel = pygame.mixer.Channel(PROBE_CHANNEL)
+        times = []
+        for trial in range(trials):
+            elapsed_ms = self.time_click(click, channel)
+            if elapsed_ms is not None:
+                times.append(elapsed_ms)
+            # Vary the phase against the mixer's callback
+            time.sleep(0.001 * (trial % 7))
+        return sorted(times)
+
+    def frame(self):
+        if self.report_enabled and not self.monitoring and pygame.mixer.get_init():
+            self.monitoring = True
+            threading.Thread(target=self.monitor, daemon=True).start()
+
+    def monitor(self):
+        click = self.click()
+        channel = pygame.mixer.Channel(PROBE_CHANNEL)
+        while True:
+            elapsed_ms = self.time_click(click, channel)
+            self.probes.append(elapsed_ms)
+            # Consumed within one callback period plus polling slack, unless a callback was missed
+            if elapsed_ms > self.buffer_ms * 2 + 1:
+                self.suspected_underruns += 1
+            time.sleep(0.02)
+
+    def report(self):
+        print(f"Audio ({self.preset}: {self.settings['frequency']} Hz, {self.settings['channels']} channels, "
+              f"{self.settings['buffer']}-sample buffer = {self.buffer_ms:.1f}ms):")
+        if not self.probes:
+            print("  no probes (audio never started)")
+            return
+        probes = sorted(self.probes)
+        print(f"  {len(probes)} probes, play-to-mix p50 {probes[len(probes) // 2]:.2f}ms  max {probes[-1]:.2f}ms, "
+              f"{self.suspected_underruns} suspected underruns")
+
+
+audio = AudioSetup()
+
+
+def audio_latency_test(trials=50):
+    """Measures play()-to-output latency for each preset and prints a table."""
+    print(f"{'preset':<12} {'buffer ms':>9} {'p50':>7} {'p95':>7} {'max':>7} {'+buffer':>8}   (ms)")
+    for preset in AUDIO_PRESETS:
+        pygame.mixer.quit()
+        audio.configure(preset)
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            print(f"{preset:<12} unavailable: {e}")
+            continue
+        times = audio.measure_latency(trials)
+        if not times:
+            print(f"{preset:<12} unavailable: no click was played")
+            continue
+        p50 = times[len(times) // 2]
+        print(f"{preset:<12} {audio.buffer_ms:>9.1f} {p50:>7.2f} {times[int(len(times) * 0.95)]:>7.2f} "
+              f"{times[-1]:>7.2f} {p50 + audio.buffer_ms:>8.2f}")
+    pygame.mixer.quit()
+
+
+# Assets are looked up in sounds/ first, then next to this file
+ASSET_DIRS = ("sounds", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds"),
+              os.path.dirname(os.path.abspath(__file__)))
+
+
+def find_asset(filename):
+    for directory in ASSET_DIRS:
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class LazySound:
+    """Stands in for a mixer Sound until it has been loaded.
+
+    Calls made before the sound is loaded, or after loading failed, are ignored
+    so gameplay never waits on audio. Decoded samples are kept in the bake
+    cache, so later runs skip decoding and map the samples straight in.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.path = None
+        self.sound = None
+        self.failed = False
+        self.source = None
+        self.load_ms = None
+
+    def load(self):
+        if self.sound is not None or self.failed:
+            return self.sound
+        start = time.perf_counter()
+        if not init_audio():
+            self.failed = True
+            return None
+        self.path = find_asset(self.filename)
+        if self.path is None:
+            print(f"Warning: Could not find {self.filename} in {', '.join(ASSET_DIRS)}")
+            self.failed = True
+            self.source = "missing"
+            return None
+        digest = None
+        if bake_cache.enabled:
+            stat = os.stat(self.path)
+            digest = bake_cache.digest('pcm', self.filename, stat.st_size, stat.st_mtime_ns, pygame.mixer.get_init())
+            samples = bake_cache.load_raw(digest, '.pcm')
+            if samples is not None:
+                self.sound = pygame.mixer.Sound(buffer=samples)
+                self.source = "cached"
+        if self.sound is None:
+            try:
+                self.sound = pygame.mixer.Sound(self.path)
+            except (pygame.error, FileNotFoundError) as e:
+                print(f"Warning: Could not load sound file. {e}")
+                self.failed = True
+                self.source = "failed"
+                return None
+            self.source = "decoded"
+            if digest:
+                bake_cache.write(bake_cache.path(digest, '.pcm'), self.sound.get_raw())
+        self.load_ms = (time.perf_counter() - start) * 1000
+        return self.sound
+
+    def play(self, *args, **kwargs):
+        if self.sound is not None:
+            return self.sound.play(*args, **kwargs)
+
+    def stop(self):
+        if self.sound is not None:
+            self.sound.stop()
+
+    def set_volume(self, value):
+        if self.sound is not None:
+            self.sound.set_volume(value)
+
+
+# Every audio file the game uses, by name: (file, kind)
+ASSET_MANIFEST = {
+    'jump': ('jump.wav', 'sound'),
+    'walk': ('walk.wav', 'sound'),
+    'fireball': ('fireball.wav', 'sound'),
+    'menu_theme': ('menu_theme.mp3', 'music'),
+    'game_theme': ('game_theme.mp3', 'music'),
+    'ending_theme': ('ending_theme.mp3', 'music'),
+}
+
+
+class AssetLoader:
+    """Decodes everything in the manifest, plus any extra tasks, on a thread pool and times each one."""
+
+    def __init__(self, manifest=ASSET_MANIFEST):
+        self.manifest = manifest
+        self.sounds = {name: LazySound(filename) for name, (filename, kind) in manifest.items()}
+        self.task_ms = {}
+        self.report_enabled = False
+
+    def timed(self, name, task):
+        start = time.perf_counter()
+        task()
+        self.task_ms[name] = (time.perf_counter() - start) * 1000
+
+    def load_all(self, tasks=(), ready=None):
+        """Blocks until everything is loaded; ready() is called as soon as the sound effects are.
+
+        Effects are queued first, then music, then the extra (name, callable) tasks.
+        """
+        effects = [name for name, (_, kind) in self.manifest.items() if kind == 'sound']
+        music = [name for name, (_, kind) in self.manifest.items() if kind != 'sound']
+        workers = max(1, min(len(self.sounds) + len(tasks), os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            effect_futures = [pool.submit(self.sounds[name].load) for name in effects]
+            futures = [pool.submit(self.sounds[name].load) for name in music]
+            futures += [pool.submit(self.timed, name, task) for name, task in tasks]
+            for future in effect_futures:
+                future.result()
+            if ready is not None:
+                ready()
+            for future in futures:
+                future.result()
+
+    def report(self):
+        print("Assets (ms):")
+        for name, sound in self.sounds.items():
+            load_ms = f"{sound.load_ms:8.1f}" if sound.load_ms is not None else f"{'-':>8}"
+            size = f"{sound.sound.get_length():6.1f}s" if sound.sound is not None else ""
+            print(f"  {name:<14} {load_ms}  {sound.source or 'not loaded':<10} {size}  {sound.path or sound.filename}")
+        for name, task_ms in self.task_ms.items():
+            print(f"  {name:<14} {task_ms:8.1f}")
+
+
+assets = AssetLoader()
+jump_sound = assets.sounds['jump']
+walk_sound = assets.sounds['walk']
+fireball_sound = assets.sounds['fireball']
 
 # Constants
 SCREEN_WIDTH = 1200
 SCREEN_HEIGHT = 800
 FPS = 60
+# The world steps this many times a second whatever the frame rate; a frame runs as many ticks as are due,
+# up to MAX_TICKS_PER_FRAME, past which the game slows down rather than falling further behind
+TICK_RATE = 60
+MAX_TICKS_PER_FRAME = 4
 GRAVITY = 0.8
 JUMP_STRENGTH = -15
 PLAYER_SPEED = 5
+# Longest single collision step; half the thinnest platform (20px) so no speed can skip one
+MAX_MOVE_STEP = 10
+
+# Large levels are split into chunks; objects far from the player update less often
+CHUNK_WIDTH = 600
+CHUNK_HEIGHT = 400
+ACTIVE_CHUNK_RADIUS = 1
+FAR_UPDATE_INTERVAL = 8
+TRIGGER_CELL_SIZE = 128
+NPC_TALK_RADIUS = 60
+
+# Rewind history: how far back R can go and how often a full keyframe is stored
+REWIND_SECONDS = 300
+REWIND_KEYFRAME_INTERVAL = 60
+ABILITY_NAMES = ('jump', 'double_jump', 'fireball')
+GHOST_MEMORY_BUDGET = 4 * 1024 * 1024  # about six hours of play at 3 bytes a tick
+GHOST_LIMIT = 32  # most recent passes drawn per level
+GHOST_ALPHA = 70
+
+SAVE_PATH = "save.dat"
+SAVE_MAGIC = b'TTIG'
+SAVE_VERSION = 1
+BAKE_CACHE_DIR = ".cache"
+BAKE_CACHE_BUDGET = 128 * 1024 * 1024
+CONFIG_PATH = "config.json"
+REACH_MAX_FRAMES = 1800  # Deepest search, in frames from the level start
+REACH_STATE_STEP = 0.1  # Position and vel_y resolution two states must share to count as the same state
+CAPTURE_DIR = "captures"
+CAPTURE_QUEUE = 8  # Frames waiting on the encoder before new ones are dropped
+TELEMETRY_DIR = "telemetry"
+TELEMETRY_FILE_BYTES = 4 * 1024 * 1024  # Rotate to a new file past this size
+TELEMETRY_FILES = 5  # Rotated files kept, including the live one
 
 # Limbo Color Palette - Grayscale only
 BLACK = (0, 0, 0)
@@ -46,6 +418,1304 @@ BACKGROUND = (180, 180, 180)
 FOG_COLOR = (200, 200, 200)
 LIGHT_COLOR = (255, 255, 255)
 
+# Flag blits of surfaces that are not in the display's native format
+DEBUG_SURFACE_FORMATS = False
+
+
+class AllocationTracker:
+    """Counts surfaces created per frame by call site and watches the Python heap between frames.
+
+    Off unless enabled, since tracemalloc slows every allocation down. Surface
+    pixels live outside the Python heap, so their bytes are counted here from
+    the surface size rather than by tracemalloc. Frames in warm-up are skipped
+    so sprite caches can fill before gameplay frames are held to the target.
+    """
+
+    def __init__(self, target=0, warmup=120, snapshot_interval=300, leak_snapshots=4):
+        self.enabled = False
+        self.target = target
+        self.warmup = warmup
+        self.snapshot_interval = snapshot_interval
+        self.leak_snapshots = leak_snapshots
+        self.frame = 0
+        self.frame_sites = {}
+        self.sites = {}
+        self.gameplay_frames = 0
+        self.over_target_frames = 0
+        self.warned_sites = set()
+        self.watched = {}
+        self.sizes = {}
+        self.snapshot = None
+        self.baseline = None
+        self.heap_growth = []
+        self.skip_codes = set()
+
+    def enable(self):
+        self.enabled = True
+        self.skip_codes = {SurfaceFactory.new.__code__, SurfaceFactory.cached.__code__}
+        tracemalloc.start()
+
+    def watch(self, name, size):
+        """Tracks size() at every snapshot; a container that only ever grows is reported as a leak."""
+        self.watched[name] = size
+        self.sizes[name] = []
+
+    def record(self, surf, frame):
+        while frame.f_code in self.skip_codes:
+            frame = frame.f_back
+        site = f"{frame.f_code.co_qualname}:{frame.f_lineno}"
+        counts = self.frame_sites.setdefault(site, [0, 0])
+        counts[0] += 1
+        counts[1] += surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+    def end_frame(self, gameplay):
+        self.frame += 1
+        if self.frame > self.warmup:
+            for site, (count, size) in self.frame_sites.items():
+                totals = self.sites.setdefault(site, [0, 0, 0])
+                totals[0] += count
+                totals[1] += size
+                totals[2] += 1
+            if gameplay:
+                self.gameplay_frames += 1
+                count = sum(count for count, _ in self.frame_sites.values())
+                if count > self.target:
+                    self.over_target_frames += 1
+                    for site in self.frame_sites:
+                        if site not in self.warned_sites:
+                            self.warned_sites.add(site)
+                            print(f"Warning: gameplay frame {self.frame} allocated surfaces at {site}")
+            if (self.frame - self.warmup) % self.snapshot_interval == 1:
+                self.take_snapshot()
+        self.frame_sites.clear()
+
+    def take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        current = tracemalloc.get_traced_memory()[0]
+        if self.snapshot is None:
+            self.baseline = (self.frame, current)
+        else:
+            self.heap_growth = snapshot.compare_to(self.snapshot, 'lineno')[:5]
+        self.snapshot = snapshot
+        self.snapshot_current = (self.frame, current)
+        for name, size in self.watched.items():
+            try:
+                self.sizes[name].append(size())
+            except AttributeError:
+                # Watched object not created yet (no level loaded)
+                self.sizes[name].append(0)
+
+    def leaks(self):
+        for name, sizes in self.sizes.items():
+            recent = sizes[-self.leak_snapshots:]
+            if len(recent) == self.leak_snapshots and all(a < b for a, b in zip(recent, recent[1:])):
+                yield name, recent
+
+    def report(self):
+        frames = self.frame - self.warmup
+        if frames <= 0:
+            print("Allocations: not enough frames")
+            return
+        count = sum(totals[0] for totals in self.sites.values())
+        size = sum(totals[1] for totals in self.sites.values())
+        print(f"Allocations ({frames} frames after {self.warmup} warm-up, {self.gameplay_frames} gameplay):")
+        print(f"  surfaces/frame {count / frames:.2f}  surface KB/frame {size / frames / 1024:.1f}")
+        for site, (site_count, site_size, site_frames) in sorted(self.sites.items(), key=lambda item: -item[1][1]):
+            print(f"  {site:<40} {site_count / frames:6.2f}/frame  {site_size / 1024:9.1f} KB  "
+                  f"in {site_frames} frames")
+        if self.baseline is not None and self.snapshot_current[0] > self.baseline[0]:
+            growth = self.snapshot_current[1] - self.baseline[1]
+            print(f"  Python heap growth {growth / 1024:.1f} KB "
+                  f"({growth / (self.snapshot_current[0] - self.baseline[0]):.1f} bytes/frame)")
+            for stat in self.heap_growth:
+                print(f"    {stat}")
+        for name, sizes in self.leaks():
+            print(f"  Suspected leak: {name} grew every snapshot: {' -> '.join(map(str, sizes))}")
+        if self.gameplay_frames:
+            verdict = "met" if not self.over_target_frames else f"missed in {self.over_target_frames} frames"
+            print(f"  Target of {self.target} surfaces per gameplay frame: {verdict}")
+
+
+allocations = AllocationTracker()
+
+
+class BakeCache:
+    """Content-addressed store of baked sprites, chunk layers and level data under BAKE_CACHE_DIR.
+
+    Entries are named by a SHA-1 of everything that produced them, salted
+    with this file's source and the pygame and Python versions, so a change
+    anywhere just misses and rebakes. Pixel files are a small header and raw
+    BGRA rows (the native alpha layout on little-endian displays), memory-
+    mapped and wrapped with pygame.image.frombuffer without copying. Writes
+    go through a background thread.
+    """
+
+    HEADER = struct.Struct('<4sII')
+    MAGIC = b'TTB1'
+
+    def __init__(self, directory=BAKE_CACHE_DIR, budget=BAKE_CACHE_BUDGET):
+        self.directory = directory
+        self.budget = budget
+        self.enabled = True
+        self.salt = None
+        self.hits = 0
+        self.misses = 0
+        self.pending = None
+
+    def digest(self, *parts):
+        if self.salt is None:
+            try:
+                with open(__file__, 'rb') as f:
+                    source = f.read()
+            except OSError:
+                source = b''
+            self.salt = hashlib.sha1(source + pygame.version.ver.encode() + sys.version.encode()).digest()
+        digest = hashlib.sha1(self.salt)
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else repr(part).encode())
+        return digest.hexdigest()
+
+    def path(self, digest, suffix):
+        return os.path.join(self.directory, digest + suffix)
+
+    def load_surface(self, digest):
+        """The cached pixels as a surface backed by the mapped file, or None."""
+        try:
+            with open(self.path(digest, '.px'), 'rb') as f:
+                # Copy-on-write, so drawing on the surface never touches the file
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        magic, width, height = self.HEADER.unpack_from(data) if len(data) >= self.HEADER.size else (None, 0, 0)
+        if magic != self.MAGIC or len(data) != self.HEADER.size + width * height * 4:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pygame.image.frombuffer(memoryview(data)[self.HEADER.size:], (width, height), 'BGRA')
+
+    def store_surface(self, digest, surf):
+        header = self.HEADER.pack(self.MAGIC, surf.get_width(), surf.get_height())
+        self.write(self.path(digest, '.px'), header + pygame.image.tobytes(surf, 'BGRA'))
+
+    def has(self, digest, suffix):
+        return os.path.exists(self.path(digest, suffix))
+
+    def load_raw(self, digest, suffix):
+        """The file's bytes as a read-only view of its mapping, or None."""
+        try:
+            with open(self.path(digest, suffix), 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return memoryview(data)
+
+    def load_data(self, digest, suffix):
+        try:
+            with open(self.path(digest, suffix), 'rb') as f:
+                data = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def store_data(self, digest, suffix, data):
+        self.write(self.path(digest, suffix), marshal.dumps(data))
+
+    def write(self, path, data):
+        if self.pending is None:
+            self.pending = queue.Queue()
+            threading.Thread(target=self.run, daemon=True).start()
+        self.pending.put((path, data))
+
+    def prune(self):
+        """Deletes the least recently used entries until the cache fits its budget."""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        except OSError:
+            return
+        stats = sorted(((entry.stat().st_atime, entry.stat().st_size, entry.path) for entry in entries))
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in stats:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def run(self):
+        # Entries from older builds are never read again; clear them out before adding more
+        self.prune()
+        while True:
+            path, data = self.pending.get()
+            if self.enabled:
+                try:
+                    os.makedirs(self.directory, exist_ok=True)
+                    fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".bake-")
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(data)
+                    os.replace(temp_path, path)
+                except OSError as e:
+                    print(f"Warning: Could not write bake cache, disabling it. {e}")
+                    self.enabled = False
+            self.pending.task_done()
+
+    def flush(self):
+        if self.pending is not None:
+            self.pending.join()
+
+
+bake_cache = BakeCache()
+
+
+class SurfaceFactory:
+    """Creates surfaces in the display's native format and caches reusable sprites."""
+
+    def __init__(self, max_cached=512):
+        self.cache = {}
+        self.max_cached = max_cached
+        self.alpha_format = None
+        self.flagged = set()
+        # Asset loader threads prebake into the cache while the main thread draws from it
+        self.lock = threading.Lock()
+
+    def native_format(self, alpha):
+        display = pygame.display.get_surface()
+        if display is None:
+            return None
+        if not alpha:
+            return display.get_bitsize(), display.get_masks()
+        if self.alpha_format is None:
+            probe = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha()
+            self.alpha_format = probe.get_bitsize(), probe.get_masks()
+        return self.alpha_format
+
+    def is_native(self, surf):
+        alpha = bool(surf.get_flags() & pygame.SRCALPHA)
+        native = self.native_format(alpha)
+        return native is None or (surf.get_bitsize(), surf.get_masks()) == native
+
+    def new(self, size, alpha=False):
+        size = (max(1, int(size[0])), max(1, int(size[1])))
+        display = pygame.display.get_surface()
+        if display is None:
+            surf = pygame.Surface(size, pygame.SRCALPHA if alpha else 0)
+        elif not alpha:
+            surf = pygame.Surface(size, 0, display)
+        else:
+            surf = pygame.Surface(size, pygame.SRCALPHA)
+            if not self.is_native(surf):
+                surf = surf.convert_alpha()
+        if allocations.enabled:
+            allocations.record(surf, sys._getframe(1))
+        return surf
+
+    def cached(self, key, size, alpha, painter, baked=False, args=()):
+        """Returns the sprite for key, painting it on a miss with painter(surf, *args).
+
+        Passing a module-level painter and its args keeps per-entity draw loops
+        from building a closure for every sprite they look up. baked sprites
+        are also kept in the on-disk bake cache, so only pass it when key and
+        size fully determine what painter draws.
+        """
+        with self.lock:
+            surf = self.cache.get(key)
+        if surf is None:
+            # Painted outside the lock; painters may ask the cache for other sprites
+            digest = bake_cache.digest('sprite', key, size, alpha) if baked and bake_cache.enabled else None
+            surf = self.load_baked(digest, alpha) if digest else None
+            if surf is None:
+                surf = self.new(size, alpha)
+                painter(surf, *args)
+                if digest:
+                    bake_cache.store_surface(digest, surf)
+        with self.lock:
+            self.cache.pop(key, None)
+            if len(self.cache) >= self.max_cached:
+                del self.cache[next(iter(self.cache))]
+            # Re-insert so the dict stays ordered by most recent use
+            self.cache[key] = surf
+        return surf
+
+    def load_baked(self, digest, alpha):
+        surf = bake_cache.load_surface(digest)
+        if surf is None or pygame.display.get_surface() is None:
+            return surf
+        if not alpha:
+            return surf.convert()
+        return surf if self.is_native(surf) else surf.convert_alpha()
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+        self.alpha_format = None
+
+    def blit(self, dest, source, pos, area=None, special_flags=0):
+        if DEBUG_SURFACE_FORMATS and not self.is_native(source):
+            signature = (source.get_size(), source.get_bitsize(), source.get_masks())
+            if signature not in self.flagged:
+                self.flagged.add(signature)
+                print(f"Warning: blitting non-native surface {signature}")
+        return dest.blit(source, pos, area, special_flags)
+
+
+surfaces = SurfaceFactory()
+
+
+class SizedFont(pygame.font.Font):
+    """A font that remembers the file and size it was opened with, so text sprites can be cached by them."""
+
+    def __init__(self, path, size):
+        super().__init__(path, size)
+        self.key = (path, size)
+
+
+# Ordered best to cheapest; the governor moves one step at a time
+QUALITY_TIERS = [
+    {'name': 'high', 'fog_count': 4, 'particle_cap': 400, 'glow_step': 1, 'outline_passes': 9,
+     'lightmap_scale': 1},
+    {'name': 'medium', 'fog_count': 3, 'particle_cap': 200, 'glow_step': 2, 'outline_passes': 5,
+     'lightmap_scale': 2},
+    {'name': 'low', 'fog_count': 2, 'particle_cap': 100, 'glow_step': 3, 'outline_passes': 5,
+     'lightmap_scale': 4},
+    {'name': 'minimal', 'fog_count': 0, 'particle_cap': 40, 'glow_step': 4, 'outline_passes': 1,
+     'lightmap_scale': 8},
+]
+
+
+class QualityGovernor:
+    """Steps through QUALITY_TIERS based on a rolling window of frame work times.
+
+    Drops a tier when the window's 90th percentile exceeds the frame budget
+    and only climbs back when it falls well below it; the gap between the
+    two thresholds plus a cooldown after each change keeps the tier from
+    flickering.
+    """
+
+    def __init__(self, budget_ms=1000 / FPS, window=60, downgrade_ratio=1.0, upgrade_ratio=0.6,
+                 cooldown_windows=3):
+        self.budget_ms = budget_ms
+        self.window = window
+        self.downgrade_ratio = downgrade_ratio
+        self.upgrade_ratio = upgrade_ratio
+        self.cooldown_windows = cooldown_windows
+        self.adaptive = True
+        self.tier = 0
+        # Settings pinned by the config regardless of tier
+        self.overrides = {}
+        self.current = QUALITY_TIERS[0]
+        self.samples = []
+        self.cooldown = 0
+        self.history = []
+
+    @property
+    def settings(self):
+        return self.current
+
+    def refresh(self):
+        self.current = {**QUALITY_TIERS[self.tier], **self.overrides}
+
+    def set_tier(self, tier, reason=""):
+        tier = max(0, min(tier, len(QUALITY_TIERS) - 1))
+        if tier == self.tier:
+            return
+        self.history.append((time.perf_counter() - PROCESS_START, QUALITY_TIERS[self.tier]['name'],
+                             QUALITY_TIERS[tier]['name'], reason))
+        print(f"Quality: {QUALITY_TIERS[self.tier]['name']} -> {QUALITY_TIERS[tier]['name']} {reason}")
+        self.tier = tier
+        self.refresh()
+        self.cooldown = self.cooldown_windows
+
+    def record(self, frame_ms):
+        if not self.adaptive:
+            return
+        self.samples.append(frame_ms)
+        if len(self.samples) < self.window:
+            return
+        p90 = sorted(self.samples)[int(len(self.samples) * 0.9)]
+        self.samples.clear()
+        if self.cooldown > 0:
+            self.cooldown -= 1
+        elif p90 > self.budget_ms * self.downgrade_ratio:
+            self.set_tier(self.tier + 1, f"(p90 {p90:.1f}ms over {self.budget_ms:.1f}ms budget)")
+        elif p90 < self.budget_ms * self.upgrade_ratio:
+            self.set_tier(self.tier - 1, f"(p90 {p90:.1f}ms)")
+
+
+quality = QualityGovernor()
+
+
+class FramePacer:
+    """Waits out the rest of each frame using one of several strategies and measures the result.
+
+    sleep   clock.tick: cheap on CPU, but OS sleep granularity adds jitter
+    busy    clock.tick_busy_loop: spins for precise timing at the cost of a core
+    hybrid  sleeps until spin_margin before the deadline, then spins
+    vsync   lets flip() block on the display's refresh where the driver supports it
+    """
+
+    MODES = ('sleep', 'busy', 'hybrid', 'vsync')
+
+    def __init__(self, mode='sleep', fps=FPS, spin_margin=0.002, history=3600):
+        self.mode = mode
+        self.fps = fps
+        self.spin_margin = spin_margin
+        self.intervals = deque(maxlen=history)
+        self.last_present = None
+        self.deadline = None
+        # Late input: wait before sampling input instead of after presenting
+        self.late_input = False
+        self.frame_start = None
+        self.work_estimate = 0.0
+
+    @property
+    def frame_time(self):
+        return 1.0 / self.fps
+
+    def create_display(self, size):
+        if self.mode == 'vsync':
+            try:
+                return pygame.display.set_mode(size, pygame.SCALED, vsync=1)
+            except pygame.error as e:
+                print(f"Warning: vsync unavailable ({e}); falling back to hybrid pacing")
+                self.mode = 'hybrid'
+        return pygame.display.set_mode(size)
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def presented(self):
+        """Call right after pygame.display.flip()."""
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            # Peak-hold that decays slowly, so one quick frame doesn't make the late wait too aggressive
+            self.work_estimate = max(now - self.frame_start, self.work_estimate * 0.98)
+        if self.last_present is not None:
+            self.intervals.append(now - self.last_present)
+        self.last_present = now
+        # Some drivers accept vsync=1 without blocking; don't let the game run unbounded
+        if self.mode == 'vsync' and len(self.intervals) == 30:
+            if statistics.median(self.intervals) < self.frame_time * 0.5:
+                print("Warning: vsync is not limiting the frame rate; falling back to hybrid pacing")
+                self.mode = 'hybrid'
+
+    def wait(self, clock):
+        if self.mode == 'sleep':
+            clock.tick(self.fps)
+        elif self.mode == 'busy':
+            clock.tick_busy_loop(self.fps)
+        elif self.mode == 'hybrid':
+            now = time.perf_counter()
+            if self.deadline is None or now - self.deadline > self.frame_time:
+                # First frame, or too far behind to catch up: start a fresh schedule
+                self.deadline = now
+            self.deadline += self.frame_time
+            remaining = self.deadline - time.perf_counter()
+            if remaining > self.spin_margin:
+                time.sleep(remaining - self.spin_margin)
+            while time.perf_counter() < self.deadline:
+                pass
+
+    def wait_late(self, clock):
+        """Waits at the top of the frame so input is sampled as close to the present as possible.
+
+        With vsync, flip() already blocks until the refresh, so sleep through the
+        frame minus the expected work and sample input just in time for the next
+        refresh. The other modes already sleep between present and sampling, so
+        they simply move their wait here.
+        """
+        if self.mode != 'vsync':
+            self.wait(clock)
+            return
+        if self.last_present is None:
+            return
+        wake = self.last_present + self.frame_time - self.work_estimate - self.spin_margin
+        remaining = wake - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def stats(self):
+        if len(self.intervals) < 2:
+            return None
+        intervals_ms = sorted(interval * 1000 for interval in self.intervals)
+        target_ms = self.frame_time * 1000
+        return {
+            'mode': self.mode,
+            'frames': len(intervals_ms),
+            'mean_ms': statistics.fmean(intervals_ms),
+            'stdev_ms': statistics.stdev(intervals_ms),
+            'p50_ms': intervals_ms[len(intervals_ms) // 2],
+            'p99_ms': intervals_ms[min(len(intervals_ms) - 1, int(len(intervals_ms) * 0.99))],
+            'max_ms': intervals_ms[-1],
+            'mean_abs_error_ms': statistics.fmean(abs(interval - target_ms) for interval in intervals_ms),
+            'late_frames': sum(interval > target_ms * 1.5 for interval in intervals_ms),
+        }
+
+    def report(self):
+        stats = self.stats()
+        if stats is None:
+            print("Frame pacing: not enough frames")
+            return
+        print(f"Frame pacing ({stats['mode']}, {stats['frames']} frames, target {self.frame_time * 1000:.2f}ms):")
+        print(f"  mean {stats['mean_ms']:.2f}  stdev {stats['stdev_ms']:.2f}  p50 {stats['p50_ms']:.2f}  "
+              f"p99 {stats['p99_ms']:.2f}  max {stats['max_ms']:.2f}  "
+              f"mean |error| {stats['mean_abs_error_ms']:.2f}  late {stats['late_frames']}")
+
+
+pacer = FramePacer()
+
+
+TIER_SETTINGS = ('fog_count', 'particle_cap', 'glow_step', 'outline_passes', 'lightmap_scale')
+# name: (type, minimum, maximum, default, help); tier settings default to None, meaning the quality tier decides
+CONFIG_OPTIONS = {
+    'fps': (int, 30, 240, FPS, "frame rate cap; game speed is fixed by TICK_RATE"),
+    'quality': (str, None, None, 'adaptive', "adaptive, or a fixed tier: "
+                + ", ".join(tier['name'] for tier in QUALITY_TIERS)),
+    'fog_count': (int, 0, 16, None, "fog clouds in levels and the menu"),
+    'particle_cap': (int, 0, 5000, None, "live particles per emitter list"),
+    'glow_step': (int, 1, 8, None, "spacing between glow rings; higher draws fewer rings"),
+    'outline_passes': (int, 1, 9, None, "player outline passes: 9 full ring, 5 orthogonal, 1 none"),
+    'lightmap_scale': (int, 1, 16, None, "lightmap resolution divisor"),
+    'particle_scale': (float, 0.0, 4.0, 1.0, "multiplies particles spawned by jumps, landings, fireballs and boxes"),
+    'stars': (int, 0, 1000, 150, "stars in the ending sequence"),
+    'ambient_light': (int, 0, 255, 40, "brightness of unlit areas"),
+}
+CONFIG_PRESETS = {
+    'low': {'quality': 'low', 'particle_scale': 0.5, 'stars': 60},
+    'medium': {'quality': 'medium', 'particle_scale': 0.75, 'stars': 100},
+    'high': {'quality': 'adaptive', 'particle_scale': 1.0, 'stars': 150},
+    # The high tier pinned, so runs measure the same workload instead of wherever the governor settled
+    'benchmark': {'quality': 'high', 'particle_scale': 1.0, 'stars': 150},
+}
+
+
+class Config:
+    """The performance knobs in CONFIG_OPTIONS, set from a JSON file, presets, --set or the console.
+
+    Every change is validated against CONFIG_OPTIONS and pushed to the pacer
+    and quality governor straight away; everything else reads config[name]
+    when it needs the value.
+    """
+
+    def __init__(self):
+        self.values = {name: option[3] for name, option in CONFIG_OPTIONS.items()}
+        self.apply()
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def parse(self, name, value):
+        """Returns value converted and checked for name; raises ValueError explaining what is wrong."""
+        if name not in CONFIG_OPTIONS:
+            raise ValueError(f"unknown setting '{name}' (one of {', '.join(CONFIG_OPTIONS)})")
+        kind, minimum, maximum, default, _ = CONFIG_OPTIONS[name]
+        if isinstance(value, str):
+            value = value.strip()
+            if value.lower() in ('none', 'auto', 'tier') and default is None:
+                return None
+        if value is None:
+            if default is None:
+                return None
+            raise ValueError(f"{name} needs a value")
+        if name == 'quality':
+            names = ['adaptive'] + [tier['name'] for tier in QUALITY_TIERS]
+            if value not in names:
+                raise ValueError(f"quality must be one of {', '.join(names)}")
+            return value
+        try:
+            if kind is int and (isinstance(value, bool) or isinstance(value, float) and not value.is_integer()):
+                raise ValueError
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be {'a whole number' if kind is int else 'a number'}, not {value!r}")
+        if not minimum <= value <= maximum:
+            raise ValueError(f"{name} must be between {minimum} and {maximum}")
+        return value
+
+    def update(self, values):
+        """Sets several values at once; nothing changes unless all of them are valid."""
+        parsed = {name: self.parse(name, value) for name, value in values.items()}
+        self.values.update(parsed)
+        self.apply()
+
+    def set(self, name, value):
+        self.update({name: value})
+
+    def use_preset(self, name):
+        if name not in CONFIG_PRESETS:
+            raise ValueError(f"unknown preset '{name}' (one of {', '.join(CONFIG_PRESETS)})")
+        self.update(CONFIG_PRESETS[name])
+
+    def load(self, path):
+        """Reads a JSON object of settings, optionally naming a "preset" to start from."""
+        try:
+            with open(path) as f:
+                values = json.load(f)
+            if not isinstance(values, dict):
+                raise ValueError("expected a JSON object")
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load config {path}. {e}")
+            return False
+        preset = values.pop('preset', None)
+        try:
+            if preset is not None:
+                self.use_preset(preset)
+        except ValueError as e:
+            print(f"Warning: {path}: {e}")
+        # One bad entry shouldn't throw away the rest of the file
+        for name, value in values.items():
+            try:
+                self.set(name, value)
+            except ValueError as e:
+                print(f"Warning: {path}: {e}")
+        return True
+
+    def save(self, path):
+        changed = {name: value for name, value in self.values.items() if value != CONFIG_OPTIONS[name][3]}
+        with open(path, 'w') as f:
+            json.dump(changed, f, indent=4)
+
+    def apply(self):
+        pacer.fps = self['fps']
+        quality.budget_ms = 1000 / self['fps']
+        if self['quality'] == 'adaptive':
+            quality.adaptive = True
+        else:
+            quality.adaptive = False
+            quality.tier = [tier['name'] for tier in QUALITY_TIERS].index(self['quality'])
+        quality.overrides = {name: self[name] for name in TIER_SETTINGS if self[name] is not None}
+        quality.refresh()
+
+
+config = Config()
+
+
+def particle_count(count):
+    """A burst's particle count scaled by the particle_scale setting."""
+    return round(count * config['particle_scale'])
+
+
+class DebugConsole:
+    """A command line over the game for changing config live; the backquote key opens and closes it.
+
+    The game is paused while it is open, since movement keys would otherwise
+    reach the player.
+    """
+
+    HELP = ("set NAME VALUE | get NAME | list | preset NAME | reset | save [PATH] | load [PATH]  "
+            "(Esc or ` closes)")
+
+    def __init__(self):
+        self.open = False
+        self.text = ""
+        self.lines = deque([self.HELP], maxlen=10)
+        self.font = None
+
+    def toggle(self):
+        self.open = not self.open
+        if self.open:
+            # Holding backspace should keep deleting
+            pygame.key.set_repeat(400, 35)
+        else:
+            pygame.key.set_repeat(0)
+
+    def handle_event(self, event):
+        """Returns True when the event was for the console."""
+        if event.type != pygame.KEYDOWN:
+            return self.open and event.type in (pygame.KEYUP, pygame.MOUSEBUTTONDOWN, pygame.TEXTINPUT)
+        if event.key == pygame.K_BACKQUOTE or (self.open and event.key == pygame.K_ESCAPE):
+            self.toggle()
+            return True
+        if not self.open:
+            return False
+        if event.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+            self.lines.append("> " + self.text)
+            self.execute(self.text)
+            self.text = ""
+        elif event.key == pygame.K_BACKSPACE:
+            self.text = self.text[:-1]
+        elif event.unicode and event.unicode.isprintable():
+            self.text += event.unicode
+        return True
+
+    def execute(self, line):
+        words = line.split()
+        if not words:
+            return
+        command, arguments = words[0].lower(), words[1:]
+        try:
+            if command == 'set' and len(arguments) == 2:
+                config.set(*arguments)
+                self.lines.append(f"{arguments[0]} = {config[arguments[0]]}")
+            elif command == 'get' and len(arguments) == 1:
+                name = arguments[0]
+                if name not in CONFIG_OPTIONS:
+                    raise ValueError(f"unknown setting '{name}'")
+                self.lines.append(f"{name} = {config[name]}  ({CONFIG_OPTIONS[name][4]})")
+            elif command == 'list' and not arguments:
+                self.lines.append("  ".join(f"{name}={value}" for name, value in config.values.items()))
+                self.lines.append(f"tier in use: {quality.settings['name']}")
+            elif command == 'preset' and len(arguments) == 1:
+                config.use_preset(arguments[0])
+                self.lines.append(f"preset {arguments[0]} applied")
+            elif command == 'reset' and not arguments:
+                config.update({name: option[3] for name, option in CONFIG_OPTIONS.items()})
+                self.lines.append("defaults restored")
+            elif command == 'save' and len(arguments) <= 1:
+                path = arguments[0] if arguments else CONFIG_PATH
+                config.save(path)
+                self.lines.append(f"saved to {path}")
+            elif command == 'load' and len(arguments) <= 1:
+                path = arguments[0] if arguments else CONFIG_PATH
+                self.lines.append(f"loaded {path}" if config.load(path) else f"could not load {path}")
+            else:
+                self.lines.append(self.HELP)
+        except (ValueError, OSError) as e:
+            self.lines.append(f"error: {e}")
+
+    def draw(self, screen):
+        if self.font is None:
+            self.font = pygame.font.Font(None, 22)
+        line_height = self.font.get_linesize()
+        height = line_height * (len(self.lines) + 1) + 10
+        panel = surfaces.cached(('console_panel', height), (SCREEN_WIDTH, height), True,
+                                lambda surf: surf.fill((0, 0, 0, 190)))
+        surfaces.blit(screen, panel, (0, 0))
+        for row, line in enumerate(list(self.lines) + ["> " + self.text + "_"]):
+            color = WHITE if row == len(self.lines) else FOG_GRAY
+            screen.blit(self.font.render(line, True, color), (8, 5 + row * line_height))
+
+
+class InputLatencyTracker:
+    """Measures how long gameplay key presses take to reach the screen.
+
+    pygame events carry no OS timestamp, so a press is timed from when the
+    event was polled; real latency is higher by up to the time the event
+    waited in the queue.
+    """
+
+    GAMEPLAY_KEYS = {pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN, pygame.K_a, pygame.K_d,
+                     pygame.K_w, pygame.K_s, pygame.K_SPACE, pygame.K_f, pygame.K_LSHIFT, pygame.K_e}
+
+    def __init__(self, history=2000):
+        self.enabled = False
+        self.polled_presses = []
+        self.ticked_presses = []
+        self.samples = {name: deque(maxlen=history) for name in ('poll_to_tick', 'tick_to_present', 'poll_to_present')}
+
+    def polled(self, event):
+        if self.enabled and event.type == pygame.KEYDOWN and event.key in self.GAMEPLAY_KEYS:
+            self.polled_presses.append(time.perf_counter())
+
+    def ticked(self):
+        """Call when a simulation tick that reads input starts."""
+        if self.polled_presses:
+            now = time.perf_counter()
+            self.ticked_presses.extend((polled, now) for polled in self.polled_presses)
+            self.polled_presses.clear()
+
+    def presented(self):
+        if self.ticked_presses:
+            now = time.perf_counter()
+            for polled, ticked in self.ticked_presses:
+                self.samples['poll_to_tick'].append((ticked - polled) * 1000)
+                self.samples['tick_to_present'].append((now - ticked) * 1000)
+                self.samples['poll_to_present'].append((now - polled) * 1000)
+            self.ticked_presses.clear()
+
+    def report(self):
+        print(f"Input latency ({len(self.samples['poll_to_present'])} key presses, ms):")
+        for name, values in self.samples.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            print(f"  {name:<16} p50 {ordered[len(ordered) // 2]:6.2f}  "
+                  f"p95 {ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]:6.2f}  max {ordered[-1]:6.2f}")
+
+
+input_latency = InputLatencyTracker()
+
+
+class Job:
+    """A generator run a step at a time by the JobScheduler; each yield ends one step.
+
+    Yielding a time.perf_counter() value instead of None puts the job to
+    sleep until then, so waiting on the clock costs nothing in between.
+    """
+
+    def __init__(self, steps, priority, name):
+        self.steps = steps
+        self.priority = priority
+        self.name = name
+        self.done = False
+        self.cancelled = False
+        self.wake_at = 0.0
+
+    def step(self):
+        try:
+            wake_at = next(self.steps)
+        except StopIteration:
+            self.done = True
+            return
+        self.wake_at = wake_at or 0.0
+
+    def finish(self):
+        """Runs the remaining steps right now, sleeps included, for when the result is needed this frame."""
+        while not (self.done or self.cancelled):
+            self.step()
+
+    def cancel(self):
+        if not self.done:
+            self.cancelled = True
+            self.steps.close()
+
+
+class JobScheduler:
+    """Runs generator jobs cooperatively in whatever is left of each frame's budget.
+
+    Lower priority numbers run first; jobs of equal priority run in submission
+    order, and sleeping jobs are passed over until they wake. One step is
+    always run per frame when a job is ready, so a job still makes progress
+    when every frame is over budget.
+    """
+
+    TRANSITION = 0
+    MUSIC = 1
+    BAKE = 2
+
+    def __init__(self):
+        self.queue = []
+        self.sequence = 0
+
+    def submit(self, steps, priority, name=""):
+        job = Job(steps, priority, name)
+        heapq.heappush(self.queue, (priority, self.sequence, job))
+        self.sequence += 1
+        return job
+
+    def pending(self):
+        return any(not (job.done or job.cancelled) for _, _, job in self.queue)
+
+    def ready_job(self, now):
+        """The first job in priority order that is not asleep; finished jobs are dropped on the way."""
+        while self.queue and (self.queue[0][2].done or self.queue[0][2].cancelled):
+            heapq.heappop(self.queue)
+        ready = [entry for entry in self.queue
+                 if not (entry[2].done or entry[2].cancelled) and entry[2].wake_at <= now]
+        return min(ready)[2] if ready else None
+
+    def run(self, deadline, min_steps=1):
+        steps = 0
+        while True:
+            now = time.perf_counter()
+            if steps >= min_steps and now >= deadline:
+                break
+            job = self.ready_job(now)
+            if job is None:
+                break
+            job.step()
+            steps += 1
+
+    def clear(self):
+        for _, _, job in self.queue:
+            job.cancel()
+        self.queue.clear()
+
+
+jobs = JobScheduler()
+
+
+class GCScheduler:
+    """Keeps the cyclic garbage collector out of gameplay frames and times every pause.
+
+    auto        Python's default automatic collection
+    thresholds  automatic collection with a much larger first-generation threshold while playing
+    manual      no automatic collection while playing; a young-generation sweep every
+                young_interval frames keeps garbage bounded, and full collections
+                run when play stops (transitions, menus, the ending)
+    """
+
+    MODES = ('auto', 'thresholds', 'manual')
+
+    def __init__(self, mode='manual', young_interval=120, playing_threshold=50000, history=2000):
+        self.mode = mode
+        self.young_interval = young_interval
+        self.playing_threshold = playing_threshold
+        self.default_thresholds = gc.get_threshold()
+        self.playing = False
+        self.frames_playing = 0
+        self.collect_pending = False
+        self.started = None
+        self.pauses = deque(maxlen=history)
+        self.report_enabled = False
+        gc.callbacks.append(self.on_collect)
+
+    def on_collect(self, phase, info):
+        if phase == 'start':
+            self.started = time.perf_counter()
+        elif self.started is not None:
+            self.pauses.append((info['generation'], self.playing, (time.perf_counter() - self.started) * 1000))
+            self.started = None
+
+    def freeze(self):
+        """Moves everything alive now (level data, fonts, cached sprites) out of future collections."""
+        gc.collect()
+        gc.freeze()
+
+    def frame(self, playing):
+        """Call once per frame with whether gameplay is running."""
+        if self.mode == 'auto':
+            return
+        if playing != self.playing:
+            self.playing = playing
+            self.frames_playing = 0
+            if playing:
+                if self.mode == 'manual':
+                    gc.disable()
+                else:
+                    gc.set_threshold(self.playing_threshold, *self.default_thresholds[1:])
+            else:
+                gc.set_threshold(*self.default_thresholds)
+                gc.enable()
+                self.collect_pending = True
+        if playing:
+            self.frames_playing += 1
+            if self.mode == 'manual' and self.frames_playing % self.young_interval == 0:
+                gc.collect(0)
+        elif self.collect_pending:
+            self.collect_pending = False
+            gc.collect()
+
+    def report(self):
+        print(f"GC pauses ({self.mode}, {gc.get_freeze_count()} objects frozen, ms):")
+        if not self.pauses:
+            print("  none")
+            return
+        for generation in range(3):
+            for playing in (True, False):
+                times = sorted(ms for gen, was_playing, ms in self.pauses if gen == generation and was_playing == playing)
+                if times:
+                    print(f"  gen {generation} {'playing' if playing else 'idle':<8} {len(times):5d} pauses  "
+                          f"p50 {times[len(times) // 2]:6.3f}  max {times[-1]:6.3f}")
+
+
+gc_control = GCScheduler()
+
+
+class FrameCapture:
+    """Records presented frames to disk on a worker thread without ever blocking the game loop.
+
+    raw  one stream per clip in the display's own pixel layout, plus capture.json and
+         frames.csv; play it back with ffmpeg -f rawvideo -pixel_format FORMAT
+         -video_size WxH -framerate FPS -i capture.raw, filled in from capture.json
+    png  one PNG per frame, much slower to encode
+
+    Each frame is copied once out of the display surface's pixel buffer into a fixed pool
+    of buffers; the display is redrawn next frame so it cannot be handed over as is. When
+    every buffer is still waiting on the encoder the frame is dropped and the capture stride
+    doubles, so a clip that falls behind stays evenly spaced at a lower rate instead of
+    stuttering. The stride halves again once the encoder keeps up.
+    """
+
+    FORMATS = ('raw', 'png')
+
+    @staticmethod
+    def pixel_format(bytesize, masks):
+        """The ffmpeg name for a 24- or 32-bit layout, e.g. bgr0, or None for one it cannot name."""
+        if bytesize not in (3, 4):
+            return None
+        channels = ''
+        for i in range(bytesize):
+            # Surfaces are little-endian in memory, so byte i holds the channel masked by 0xff << 8i
+            channel = [name for name, mask in zip('rgba', masks) if mask == 0xff << 8 * i]
+            channels += channel[0] if channel else '0'
+        if bytesize == 3:
+            return channels + '24' if '0' not in channels else None
+        return channels if channels.count('0') <= 1 else None
+
+    def __init__(self, directory=CAPTURE_DIR, format='raw', queue_size=CAPTURE_QUEUE, max_stride=8):
+        self.directory = directory
+        self.format = format
+        self.queue_size = queue_size
+        self.max_stride = max_stride
+        self.active = False
+        self.pending = None
+        self.free = None
+        self.clip = None
+
+    def toggle(self, screen):
+        if self.active:
+            self.stop()
+        else:
+            self.start(screen)
+
+    def start(self, screen):
+        self.bytesize = screen.get_bytesize()
+        self.masks = screen.get_masks()
+        pixel_format = self.pixel_format(self.bytesize, self.masks)
+        if pixel_format is None:
+            print(f"Warning: Could not capture a {self.bytesize * 8}-bit display.")
+            return
+        self.clip = os.path.join(self.directory, time.strftime("%Y%m%d-%H%M%S"))
+        try:
+            os.makedirs(self.clip, exist_ok=True)
+        except OSError as e:
+            print(f"Warning: Could not create capture directory. {e}")
+            return
+        self.size = screen.get_size()
+        self.pitch = screen.get_pitch()
+        self.frame_bytes = self.pitch * self.size[1]
+        self.free = [bytearray(self.frame_bytes) for _ in range(self.queue_size)]
+        self.pending = queue.Queue()
+        self.frame_index = 0
+        self.stride = 1
+        self.calm_frames = 0
+        self.captured = 0
+        self.dropped = 0
+        self.active = True
+        layout = (self.format, self.size, self.pitch, self.bytesize, self.masks, pixel_format)
+        threading.Thread(target=self.run, args=(self.clip, self.pending, self.free, layout), daemon=True).start()
+        print(f"Capturing {self.format} frames to {self.clip}")
+
+    def frame(self, screen):
+        """Call right after pygame.display.flip()."""
+        if not self.active:
+            return
+        self.frame_index += 1
+        if self.frame_index % self.stride:
+            return
+        if not self.free:
+            self.dropped += 1
+            self.calm_frames = 0
+            self.stride = min(self.stride * 2, self.max_stride)
+            return
+        buffer = self.free.pop()
+        pixels = screen.get_buffer()
+        buffer[:] = pixels
+        del pixels  # Unlocks the display surface
+        self.pending.put((self.frame_index, time.perf_counter(), buffer))
+        self.captured += 1
+        # Most of the pool free again for a couple of seconds: try a finer stride
+        if len(self.free) >= self.queue_size // 2:
+            self.calm_frames += 1
+            if self.stride > 1 and self.calm_frames >= 2 * FPS // self.stride:
+                self.stride //= 2
+                self.calm_frames = 0
+        else:
+            self.calm_frames = 0
+
+    def stop(self, wait=False):
+        if not self.active:
+            return
+        self.active = False
+        self.pending.put(None)
+        print(f"Capture stopped: {self.captured} frames queued, {self.dropped} dropped, "
+              f"final stride {self.stride}")
+        if wait:
+            self.pending.join()
+
+    def run(self, clip, pending, free, layout):
+        # Everything a clip needs is passed in, so a new clip can start while this one drains
+        format, size, pitch, bytesize, masks, pixel_format = layout
+        raw_file = index_file = frame = None
+        # A 24-bit row can end in padding that is not a whole pixel; raw clips leave it out
+        row_bytes = pitch - pitch % bytesize
+        try:
+            if format == 'png':
+                frame = pygame.Surface(size, 0, bytesize * 8, masks)
+            index_file = open(os.path.join(clip, "frames.csv"), 'w')
+            index_file.write("frame,time\n")
+            if format == 'raw':
+                raw_file = open(os.path.join(clip, "capture.raw"), 'wb')
+                with open(os.path.join(clip, "capture.json"), 'w') as f:
+                    json.dump({'pixel_format': pixel_format, 'width': row_bytes // bytesize, 'height': size[1],
+                               'visible_width': size[0], 'masks': masks, 'fps': pacer.fps}, f)
+        except (OSError, ValueError, pygame.error) as e:
+            print(f"Warning: Could not write capture, dropping this clip. {e}")
+            raw_file = index_file = None
+        written = 0
+        while True:
+            item = pending.get()
+            if item is None:
+                pending.task_done()
+                break
+            index, timestamp, buffer = item
+            try:
+                if index_file is not None:
+                    if raw_file is not None and row_bytes == pitch:
+                        raw_file.write(buffer)
+                    elif raw_file is not None:
+                        rows = memoryview(buffer)
+                        for y in range(size[1]):
+                            raw_file.write(rows[y * pitch:y * pitch + row_bytes])
+                    else:
+                        pixels = frame.get_buffer()
+                        memoryview(pixels)[:] = buffer
+                        del pixels
+                        pygame.image.save(frame, os.path.join(clip, f"frame_{written:06d}.png"))
+                    index_file.write(f"{index},{timestamp:.6f}\n")
+                    written += 1
+            except (OSError, ValueError, pygame.error) as e:
+                # ValueError: the PNG surface's pitch did not match the display's
+                print(f"Warning: Could not write capture, dropping this clip. {e}")
+                index_file = raw_file = None
+            finally:
+                # stop(wait=True) joins the queue, so every item is marked done whatever happened
+                free.append(buffer)
+                pending.task_done()
+        for f in (raw_file, index_file):
+            if f is not None:
+                f.close()
+
+
+capture = FrameCapture()
+
+
+# Telemetry record kinds: (name, struct layout after the one-byte kind, field names)
+TELEMETRY_RECORDS = {
+    0: ('session', '<d12s', ('started', 'build')),
+    1: ('frame', '<fbBHH', ('ms', 'level', 'state', 'particles', 'fireballs')),
+    2: ('dwell', '<bf', ('level', 'seconds')),
+    3: ('transition', '<bbf', ('from_level', 'to_level', 'ms')),
+    4: ('start_level', '<bf', ('level', 'ms')),
+    5: ('asset', '<16sf', ('name', 'ms')),
+    6: ('frame_rate', '<H', ('fps',)),
+}
+TELEMETRY_KINDS = {name: (kind, struct.Struct(layout)) for kind, (name, layout, fields) in TELEMETRY_RECORDS.items()}
+
+
+class Telemetry:
+    """Appends compact binary records about the session to a rotating log under TELEMETRY_DIR.
+
+    Records are packed into a memory buffer (a frame record is 11 bytes) and handed to a
+    writer thread about once a second; the live file is telemetry.bin and older ones are
+    shifted to telemetry.1.bin, telemetry.2.bin and so on. Read them back with
+    --analyze-telemetry.
+    """
+
+    def __init__(self, directory=TELEMETRY_DIR, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.enabled = False
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+        self.pending = None
+        self.last_flush = 0.0
+        self.level = -1
+        self.level_entered = 0.0
+        self.fps = None
+
+    def start(self, build=None):
+        if build is None:
+            # Sessions are compared per build; the source hash tells builds apart
+            with open(os.path.abspath(__file__), 'rb') as f:
+                build = hashlib.sha1(f.read()).hexdigest()[:12]
+        self.enabled = True
+        self.last_flush = time.perf_counter()
+        self.fps = None
+        self.record('session', time.time(), build.encode()[:12])
+
+    def record(self, name, *values):
+        if not self.enabled:
+            return
+        kind, layout = TELEMETRY_KINDS[name]
+        with self.lock:
+            self.buffer.append(kind)
+            self.buffer += layout.pack(*values)
+
+    def frame(self, ms, level, state, particles, fireballs):
+        if not self.enabled:
+            return
+        # Frames are judged against the frame rate cap in effect when they ran, which the console can change
+        if pacer.fps != self.fps:
+            self.fps = pacer.fps
+            self.record('frame_rate', self.fps)
+        self.record('frame', ms, level, state, min(particles, 0xFFFF), min(fireballs, 0xFFFF))
+        now = time.perf_counter()
+        if now - self.last_flush >= self.flush_interval:
+            self.last_flush = now
+            self.flush()
+
+    def enter_level(self, level):
+        """Records how long the previous level was played; -1 means no level (menu, ending)."""
+        now = time.perf_counter()
+        if self.level >= 0:
+            self.record('dwell', self.level, now - self.level_entered)
+        self.level = level
+        self.level_entered = now
+
+    def assets(self, loader):
+        for name, sound in loader.sounds.items():
+            if sound.load_ms is not None:
+                self.record('asset', name.encode()[:16], sound.load_ms)
+        for name, task_ms in loader.task_ms.items():
+            self.record('asset', name.encode()[:16], task_ms)
+
+    def flush(self):
+        with self.lock:
+            data, self.buffer = self.buffer, bytearray()
+        if not data:
+            return
+        if self.pending is None:
+            self.pending = queue.Queue()
+            threading.Thread(target=self.run, daemon=True).start()
+        self.pending.put(bytes(data))
+
+    def close(self):
+        if not self.enabled:
+            return
+        self.enter_level(-1)
+        self.flush()
+        if self.pending is not None:
+            self.pending.join()
+        self.enabled = False
+
+    def path(self, generation):
+        suffix = f".{generation}" if generation else ""
+        return os.path.join(self.directory, f"telemetry{suffix}.bin")
+
+    def rotate(self):
+        for generation in range(TELEMETRY_FILES - 1, 0, -1):
+            if os.path.exists(self.path(generation - 1)):
+                os.replace(self.path(generation - 1), self.path(generation))
+
+    def run(self):
+        while True:
+            data = self.pending.get()
+            if self.enabled:
+                try:
+                    os.makedirs(self.directory, exist_ok=True)
+                    try:
+                        if os.path.getsize(self.path(0)) + len(data) > TELEMETRY_FILE_BYTES:
+                            self.rotate()
+                    except OSError:
+                        pass  # No live file yet
+                    with open(self.path(0), 'ab') as f:
+                        f.write(data)
+                except OSError as e:
+                    print(f"Warning: Could not write telemetry, disabling it. {e}")
+                    self.enabled = False
+            self.pending.task_done()
+
+
+telemetry = Telemetry()
+
+
+def sync_fog(store):
+    """Grows or trims a store's fog to the current tier's fog count."""
+    target = quality.settings['fog_count']
+    fog = store.tables['fog']
+    while len(fog) > target:
+        store.kill(fog.entities[len(fog) - 1])
+    while len(fog) < target:
+        store.spawn_fog(random.randint(-200, SCREEN_WIDTH), random.randint(0, SCREEN_HEIGHT))
+
 
 class GameState(Enum):
     MENU = 1
@@ -66,168 +1736,412 @@ class TransitionState:
         self.target_level = 0
         self.start_level = 0
         self.direction = 1
+        self.started = 0.0
+
+
+def paint_fog(fog_surf, size, opacity, glow_step):
+    for i in range(size, 0, -5 * glow_step):
+        alpha = int(opacity * (i / size))
+        pygame.draw.circle(fog_surf, (*FOG_COLOR, alpha), (size, size), i)
+
+
+def paint_dust(particle_surf, size, alpha):
+    pygame.draw.circle(particle_surf, (*LIGHT_GRAY, alpha), (size, size), size)
+
+
+def paint_fireball_glow(glow_surf):
+    # White glowing orb
+    for i in range(3, 0, -2):
+        alpha = int(150 * (i / 16))
+        pygame.draw.circle(glow_surf, (*WHITE, alpha), (16, 16), i)
+
+
+def pixel_round(value):
+    """Rounds half away from zero, the way pygame.Rect stores a float coordinate."""
+    return math.copysign(math.floor(abs(value) + 0.5), value)
+
+
+class ComponentTable:
+    """Dense, array-backed storage for every entity of one kind.
+
+    Each field of each component is a column in a typed array, and all the
+    columns share one slot per entity, so a system reads an entity's
+    transform, velocity and lifetime at the same index without looking
+    anything up. Rows added with add() can be removed, which swaps the last
+    row into the hole; rows placed with append() stay at their slot.
+    """
+
+    __slots__ = ('columns', 'size', 'entities', 'slot_of')
+
+    def __init__(self, components):
+        self.columns = {name: {field: array(typecode) for field in fields}
+                        for name, (typecode, fields) in components.items()}
+        self.size = 0
+        self.entities = array('q')
+        self.slot_of = {}
+
+    def __len__(self):
+        return self.size
+
+    def append(self, values):
+        for name, columns in self.columns.items():
+            for column, value in zip(columns.values(), values[name]):
+                column.append(value)
+        self.size += 1
+        return self.size - 1
+
+    def add(self, entity, values):
+        self.slot_of[entity] = self.size
+        self.entities.append(entity)
+        self.append(values)
+
+    def remove(self, entity):
+        slot = self.slot_of.pop(entity)
+        last = self.size - 1
+        if slot != last:
+            moved = self.entities[last]
+            self.entities[slot] = moved
+            self.slot_of[moved] = slot
+        self.entities.pop()
+        for columns in self.columns.values():
+            for column in columns.values():
+                column[slot] = column[last]
+                column.pop()
+        self.size -= 1
+
+    def reorder(self, order):
+        """Moves the row at slot order[i] to slot i; only for tables whose rows were placed with append()."""
+        for columns in self.columns.values():
+            for field, column in columns.items():
+                columns[field] = array(column.typecode, [column[slot] for slot in order])
+
+    def clear(self):
+        del self.entities[:]
+        self.slot_of.clear()
+        for columns in self.columns.values():
+            for column in columns.values():
+                del column[:]
+        self.size = 0
+
+    def get(self, slot, component, field):
+        return self.columns[component][field][slot]
+
+    def set(self, slot, component, field, value):
+        self.columns[component][field][slot] = value
+
+
+class EntityStore:
+    """Entity-component store for everything that changes from tick to tick.
+
+    Each kind of entity gets one ComponentTable with the components that
+    kind has, and systems walk a table's columns by slot. Short-lived
+    entities (dust, fog, fireballs) are ints with their kind in the low
+    KIND_BITS. Door, BreakableBox, NPC and Light are never removed, so they
+    keep their slot instead, along with their fixed rect and text. Levels,
+    the player and the menu each own a store.
+    """
+
+    COMPONENTS = {
+        'transform': ('d', ('x', 'y')),
+        'velocity': ('d', ('vx', 'vy', 'ay')),
+        'lifetime': ('d', ('life', 'decay')),
+        'sprite': ('d', ('size', 'opacity')),
+        'collider': ('d', ('width', 'height')),
+        'animator': ('d', ('phase', 'speed')),
+        'emitter': ('d', ('x', 'y', 'spread', 'height', 'rate', 'active')),
+        'speaker': ('d', ('timer', 'cooldown', 'gesture', 'arm')),
+        'breakable': ('b', ('broken', 'has_key', 'key_collected')),
+    }
+
+    KINDS = {
+        'dust': ('transform', 'velocity', 'lifetime', 'sprite'),
+        'fog': ('transform', 'velocity', 'sprite', 'animator'),
+        'fireball': ('transform', 'velocity', 'lifetime', 'collider'),
+        'box': ('breakable', 'animator'),
+        'npc': ('speaker', 'animator'),
+        'door': ('emitter', 'animator'),
+        'light': ('animator',),
+    }
+    KIND_BITS = 3
 
-
-class FogParticle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.size = random.randint(50, 150)
-        self.speed = random.uniform(0.2, 0.5)
-        self.opacity = random.randint(20, 60)
-        self.phase = random.uniform(0, math.pi * 2)
-
-    def update(self):
-        self.x += self.speed
-        self.phase += 0.01
-        self.y += math.sin(self.phase) * 0.3
-
-        if self.x > SCREEN_WIDTH + self.size:
-            self.x = -self.size
-            self.y = random.randint(0, SCREEN_HEIGHT)
-
-    def draw(self, surface):
-        fog_surf = pygame.Surface((self.size * 2, self.size * 2), pygame.SRCALPHA)
-        for i in range(self.size, 0, -5):
-            alpha = int(self.opacity * (i / self.size))
-            color = (*FOG_COLOR, alpha)
-            pygame.draw.circle(fog_surf, color, (self.size, self.size), i)
-        surface.blit(fog_surf, (self.x - self.size, self.y - self.size))
-
-
-class DustParticle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.vx = random.uniform(-0.5, 0.5)
-        self.vy = random.uniform(-1, -0.5)
-        self.life = 1.0
-        self.size = random.randint(2, 4)
-
-    def update(self):
-        self.x += self.vx
-        self.y += self.vy
-        self.life -= 0.02
-        self.vy += 0.02
-
-    def draw(self, surface):
-        if self.life > 0:
-            alpha = int(100 * self.life)
-            particle_surf = pygame.Surface((self.size * 2, self.size * 2), pygame.SRCALPHA)
-            color = (*LIGHT_GRAY, alpha)
-            pygame.draw.circle(particle_surf, color, (self.size, self.size), self.size)
-            surface.blit(particle_surf, (self.x - self.size, self.y - self.size))
-
-
-class Fireball:
-    def __init__(self, x, y, target_x, target_y):
-        self.rect = pygame.Rect(x, y, 16, 16)
-        dx = target_x - x
-        dy = target_y - y
-        distance = math.sqrt(dx * dx + dy * dy)
-        if distance > 0:
-            self.vel_x = (dx / distance) * 12
-            self.vel_y = (dy / distance) * 12
+    def __init__(self):
+        self.next_serial = 0
+        self.tables = {kind: ComponentTable({name: self.COMPONENTS[name] for name in components})
+                       for kind, components in self.KINDS.items()}
+        # Tables by kind number, the low bits of an entity
+        self.by_number = list(self.tables.values())
+        self.numbers = {kind: number for number, kind in enumerate(self.tables)}
+
+    def table_of(self, entity):
+        return self.by_number[entity & ((1 << self.KIND_BITS) - 1)]
+
+    def spawn(self, kind, **components):
+        entity = self.next_serial << self.KIND_BITS | self.numbers[kind]
+        self.next_serial += 1
+        self.tables[kind].add(entity, components)
+        return entity
+
+    def place(self, kind, **components):
+        """Adds a row that is never removed and returns its slot."""
+        return self.tables[kind].append(components)
+
+    def kill(self, entity):
+        self.table_of(entity).remove(entity)
+
+    def clear(self, kind):
+        self.tables[kind].clear()
+
+    def count(self, kind=None):
+        if kind is None:
+            return sum(len(table) for table in self.by_number)
+        return len(self.tables[kind])
+
+    def query(self, *components, without=()):
+        """Yields the non-empty table of every kind with all of components and none of without."""
+        for table in self.tables.values():
+            if (table.size and all(name in table.columns for name in components)
+                    and not any(name in table.columns for name in without)):
+                yield table
+
+    def spawn_dust(self, x, y, vx=None, vy=None, ay=0.02):
+        if len(self.tables['dust']) >= quality.settings['particle_cap']:
+            return None
+        if vx is None:
+            vx = random.uniform(-0.5, 0.5)
+        if vy is None:
+            vy = random.uniform(-1, -0.5)
+        return self.spawn('dust', transform=(x, y), velocity=(vx, vy, ay), lifetime=(1.0, 0.02),
+                          sprite=(random.randint(2, 4), 100))
+
+    def burst(self, x, y, count, min_speed=2, max_speed=5, lift=0):
+        for _ in range(count):
+            angle = random.uniform(0, math.pi * 2)
+            speed = random.uniform(min_speed, max_speed)
+            self.spawn_dust(x, y, math.cos(angle) * speed, math.sin(angle) * speed - lift)
+
+    def spawn_fog(self, x, y):
+        return self.spawn('fog', transform=(x, y), velocity=(random.uniform(0.2, 0.5), 0, 0),
+                          sprite=(random.randint(50, 150), random.randint(20, 60)),
+                          animator=(random.uniform(0, math.pi * 2), 0.01))
+
+    def spawn_fireball(self, x, y, vel_x, vel_y, life=60):
+        return self.spawn('fireball', transform=(x, y), velocity=(vel_x, vel_y, 0), lifetime=(life, 1),
+                          collider=(16, 16))
+
+
+def cast_fireball(store, x, y, target_x, target_y):
+    """Launches a fireball from (x, y) toward the target."""
+    dx = target_x - x
+    dy = target_y - y
+    distance = math.sqrt(dx * dx + dy * dy)
+    if distance > 0:
+        vel_x = (dx / distance) * 12
+        vel_y = (dy / distance) * 12
+    else:
+        vel_x = 12
+        vel_y = 0
+    fireball_sound.play()
+    fireball_sound.set_volume(0.3)
+    return store.spawn_fireball(x, y, vel_x, vel_y)
+
+
+def emitter_system(store):
+    for table in store.query('emitter'):
+        x, y, spread, height, rate, active = table.columns['emitter'].values()
+        for slot in range(len(table)):
+            if active[slot] and random.random() < rate[slot]:
+                reach = int(spread[slot])
+                store.spawn_dust(x[slot] + random.randint(-reach, reach),
+                                 y[slot] + random.randint(0, int(height[slot])),
+                                 vy=random.uniform(-1, -0.5) - 0.5, ay=-0.08)
+
+
+def motion_system(store):
+    """Moves everything with a velocity; fireballs move themselves in fireball_system."""
+    for table in store.query('transform', 'velocity', without=('collider',)):
+        x, y = table.columns['transform'].values()
+        vx, vy, ay = table.columns['velocity'].values()
+        for slot in range(len(table)):
+            x[slot] += vx[slot]
+            y[slot] += vy[slot]
+            vy[slot] += ay[slot]
+
+
+def lifetime_system(store):
+    for table in store.query('lifetime', without=('collider',)):
+        life, decay = table.columns['lifetime'].values()
+        expired = []
+        for slot in range(len(table)):
+            life[slot] -= decay[slot]
+            if life[slot] <= 0:
+                expired.append(table.entities[slot])
+        for entity in expired:
+            store.kill(entity)
+
+
+def animator_system(store, kind=None, start=0, stop=None):
+    """Advances every bob, pulse, flicker and sway by its speed, or only kind's between start and stop."""
+    for table in store.query('animator') if kind is None else (store.tables[kind],):
+        phase, speed = table.columns['animator'].values()
+        for slot in range(start, len(table) if stop is None else stop):
+            phase[slot] += speed[slot]
+
+
+def fog_system(store):
+    """Sways fog as it drifts, wrapping it back to the left edge at a new height."""
+    fog = store.tables['fog']
+    x, y = fog.columns['transform'].values()
+    size = fog.columns['sprite']['size']
+    phase = fog.columns['animator']['phase']
+    for slot in range(len(fog)):
+        y[slot] += math.sin(phase[slot]) * 0.3
+        if x[slot] > SCREEN_WIDTH + size[slot]:
+            x[slot] = -size[slot]
+            y[slot] = random.randint(0, SCREEN_HEIGHT)
+
+
+def speaker_system(store, start=0, stop=None):
+    """Counts down NPC dialogue and cooldowns, gesturing while they talk."""
+    npcs = store.tables['npc']
+    timer, cooldown, gesture, arm = npcs.columns['speaker'].values()
+    for slot in range(start, len(npcs) if stop is None else stop):
+        if cooldown[slot] > 0:
+            cooldown[slot] -= 1
+        if timer[slot] > 0:
+            timer[slot] -= 1
+            gesture[slot] += 0.15
+            arm[slot] = math.sin(gesture[slot]) * 20
         else:
-            self.vel_x = 12
-            self.vel_y = 0
-        self.particles = []
-        self.alive = True
-        self.life = 60
-        fireball_sound.play()
-        fireball_sound.set_volume(0.3)
-
-    def update(self, platforms, breakable_boxes):
-        for particle in self.particles:
-            particle.update()
-        self.particles = [p for p in self.particles if p.life > 0]
-
-        if not self.alive:
-            return
+            arm[slot] *= 0.9  # Smooth return to rest
+
+
+def fireball_system(store, platforms, breakable_boxes, bounds=None):
+    """Moves fireballs, exploding them on the first solid platform or unbroken box they hit."""
+    fireballs = store.tables['fireball']
+    if not fireballs.entities:
+        return
+    if bounds is None:
+        bounds = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    x, y = fireballs.columns['transform'].values()
+    vel_x, vel_y, _ = fireballs.columns['velocity'].values()
+    life = fireballs.columns['lifetime']['life']
+    width, height = fireballs.columns['collider'].values()
+    hitbox = pygame.Rect(0, 0, 0, 0)
+    spent = []
+    for slot in range(len(fireballs)):
+        life[slot] -= 1
+        if life[slot] <= 0:
+            spent.append(fireballs.entities[slot])
+            continue
+
+        x[slot] = pixel_round(x[slot] + vel_x[slot])
+        y[slot] = pixel_round(y[slot] + vel_y[slot])
+        hitbox.update(x[slot], y[slot], width[slot], height[slot])
+
+        exploded = any(platform.get('solid', True) and hitbox.colliderect(platform['rect'])
+                       for platform in platforms)
+        if not exploded:
+            for box in breakable_boxes:
+                if hitbox.colliderect(box.rect) and not box.broken:
+                    box.break_box()
+                    exploded = True
+                    break
+        if exploded:
+            spent.append(fireballs.entities[slot])
+            store.burst(hitbox.centerx, hitbox.centery, particle_count(4))
+            continue
 
-        self.life -= 1
-        if self.life <= 0:
-            self.alive = False
-            return
+        if random.random() < 0.8:
+            store.spawn_dust(hitbox.centerx + random.randint(-3, 3), hitbox.centery + random.randint(-3, 3))
+
+        if (hitbox.x < bounds.left - 50 or hitbox.x > bounds.right + 50 or
+                hitbox.y < bounds.top - 50 or hitbox.y > bounds.bottom + 50):
+            spent.append(fireballs.entities[slot])
+    for entity in spent:
+        store.kill(entity)
+
+
+def fog_draw_system(store, surface):
+    fog = store.tables['fog']
+    x, y = fog.columns['transform'].values()
+    sizes, opacities = fog.columns['sprite'].values()
+    glow_step = quality.settings['glow_step']
+    for slot in range(len(fog)):
+        size = int(sizes[slot])
+        opacity = int(opacities[slot])
+        fog_surf = surfaces.cached(('fog', size, opacity, glow_step), (size * 2, size * 2), True, paint_fog,
+                                   args=(size, opacity, glow_step))
+        surfaces.blit(surface, fog_surf, (x[slot] - size, y[slot] - size))
+
+
+def particle_draw_system(store, surface, offset=(0, 0)):
+    dx, dy = offset
+    # Sprites looked up this frame; most particles share one with another particle
+    sprites = {}
+    for table in store.query('transform', 'lifetime', 'sprite'):
+        x, y = table.columns['transform'].values()
+        life = table.columns['lifetime']['life']
+        sizes, opacities = table.columns['sprite'].values()
+        for slot in range(len(table)):
+            if life[slot] <= 0:
+                continue
+            size = int(sizes[slot])
+            # Alpha is quantized so the sprite cache stays small
+            alpha = int(opacities[slot] * life[slot]) // 5 * 5
+            particle_surf = sprites.get((size, alpha))
+            if particle_surf is None:
+                particle_surf = sprites[size, alpha] = surfaces.cached(
+                    ('dust', size, alpha), (size * 2, size * 2), True, paint_dust, args=(size, alpha))
+            surfaces.blit(surface, particle_surf, (x[slot] - size + dx, y[slot] - size + dy))
+
+
+def fireball_draw_system(store, surface, offset=(0, 0)):
+    fireballs = store.tables['fireball']
+    if not fireballs.entities:
+        return
+    dx, dy = offset
+    x, y = fireballs.columns['transform'].values()
+    glow_surf = surfaces.cached('fireball_glow', (32, 32), True, paint_fireball_glow, baked=True)
+    for slot in range(len(fireballs)):
+        surfaces.blit(surface, glow_surf, (x[slot] - 8 + dx, y[slot] - 8 + dy))
 
-        self.rect.x += self.vel_x
-        self.rect.y += self.vel_y
 
-        for platform in platforms:
-            if platform.get('solid', True) and self.rect.colliderect(platform['rect']):
-                self.explode()
-                return
+class BreakableBox:
+    __slots__ = ('rect', 'entities', 'table', 'slot', 'is_special_flag')
 
-        for box in breakable_boxes:
-            if self.rect.colliderect(box.rect) and not box.broken:
-                box.break_box()
-                self.explode()
-                return
+    def __init__(self, x, y, entities, has_key=False, is_special_flag=False):
+        self.rect = pygame.Rect(x, y, 70, 70)
+        # Whether it is broken, and the key's float, live in the owning level's entity store
+        self.entities = entities
+        self.table = entities.tables['box']
+        self.slot = entities.place('box', breakable=(False, has_key, False),
+                                   animator=(random.uniform(0, math.pi * 2), 0.1))
+        self.is_special_flag = is_special_flag
 
-        if random.random() < 0.8:
-            self.particles.append(DustParticle(
-                self.rect.centerx + random.randint(-3, 3),
-                self.rect.centery + random.randint(-3, 3)
-            ))
-
-        if (self.rect.x < -50 or self.rect.x > SCREEN_WIDTH + 50 or
-                self.rect.y < -50 or self.rect.y > SCREEN_HEIGHT + 50):
-            self.alive = False
-
-    def explode(self):
-        self.alive = False
-        for _ in range(4):
-            angle = random.uniform(0, math.pi * 2)
-            speed = random.uniform(2, 5)
-            particle = DustParticle(self.rect.centerx, self.rect.centery)
-            particle.vx = math.cos(angle) * speed
-            particle.vy = math.sin(angle) * speed
-            self.particles.append(particle)
+    @property
+    def has_key(self):
+        return bool(self.table.get(self.slot, 'breakable', 'has_key'))
 
-    def draw(self, screen):
-        for particle in self.particles:
-            particle.draw(screen)
+    @property
+    def broken(self):
+        return bool(self.table.get(self.slot, 'breakable', 'broken'))
 
-        if self.alive:
-            # White glowing orb
-            glow_surf = pygame.Surface((32, 32), pygame.SRCALPHA)
-            for i in range(3, 0, -2):
-                alpha = int(150 * (i / 16))
-                color = (*WHITE, alpha)
-                pygame.draw.circle(glow_surf, color, (16, 16), i)
-            screen.blit(glow_surf, (self.rect.x - 8, self.rect.y - 8))
+    @broken.setter
+    def broken(self, broken):
+        self.table.set(self.slot, 'breakable', 'broken', broken)
 
+    @property
+    def key_collected(self):
+        return bool(self.table.get(self.slot, 'breakable', 'key_collected'))
 
-class BreakableBox:
-    def __init__(self, x, y, has_key=False, is_special_flag=False):
-        self.rect = pygame.Rect(x, y, 70, 70)
-        self.has_key = has_key
-        self.broken = False
-        self.particles = []
-        self.key_collected = False
-        self.key_y_offset = 0
-        self.key_float_phase = random.uniform(0, math.pi * 2)
-        self.is_special_flag = is_special_flag
+    @key_collected.setter
+    def key_collected(self, collected):
+        self.table.set(self.slot, 'breakable', 'key_collected', collected)
 
     def break_box(self):
         if not self.broken:
             self.broken = True
-            for _ in range(4):
-                angle = random.uniform(0, math.pi * 2)
-                speed = random.uniform(2, 5)
-                particle = DustParticle(self.rect.centerx, self.rect.centery)
-                particle.vx = math.cos(angle) * speed
-                particle.vy = math.sin(angle) * speed - 2
-                self.particles.append(particle)
-
-    def update(self):
-        self.particles = [p for p in self.particles if p.life > 0]
-        for particle in self.particles:
-            particle.update()
-
-        if self.broken and self.has_key and not self.key_collected:
-            self.key_float_phase += 0.1
-            self.key_y_offset = math.sin(self.key_float_phase) * 5
+            self.entities.burst(self.rect.centerx, self.rect.centery, particle_count(4), lift=2)
 
     def collect_key(self):
         if self.broken and self.has_key and not self.key_collected:
@@ -236,9 +2150,6 @@ class BreakableBox:
         return False
 
     def draw(self, screen):
-        for particle in self.particles:
-            particle.draw(screen)
-
         if not self.broken:
             # Silhouette box
             pygame.draw.rect(screen, SILHOUETTE, self.rect)
@@ -247,14 +2158,18 @@ class BreakableBox:
 
         elif self.has_key and not self.key_collected:
             key_x = self.rect.centerx
-            key_y = self.rect.centery - 20 + self.key_y_offset
+            key_y = self.rect.centery - 20 + math.sin(self.table.get(self.slot, 'animator', 'phase')) * 5
 
             # Glowing key
-            glow_surf = pygame.Surface((60, 60), pygame.SRCALPHA)
-            for i in range(10, 0, -2):
-                alpha = int(120 * (i / 20))
-                pygame.draw.circle(glow_surf, (*WHITE, alpha), (30, 30), i)
-            screen.blit(glow_surf, (key_x - 30, key_y - 30))
+            glow_step = quality.settings['glow_step']
+
+            def paint(glow_surf):
+                for i in range(10, 0, -2 * glow_step):
+                    alpha = int(120 * (i / 20))
+                    pygame.draw.circle(glow_surf, (*WHITE, alpha), (30, 30), i)
+
+            glow_surf = surfaces.cached(('key_glow', glow_step), (60, 60), True, paint, baked=True)
+            surfaces.blit(screen, glow_surf, (key_x - 30, key_y - 30))
 
             # Key silhouette
             pygame.draw.circle(screen, SILHOUETTE, (key_x, key_y), 6)
@@ -264,54 +2179,26 @@ class BreakableBox:
 
 
 class NPC:
-    def __init__(self, x, y, dialogues):
+    __slots__ = ('rect', 'x', 'y', 'dialogues', 'table', 'slot', 'show_prompt', 'current_dialogue',
+                 'facing_player', 'dialogue_indices')
+
+    def __init__(self, x, y, dialogues, entities):
         self.rect = pygame.Rect(x, y - 45, 28, 45)
         self.x = x
         self.y = y
         self.dialogues = dialogues
-        self.bob_phase = random.uniform(0, math.pi * 2)
+        # Dialogue timers, gestures and the bob live in the owning level's entity store
+        self.table = entities.tables['npc']
+        self.slot = entities.place('npc', speaker=(0, 0, 0, 0), animator=(random.uniform(0, math.pi * 2), 0.05))
         self.show_prompt = False
         self.current_dialogue = None
-        self.dialogue_timer = 0
-        self.talking = False
-        self.gesture_timer = 0
         self.facing_player = False
-        self.arm_animation = 0
         # Add dialogue index tracking for each key
         self.dialogue_indices = {}
-        self.interaction_cooldown = 0
-
-    def update(self, player_rect, from_level):
-        # Bob animation
-        self.bob_phase += 0.05
-        self.rect.y = self.y - 45 + math.sin(self.bob_phase) * 2
-
-        # Check proximity and facing
-        distance = math.sqrt((player_rect.centerx - self.rect.centerx) ** 2 +
-                             (player_rect.centery - self.rect.centery) ** 2)
-        self.show_prompt = distance < 60
-
-        # Face the player when near
-        if self.show_prompt:
-            self.facing_player = player_rect.centerx > self.rect.centerx
-
-        if self.interaction_cooldown > 0:
-            self.interaction_cooldown -= 1
-
-        # Update dialogue timer
-        if self.dialogue_timer > 0:
-            self.dialogue_timer -= 1
-            self.talking = True
-            # Gesture animation while talking
-            self.gesture_timer += 0.15
-            self.arm_animation = math.sin(self.gesture_timer) * 20
-        else:
-            self.talking = False
-            self.arm_animation *= 0.9  # Smooth return to rest
 
     def interact(self, from_level, current_level, mouse_pos=None):
 
-        if self.interaction_cooldown > 0:
+        if self.table.get(self.slot, 'speaker', 'cooldown') > 0:
             return
 
         key = f"from_{from_level}" if from_level != current_level else "default"
@@ -333,148 +2220,165 @@ class NPC:
         self.current_dialogue = dialogue_list[self.dialogue_indices[key]]
         self.dialogue_indices[key] = (self.dialogue_indices[key] + 1) % len(dialogue_list)
 
-        self.dialogue_timer = 180
-        self.gesture_timer = 0
-        self.interaction_cooldown = 20
+        self.table.set(self.slot, 'speaker', 'timer', 180)
+        self.table.set(self.slot, 'speaker', 'gesture', 0)
+        self.table.set(self.slot, 'speaker', 'cooldown', 20)
 
     def draw(self, screen, font):
-        cx = self.rect.centerx
-        cy = self.rect.centery
+        dialogue_timer = self.table.get(self.slot, 'speaker', 'timer')
+        arm_animation = self.table.get(self.slot, 'speaker', 'arm')
+        talking = dialogue_timer > 0
+        # Bob animation
+        rect = self.rect.move(0, round(math.sin(self.table.get(self.slot, 'animator', 'phase')) * 2))
+        cx = rect.centerx
 
         # Head (hood-like shape for mysterious look)
         head_points = [
-            (cx - 8, self.rect.y + 8),
-            (cx - 6, self.rect.y + 2),
-            (cx, self.rect.y),
-            (cx + 6, self.rect.y + 2),
-            (cx + 8, self.rect.y + 8),
-            (cx + 7, self.rect.y + 14),
-            (cx - 7, self.rect.y + 14)
+            (cx - 8, rect.y + 8),
+            (cx - 6, rect.y + 2),
+            (cx, rect.y),
+            (cx + 6, rect.y + 2),
+            (cx + 8, rect.y + 8),
+            (cx + 7, rect.y + 14),
+            (cx - 7, rect.y + 14)
         ]
         pygame.draw.polygon(screen, SILHOUETTE, head_points)
 
         # Inner head shadow (for depth)
-        inner_head = pygame.Rect(cx - 5, self.rect.y + 6, 10, 8)
+        inner_head = pygame.Rect(cx - 5, rect.y + 6, 10, 8)
         pygame.draw.ellipse(screen, DARK_GRAY, inner_head)
 
         # Cloak/robe body
         body_points = [
-            (cx - 7, self.rect.y + 14),
-            (cx + 7, self.rect.y + 14),
-            (cx + 10, self.rect.y + 25),
-            (cx + 12, self.rect.bottom - 2),
-            (cx - 12, self.rect.bottom - 2),
-            (cx - 10, self.rect.y + 25)
+            (cx - 7, rect.y + 14),
+            (cx + 7, rect.y + 14),
+            (cx + 10, rect.y + 25),
+            (cx + 12, rect.bottom - 2),
+            (cx - 12, rect.bottom - 2),
+            (cx - 10, rect.y + 25)
         ]
         pygame.draw.polygon(screen, SILHOUETTE, body_points)
 
         # Arms based on state
-        if self.talking:
+        if talking:
             # Animated gesturing
             if self.facing_player:
                 # Right arm gesturing
-                gesture_angle = self.arm_animation
+                gesture_angle = arm_animation
                 pygame.draw.lines(screen, SILHOUETTE, False,
-                                  [(cx + 7, self.rect.y + 20),
-                                   (cx + 12 + gesture_angle * 0.3, self.rect.y + 24),
-                                   (cx + 14 + gesture_angle * 0.5, self.rect.y + 22 - abs(gesture_angle) * 0.2)], 3)
+                                  [(cx + 7, rect.y + 20),
+                                   (cx + 12 + gesture_angle * 0.3, rect.y + 24),
+                                   (cx + 14 + gesture_angle * 0.5, rect.y + 22 - abs(gesture_angle) * 0.2)], 3)
                 # Left arm at side
                 pygame.draw.lines(screen, SILHOUETTE, False,
-                                  [(cx - 7, self.rect.y + 20),
-                                   (cx - 9, self.rect.y + 28),
-                                   (cx - 8, self.rect.y + 35)], 3)
+                                  [(cx - 7, rect.y + 20),
+                                   (cx - 9, rect.y + 28),
+                                   (cx - 8, rect.y + 35)], 3)
             else:
                 # Left arm gesturing
-                gesture_angle = self.arm_animation
+                gesture_angle = arm_animation
                 pygame.draw.lines(screen, SILHOUETTE, False,
-                                  [(cx - 7, self.rect.y + 20),
-                                   (cx - 12 - gesture_angle * 0.3, self.rect.y + 24),
-                                   (cx - 14 - gesture_angle * 0.5, self.rect.y + 22 - abs(gesture_angle) * 0.2)], 3)
+                                  [(cx - 7, rect.y + 20),
+                                   (cx - 12 - gesture_angle * 0.3, rect.y + 24),
+                                   (cx - 14 - gesture_angle * 0.5, rect.y + 22 - abs(gesture_angle) * 0.2)], 3)
                 # Right arm at side
                 pygame.draw.lines(screen, SILHOUETTE, False,
-                                  [(cx + 7, self.rect.y + 20),
-                                   (cx + 9, self.rect.y + 28),
-                                   (cx + 8, self.rect.y + 35)], 3)
+                                  [(cx + 7, rect.y + 20),
+                                   (cx + 9, rect.y + 28),
+                                   (cx + 8, rect.y + 35)], 3)
         else:
             # Arms in cloak (mysterious pose)
             # Just hints of arms
             pygame.draw.arc(screen, DARK_GRAY,
-                            (cx - 10, self.rect.y + 20, 20, 15),
+                            (cx - 10, rect.y + 20, 20, 15),
                             math.pi * 0.2, math.pi * 0.8, 2)
 
         # Staff (optional mystical element)
-        if not self.talking:
+        if not talking:
             staff_x = cx - 15 if not self.facing_player else cx + 15
             pygame.draw.line(screen, SILHOUETTE,
-                             (staff_x, self.rect.y + 5),
-                             (staff_x, self.rect.bottom + 5), 3)
+                             (staff_x, rect.y + 5),
+                             (staff_x, rect.bottom + 5), 3)
             # Staff top
-            pygame.draw.circle(screen, SILHOUETTE, (staff_x, self.rect.y + 5), 5)
-            pygame.draw.circle(screen, DARK_GRAY, (staff_x, self.rect.y + 5), 3)
+            pygame.draw.circle(screen, SILHOUETTE, (staff_x, rect.y + 5), 5)
+            pygame.draw.circle(screen, DARK_GRAY, (staff_x, rect.y + 5), 3)
 
         # Show interaction prompt
-        if self.show_prompt and self.dialogue_timer <= 0:
+        if self.show_prompt and dialogue_timer <= 0:
             # Glowing E prompt
-            prompt_y = self.rect.y - 35
+            prompt_y = rect.y - 35
 
-            # Glow effect
-            for i in range(15, 0, -3):
-                alpha = int(80 * (i / 15))
-                glow_surf = pygame.Surface((30, 30), pygame.SRCALPHA)
-                pygame.draw.circle(glow_surf, (*WHITE, alpha), (15, 15), i)
-                screen.blit(glow_surf, (cx - 15, prompt_y - 15))
+            # Glow effect, with the rings pre-composited into one sprite
+            glow_step = quality.settings['glow_step']
 
-            # E key box
-            prompt_surf = pygame.Surface((24, 24), pygame.SRCALPHA)
-            pygame.draw.rect(prompt_surf, SILHOUETTE, (0, 0, 24, 24), border_radius=4)
-            pygame.draw.rect(prompt_surf, WHITE, (2, 2, 20, 20), border_radius=3)
+            def paint_glow(glow_surf):
+                # draw.circle overwrites instead of blending, so each ring gets the alpha
+                # of every ring stacked over it so far, drawn from the outside in
+                coverage = 0
+                for i in range(15, 0, -3 * glow_step):
+                    coverage += (1 - coverage) * (80 * (i / 15)) / 255
+                    pygame.draw.circle(glow_surf, (*WHITE, int(coverage * 255)), (15, 15), i)
 
-            e_text = font.render("E", True, SILHOUETTE)
-            prompt_surf.blit(e_text, (12 - e_text.get_width() // 2, 12 - e_text.get_height() // 2))
+            glow_surf = surfaces.cached(('prompt_glow', glow_step), (30, 30), True, paint_glow, baked=True)
+            surfaces.blit(screen, glow_surf, (cx - 15, prompt_y - 15))
 
-            screen.blit(prompt_surf, (cx - 12, prompt_y - 12))
+            # E key box
+            def paint_prompt(prompt_surf):
+                pygame.draw.rect(prompt_surf, SILHOUETTE, (0, 0, 24, 24), border_radius=4)
+                pygame.draw.rect(prompt_surf, WHITE, (2, 2, 20, 20), border_radius=3)
+                e_text = font.render("E", True, SILHOUETTE)
+                prompt_surf.blit(e_text, (12 - e_text.get_width() // 2, 12 - e_text.get_height() // 2))
+
+            prompt_surf = surfaces.cached(('prompt', font.key), (24, 24), True, paint_prompt)
+            surfaces.blit(screen, prompt_surf, (cx - 12, prompt_y - 12))
 
         # Show dialogue
-        if self.dialogue_timer > 0 and self.current_dialogue:
+        if dialogue_timer > 0 and self.current_dialogue:
             # Speech bubble with fade in/out
-            alpha = min(255, self.dialogue_timer * 8) if self.dialogue_timer < 30 else 255
-
-            dialogue_text = font.render(self.current_dialogue, True, SILHOUETTE)
-            bubble_width = dialogue_text.get_width() + 20
-            bubble_height = dialogue_text.get_height() + 16
-
-            bubble_surf = pygame.Surface((bubble_width, bubble_height + 10), pygame.SRCALPHA)
-
-            # Bubble body
-            pygame.draw.rect(bubble_surf, (*WHITE, int(alpha * 0.9)),
-                             (0, 0, bubble_width, bubble_height),
-                             border_radius=10)
-            pygame.draw.rect(bubble_surf, (*SILHOUETTE, alpha),
-                             (0, 0, bubble_width, bubble_height), 2,
-                             border_radius=10)
-
-            # Tail pointing to speaker
-            tail_x = 20 if not self.facing_player else bubble_width - 20
-            tail_points = [
-                (tail_x - 10, bubble_height),
-                (tail_x + 10, bubble_height),
-                (tail_x, bubble_height + 10)
-            ]
-            pygame.draw.polygon(bubble_surf, (*WHITE, int(alpha * 0.9)), tail_points)
-            pygame.draw.lines(bubble_surf, (*SILHOUETTE, alpha), False,
-                              [tail_points[0], tail_points[2], tail_points[1]], 2)
-
-            dialogue_text.set_alpha(alpha)
-            bubble_surf.blit(dialogue_text, (10, 8))
+            alpha = min(255, dialogue_timer * 8) if dialogue_timer < 30 else 255
+
+            text_width, text_height = font.size(self.current_dialogue)
+            bubble_width = text_width + 20
+            bubble_height = text_height + 16
+
+            # Painted opaque once per line; the fade is applied as surface alpha when blitting
+            def paint_bubble(bubble_surf):
+                # Bubble body
+                pygame.draw.rect(bubble_surf, (*WHITE, int(255 * 0.9)),
+                                 (0, 0, bubble_width, bubble_height),
+                                 border_radius=10)
+                pygame.draw.rect(bubble_surf, SILHOUETTE,
+                                 (0, 0, bubble_width, bubble_height), 2,
+                                 border_radius=10)
+
+                # Tail pointing to speaker
+                tail_x = 20 if not self.facing_player else bubble_width - 20
+                tail_points = [
+                    (tail_x - 10, bubble_height),
+                    (tail_x + 10, bubble_height),
+                    (tail_x, bubble_height + 10)
+                ]
+                pygame.draw.polygon(bubble_surf, (*WHITE, int(255 * 0.9)), tail_points)
+                pygame.draw.lines(bubble_surf, SILHOUETTE, False,
+                                  [tail_points[0], tail_points[2], tail_points[1]], 2)
+
+                bubble_surf.blit(font.render(self.current_dialogue, True, SILHOUETTE), (10, 8))
+
+            bubble_surf = surfaces.cached(('bubble', self.current_dialogue, self.facing_player, font.key),
+                                          (bubble_width, bubble_height + 10), True, paint_bubble)
+            bubble_surf.set_alpha(alpha)
 
             bubble_x = cx - bubble_width // 2
-            bubble_y = self.rect.y - bubble_height - 20
-            screen.blit(bubble_surf, (bubble_x, bubble_y))
+            bubble_y = rect.y - bubble_height - 20
+            surfaces.blit(screen, bubble_surf, (bubble_x, bubble_y))
 
 
 class Player:
     def __init__(self, x, y, abilities=None):
         self.rect = pygame.Rect(x, y, 24, 36)
+        # Exact position; rect is this rounded to whole pixels for collisions and drawing
+        self.pos_x = float(x)
+        self.pos_y = float(y)
         self.vel_y = 0
         self.vel_x = 0
         self.on_ground = False
@@ -482,7 +2386,8 @@ class Player:
         self.dropping = False
         self.drop_timer = 0
         self.drop_key_pressed = False
-        self.particles = []
+        # Dust and fireballs, which outlive the level they were spawned in
+        self.entities = EntityStore()
 
         # Animation states
         self.animation_state = "idle"  # idle, walking, jumping, falling, landing
@@ -505,7 +2410,6 @@ class Player:
         self.can_double_jump = False
         self.jump_pressed = False
         self.can_fireball = self.abilities.get('fireball', False)
-        self.fireballs = []
         self.fireball_cooldown = 0
 
         # Keys collected
@@ -513,6 +2417,8 @@ class Player:
 
     def set_position(self, x, y):
         self.rect = pygame.Rect(x, y, 25, 40)
+        self.pos_x = float(x)
+        self.pos_y = float(y)
 
     def set_abilities(self, abilities={}):
         for tmp in abilities:
@@ -522,8 +2428,38 @@ class Player:
         self.double_jump_available = self.abilities.get('double_jump', False)
         self.can_fireball = self.abilities.get('fireball', False)
 
-    def update(self, platforms, mouse_pos):
-        keys = pygame.key.get_pressed()
+    # Everything a rewind needs to put the player back exactly where they were
+    STATE_FIELDS = ('pos_x', 'pos_y', 'vel_x', 'vel_y', 'on_ground', 'on_drop_platform', 'dropping', 'drop_timer',
+                    'drop_key_pressed', 'jump_pressed', 'can_double_jump', 'jump_available',
+                    'double_jump_available', 'can_fireball', 'fireball_cooldown', 'land_timer',
+                    'facing_right', 'keys', 'animation_timer', 'walk_cycle', 'idle_timer',
+                    'arm_swing', 'head_offset')
+
+    def capture_state(self):
+        scalars = tuple(getattr(self, name) for name in self.STATE_FIELDS)
+        abilities = sum(1 << i for i, name in enumerate(ABILITY_NAMES) if self.abilities.get(name))
+        table = self.entities.tables['fireball']
+        x, y = table.columns['transform'].values()
+        fireballs = tuple(zip(x, y, table.columns['velocity']['vx'], table.columns['velocity']['vy'],
+                              table.columns['lifetime']['life']))
+        return scalars, tuple(self.rect), abilities, fireballs
+
+    def restore_state(self, state):
+        scalars, rect, abilities, fireballs = state
+        for name, value in zip(self.STATE_FIELDS, scalars):
+            setattr(self, name, value)
+        self.rect = pygame.Rect(rect)
+        for i, name in enumerate(ABILITY_NAMES):
+            self.abilities[name] = bool(abilities & (1 << i))
+        self.entities.clear('dust')
+        self.entities.clear('fireball')
+        for x, y, vel_x, vel_y, life in fireballs:
+            self.entities.spawn_fireball(x, y, vel_x, vel_y, life)
+
+    def update(self, platforms, mouse_pos, keys=None):
+        """Advances one frame; keys defaults to the live keyboard."""
+        if keys is None:
+            keys = pygame.key.get_pressed()
         self.vel_x = 0
 
         # Movement
@@ -606,32 +2542,21 @@ class Player:
                 jump_sound.set_volume(0.3)
                 self.vel_y = JUMP_STRENGTH
                 self.can_double_jump = self.double_jump_available
-                for _ in range(3):
-                    self.particles.append(DustParticle(
-                        self.rect.centerx + random.randint(-8, 8),
-                        self.rect.bottom
-                    ))
+                for _ in range(particle_count(3)):
+                    self.entities.spawn_dust(self.rect.centerx + random.randint(-8, 8), self.rect.bottom)
             elif self.can_double_jump:
                 jump_sound.play()
                 jump_sound.set_volume(0.3)
                 self.vel_y = JUMP_STRENGTH * 0.85
                 self.can_double_jump = False
-                for _ in range(4):
-                    angle = random.uniform(0, math.pi * 2)
-                    speed = random.uniform(2, 4)
-                    particle = DustParticle(self.rect.centerx, self.rect.centery)
-                    particle.vx = math.cos(angle) * speed
-                    particle.vy = math.sin(angle) * speed
-                    self.particles.append(particle)
+                self.entities.burst(self.rect.centerx, self.rect.centery, particle_count(4), 2, 4)
 
         self.jump_pressed = jump_key
 
         # Fireball ability
         if self.can_fireball and self.fireball_cooldown <= 0:
             if keys[pygame.K_f] or keys[pygame.K_LSHIFT]:
-                fireball_x = self.rect.centerx
-                fireball_y = self.rect.centery
-                self.fireballs.append(Fireball(fireball_x, fireball_y, mouse_pos[0], mouse_pos[1]))
+                cast_fireball(self.entities, self.rect.centerx, self.rect.centery, mouse_pos[0], mouse_pos[1])
                 self.fireball_cooldown = 20
 
         if self.fireball_cooldown > 0:
@@ -644,35 +2569,49 @@ class Player:
 
         was_falling = not self.on_ground and self.vel_y > 5
 
-        # Move horizontally
-        self.rect.x += self.vel_x
-        self.rect.x = max(0, min(self.rect.x, SCREEN_WIDTH - self.rect.width))
-        self.check_collisions(platforms, 'horizontal')
+        # Move horizontally, in steps short enough that no platform can be skipped
+        world_width = self.level.world_rect.width if getattr(self, 'level', None) else SCREEN_WIDTH
+        steps = max(1, math.ceil(abs(self.vel_x) / MAX_MOVE_STEP))
+        for _ in range(steps):
+            self.pos_x = max(0, min(self.pos_x + self.vel_x / steps, world_width - self.rect.width))
+            self.rect.x = math.floor(self.pos_x + 0.5)
+            if self.check_collisions(platforms, 'horizontal'):
+                break
 
-        # Move vertically
-        self.rect.y += self.vel_y
+        # Move vertically, the same way
         self.on_ground = False
         self.on_drop_platform = False
-        self.check_collisions(platforms, 'vertical')
+        steps = max(1, math.ceil(abs(self.vel_y) / MAX_MOVE_STEP))
+        step_y = self.vel_y / steps
+        for _ in range(steps):
+            previous_bottom = self.rect.bottom
+            self.pos_y += step_y
+            self.rect.y = math.floor(self.pos_y + 0.5)
+            if self.check_collisions(platforms, 'vertical', previous_bottom):
+                break
 
         # Landing animation
         if self.on_ground and was_falling:
             self.land_timer = 8
-            for _ in range(6):
-                self.particles.append(DustParticle(
-                    self.rect.centerx + random.randint(-12, 12),
-                    self.rect.bottom
-                ))
+            for _ in range(particle_count(6)):
+                self.entities.spawn_dust(self.rect.centerx + random.randint(-12, 12), self.rect.bottom)
 
-        self.particles = [p for p in self.particles if p.life > 0]
-        for particle in self.particles:
-            particle.update()
+        motion_system(self.entities)
+        lifetime_system(self.entities)
+        if getattr(self, 'level', None):
+            fireball_system(self.entities, platforms, self.level.active_boxes, self.level.world_rect)
+        else:
+            fireball_system(self.entities, platforms, [])
 
-        self.fireballs = [f for f in self.fireballs if f.alive or len(f.particles) > 0]
-        for fireball in self.fireballs:
-            fireball.update(platforms, self.level.breakable_boxes if hasattr(self, 'level') else [])
+    def check_collisions(self, platforms, direction, previous_bottom=None):
+        """Pushes the player out of any platform hit; returns True if one was.
 
-    def check_collisions(self, platforms, direction):
+        previous_bottom is where the player's feet were before the move, for
+        the one-way check on drop platforms.
+        """
+        if previous_bottom is None:
+            previous_bottom = self.rect.bottom - self.vel_y
+        hit = False
         for platform in platforms:
             platform_rect = platform['rect']
             is_drop_platform = not platform.get('solid', True)
@@ -684,14 +2623,18 @@ class Player:
                             self.rect.right = platform_rect.left
                         else:
                             self.rect.left = platform_rect.right
+                        self.pos_x = self.rect.x
+                        hit = True
                 else:  # vertical
                     if is_drop_platform:
                         if self.vel_y > 0 and not self.dropping:
-                            if self.rect.bottom - self.vel_y <= platform_rect.top + 5:
+                            if previous_bottom <= platform_rect.top + 5:
                                 self.rect.bottom = platform_rect.top
+                                self.pos_y = self.rect.y
                                 self.vel_y = 0
                                 self.on_ground = True
                                 self.on_drop_platform = True
+                                hit = True
                     else:
                         if self.vel_y > 0:
                             self.rect.bottom = platform_rect.top
@@ -700,13 +2643,14 @@ class Player:
                         else:
                             self.rect.top = platform_rect.bottom
                             self.vel_y = 0
+                        self.pos_y = self.rect.y
+                        hit = True
+        return hit
 
-    def draw(self, screen):
-        for particle in self.particles:
-            particle.draw(screen)
-
-        for fireball in self.fireballs:
-            fireball.draw(screen)
+    def draw(self, screen, offset=(0, 0)):
+        """Draws the player; offset moves its dust and fireballs, which are kept in world space."""
+        particle_draw_system(self.entities, screen, offset)
+        fireball_draw_system(self.entities, screen, offset)
 
         cx = self.rect.centerx
         cy = self.rect.centery
@@ -717,11 +2661,15 @@ class Player:
         outline_width = 1
         outline_color = WHITE
 
+        # 9 passes: full ring; 5: orthogonal neighbours only; 1: silhouette only
+        outline_passes = quality.settings['outline_passes']
+
         def draw_with_outline(draw_func):
-            for dx in range(-outline_width, outline_width + 1):
-                for dy in range(-outline_width, outline_width + 1):
-                    if dx != 0 or dy != 0:
-                        draw_func(dx, dy, outline_color)
+            if outline_passes > 1:
+                for dx in range(-outline_width, outline_width + 1):
+                    for dy in range(-outline_width, outline_width + 1):
+                        if (dx != 0 or dy != 0) and (outline_passes >= 9 or dx == 0 or dy == 0):
+                            draw_func(dx, dy, outline_color)
             draw_func(0, 0, SILHOUETTE)
 
         def draw_head(offset_x, offset_y, color):
@@ -878,51 +2826,214 @@ class Player:
                 draw_with_outline(draw_standing_legs)
 
         if self.double_jump_available and self.can_double_jump and not self.on_ground:
-            indicator_surf = pygame.Surface((30, 30), pygame.SRCALPHA)
-            for i in range(6, 0, -2):
-                alpha = int(100 * (i / 15))
-                pygame.draw.circle(indicator_surf, (*WHITE, alpha), (15, 15), i)
-            screen.blit(indicator_surf, (self.rect.centerx - 15, self.rect.y - 35))
+            def paint(indicator_surf):
+                for i in range(6, 0, -2):
+                    alpha = int(100 * (i / 15))
+                    pygame.draw.circle(indicator_surf, (*WHITE, alpha), (15, 15), i)
+
+            indicator_surf = surfaces.cached('double_jump_indicator', (30, 30), True, paint, baked=True)
+            surfaces.blit(screen, indicator_surf, (self.rect.centerx - 15, self.rect.y - 35))
+
+
+class PlayerBatch:
+    """Movement state for many independent players, advanced together by a NumPy copy of Player.update.
+
+    step() matches Player.update's movement exactly: the input edge checks,
+    drop-through timer, jumps, gravity, the per-axis sub-steps with their
+    round-half-up pixel rects, and platforms resolved one after another in
+    level order. Animation, sound, particles and fireballs are left out.
+    Inputs are boolean arrays with one entry per state. Needs NumPy.
+    """
+
+    FLOAT_FIELDS = ('pos_x', 'pos_y', 'vel_y')
+    BOOL_FIELDS = ('on_ground', 'on_drop_platform', 'dropping', 'drop_key_pressed', 'jump_pressed',
+                   'can_double_jump', 'jump_available', 'double_jump_available')
+    FIELDS = FLOAT_FIELDS + ('drop_timer',) + BOOL_FIELDS
+
+    def __init__(self, platforms, world_width, count=0, size=(25, 40)):
+        if numpy is None:
+            raise RuntimeError("PlayerBatch needs NumPy (pip install numpy)")
+        # Zero-sized rects never collide in pygame, so they can be left out without changing anything
+        self.platforms = [(platform['rect'].left, platform['rect'].top, platform['rect'].right,
+                           platform['rect'].bottom, platform.get('solid', True))
+                          for platform in platforms if platform['rect'].width and platform['rect'].height]
+        self.world_width = world_width
+        self.width, self.height = size
+        for name in self.FLOAT_FIELDS:
+            setattr(self, name, numpy.zeros(count))
+        self.drop_timer = numpy.zeros(count, numpy.int64)
+        for name in self.BOOL_FIELDS:
+            setattr(self, name, numpy.zeros(count, bool))
+
+    @classmethod
+    def from_players(cls, players, platforms, world_width):
+        batch = cls(platforms, world_width, len(players), players[0].rect.size if players else (25, 40))
+        for name in cls.FIELDS:
+            getattr(batch, name)[:] = [getattr(player, name) for player in players]
+        return batch
+
+    def __len__(self):
+        return len(self.pos_x)
+
+    def select(self, indices):
+        """A new batch holding copies of the given states, in that order (repeats allowed)."""
+        batch = PlayerBatch([], self.world_width, 0, (self.width, self.height))
+        batch.platforms = self.platforms
+        for name in self.FIELDS:
+            setattr(batch, name, getattr(self, name)[indices])
+        return batch
+
+    def state(self, index):
+        """One state as plain Python values, comparable with the same Player attributes."""
+        return {name: getattr(self, name)[index].item() for name in self.FIELDS}
+
+    def rects(self):
+        """Pixel x and y of every state's rect, as Player.rect would have them."""
+        return (numpy.floor(self.pos_x + 0.5).astype(numpy.int64),
+                numpy.floor(self.pos_y + 0.5).astype(numpy.int64))
+
+    def step(self, left, right, jump, drop):
+        vel_x = numpy.where(right, float(PLAYER_SPEED), numpy.where(left, float(-PLAYER_SPEED), 0.0))
+
+        # Drop through platforms
+        starting = drop & ~self.drop_key_pressed & self.on_drop_platform
+        self.dropping |= starting
+        self.drop_timer[starting] = 10
+        self.vel_y[starting] = 2
+        self.drop_key_pressed = drop.copy()
+        counting = self.drop_timer > 0
+        self.drop_timer[counting] -= 1
+        self.dropping[~counting] = False
+
+        # Jumping
+        pressed = self.jump_available & jump & ~self.jump_pressed
+        ground_jump = pressed & self.on_ground
+        air_jump = pressed & ~self.on_ground & self.can_double_jump
+        self.vel_y[ground_jump] = JUMP_STRENGTH
+        self.can_double_jump[ground_jump] = self.double_jump_available[ground_jump]
+        self.vel_y[air_jump] = JUMP_STRENGTH * 0.85
+        self.can_double_jump[air_jump] = False
+        self.jump_pressed = jump.copy()
+
+        self.vel_y += GRAVITY
+        numpy.minimum(self.vel_y, 20, out=self.vel_y)
+
+        rect_x, rect_y = self.rects()
+
+        # Horizontal sub-steps; a state stops stepping at its first hit
+        steps = numpy.maximum(1, numpy.ceil(numpy.abs(vel_x) / MAX_MOVE_STEP)).astype(numpy.int64)
+        moving = numpy.ones(len(self), bool)
+        for step in range(int(steps.max(initial=0))):
+            moving &= steps > step
+            if not moving.any():
+                break
+            moved = numpy.maximum(0, numpy.minimum(self.pos_x + vel_x / steps, self.world_width - self.width))
+            self.pos_x = numpy.where(moving, moved, self.pos_x)
+            rect_x = numpy.where(moving, numpy.floor(self.pos_x + 0.5).astype(numpy.int64), rect_x)
+            moving &= ~self.collide_horizontal(moving, rect_x, rect_y, vel_x)
+
+        # Vertical sub-steps, the same way
+        self.on_ground[:] = False
+        self.on_drop_platform[:] = False
+        steps = numpy.maximum(1, numpy.ceil(numpy.abs(self.vel_y) / MAX_MOVE_STEP)).astype(numpy.int64)
+        step_y = self.vel_y / steps
+        moving = numpy.ones(len(self), bool)
+        for step in range(int(steps.max(initial=0))):
+            moving &= steps > step
+            if not moving.any():
+                break
+            previous_bottom = rect_y + self.height
+            self.pos_y = numpy.where(moving, self.pos_y + step_y, self.pos_y)
+            rect_y = numpy.where(moving, numpy.floor(self.pos_y + 0.5).astype(numpy.int64), rect_y)
+            moving &= ~self.collide_vertical(moving, rect_x, rect_y, previous_bottom)
+
+    def overlapping(self, moving, rect_x, rect_y, left, top, right, bottom):
+        return (moving & (rect_x < right) & (rect_x + self.width > left)
+                & (rect_y < bottom) & (rect_y + self.height > top))
+
+    def collide_horizontal(self, moving, rect_x, rect_y, vel_x):
+        """Player.check_collisions(platforms, 'horizontal') for every moving state; updates rect_x in place."""
+        hit = numpy.zeros(len(self), bool)
+        for left, top, right, bottom, solid in self.platforms:
+            if not solid:
+                continue
+            overlap = self.overlapping(moving, rect_x, rect_y, left, top, right, bottom)
+            if not overlap.any():
+                continue
+            # Like Player, anything not moving right is pushed out to the right
+            rightward = overlap & (vel_x > 0)
+            rect_x[rightward] = left - self.width
+            rect_x[overlap & ~rightward] = right
+            hit |= overlap
+        self.pos_x[hit] = rect_x[hit]
+        return hit
+
+    def collide_vertical(self, moving, rect_x, rect_y, previous_bottom):
+        """Player.check_collisions(platforms, 'vertical', previous_bottom); updates rect_y in place."""
+        hit = numpy.zeros(len(self), bool)
+        for left, top, right, bottom, solid in self.platforms:
+            overlap = self.overlapping(moving, rect_x, rect_y, left, top, right, bottom)
+            if not overlap.any():
+                continue
+            # vel_y is zeroed by each hit, so a later platform in the same pass sees the change
+            falling = overlap & (self.vel_y > 0)
+            if solid:
+                rect_y[falling] = top - self.height
+                self.on_ground |= falling
+                rect_y[overlap & ~falling] = bottom
+                landed = overlap
+            else:
+                landed = falling & ~self.dropping & (previous_bottom <= top + 5)
+                rect_y[landed] = top - self.height
+                self.on_ground |= landed
+                self.on_drop_platform |= landed
+            self.vel_y[landed] = 0
+            self.pos_y[landed] = rect_y[landed]
+            hit |= landed
+        return hit
 
 
 class Door:
-    def __init__(self, x, y, target_level, label=""):
+    __slots__ = ('rect', 'target_level', 'label', 'table', 'slot', 'locked', 'awake')
+
+    def __init__(self, x, y, target_level, entities, label="", locked=False):
         self.rect = pygame.Rect(x, y, 50, 70)
         self.target_level = target_level
         self.label = label
-        self.glow_timer = 0
-        self.particles = []
-        self.locked = False
-
-    def update(self):
-        self.glow_timer += 0.05
-
-        if random.random() < 0.02 and not self.locked:
-            particle = DustParticle(
-                self.rect.centerx + random.randint(-15, 15),
-                self.rect.y + random.randint(0, self.rect.height)
-            )
-            particle.vy -= 0.5
-            self.particles.append(particle)
-
-        self.particles = [p for p in self.particles if p.life > 0]
-        for particle in self.particles:
-            particle.update()
-            particle.vy -= 0.1
+        # Rising dust is spawned by emitter_system while the door is unlocked and awake;
+        # doors start asleep and Level.set_focus wakes the ones in active chunks
+        self.table = entities.tables['door']
+        self.slot = entities.place('door', animator=(0, 0.05),
+                                   emitter=(self.rect.centerx, self.rect.y, 15, self.rect.height, 0.02, False))
+        self.locked = locked
+        self.awake = False
+
+    def set_locked(self, locked):
+        self.locked = locked
+        self.table.set(self.slot, 'emitter', 'active', self.awake and not locked)
+
+    def set_awake(self, awake):
+        """Doors in chunks away from the player stop emitting dust."""
+        self.awake = awake
+        self.set_locked(self.locked)
 
     def draw(self, screen, font):
-        for particle in self.particles:
-            particle.draw(screen)
-
         if not self.locked:
-            glow_intensity = (math.sin(self.glow_timer) + 1) * 0.3
-            glow_surf = pygame.Surface((self.rect.width + 40, self.rect.height + 40), pygame.SRCALPHA)
-            for i in range(6, 0, -2):
-                alpha = int(100 * glow_intensity * (i / 20))
-                pygame.draw.rect(glow_surf, (*WHITE, alpha),
-                                 (20 - i, 20 - i, self.rect.width + i * 2, self.rect.height + i * 2),
-                                 border_radius=5)
-            screen.blit(glow_surf, (self.rect.x - 20, self.rect.y - 20))
+            # Intensity is quantized so the pulse cycles through a few cached sprites
+            glow_intensity = round((math.sin(self.table.get(self.slot, 'animator', 'phase')) + 1) * 0.3, 2)
+            width, height = self.rect.size
+            glow_step = quality.settings['glow_step']
+
+            def paint(glow_surf):
+                for i in range(6, 0, -2 * glow_step):
+                    alpha = int(100 * glow_intensity * (i / 20))
+                    pygame.draw.rect(glow_surf, (*WHITE, alpha),
+                                     (20 - i, 20 - i, width + i * 2, height + i * 2),
+                                     border_radius=5)
+
+            glow_surf = surfaces.cached(('door_glow', width, height, glow_intensity, glow_step),
+                                        (width + 40, height + 40), True, paint, baked=True)
+            surfaces.blit(screen, glow_surf, (self.rect.x - 20, self.rect.y - 20))
 
         pygame.draw.rect(screen, SILHOUETTE, self.rect, border_radius=5)
         inner_rect = self.rect.inflate(-10, -10)
@@ -938,26 +3049,164 @@ class Door:
             pygame.draw.circle(screen, DARK_GRAY, (handle_x, handle_y), 4)
 
         if self.label:
-            label_surf = pygame.Surface((100, 20), pygame.SRCALPHA)
-            label_text = font.render(self.label, True, SILHOUETTE)
-            label_surf.blit(label_text, (50 - label_text.get_width() // 2, 10 - label_text.get_height() // 2))
-            screen.blit(label_surf, (self.rect.centerx - 50, self.rect.y - 25))
+            def paint(label_surf):
+                label_text = font.render(self.label, True, SILHOUETTE)
+                label_surf.blit(label_text, (50 - label_text.get_width() // 2, 10 - label_text.get_height() // 2))
+
+            label_surf = surfaces.cached(('door_label', self.label, font.key), (100, 20), True, paint)
+            surfaces.blit(screen, label_surf, (self.rect.centerx - 50, self.rect.y - 25))
 
 
 class Light:
-    def __init__(self, x, y):
+    __slots__ = ('x', 'y', 'radius', 'table', 'slot')
+
+    def __init__(self, x, y, entities):
         self.x = x
         self.y = y
         self.radius = 200
-        self.flicker_timer = random.uniform(0, math.pi * 2)
-
-    def update(self):
-        self.flicker_timer += 0.03
+        self.table = entities.tables['light']
+        self.slot = entities.place('light', animator=(random.uniform(0, math.pi * 2), 0.03))
 
     def draw(self, screen, light_surface):
-        flicker = math.sin(self.flicker_timer) * 20
+        """Paints this light into the lightmap; returns True if anything was drawn."""
+        flicker = math.sin(self.table.get(self.slot, 'animator', 'phase')) * 20
         current_radius = self.radius + flicker
         # pygame.draw.circle(light_surface, (255, 255, 255, 70), (int(self.x), int(self.y)), self.radius)
+        return False
+
+
+class Camera:
+    """The visible window into a level, in world coordinates."""
+
+    def __init__(self):
+        self.rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.world_rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+
+    @property
+    def offset(self):
+        return -self.rect.x, -self.rect.y
+
+    def set_world(self, world_rect):
+        self.world_rect = world_rect.copy()
+        self.rect.clamp_ip(self.world_rect)
+
+    def follow(self, target_rect):
+        self.rect.center = target_rect.center
+        self.rect.clamp_ip(self.world_rect)
+
+    def to_world(self, pos):
+        return pos[0] + self.rect.x, pos[1] + self.rect.y
+
+    @contextlib.contextmanager
+    def translated(self, rects):
+        """Temporarily moves rects into screen space so draw code can stay in world space."""
+        dx, dy = self.offset
+        if dx == 0 and dy == 0:
+            yield
+            return
+        for rect in rects:
+            rect.move_ip(dx, dy)
+        try:
+            yield
+        finally:
+            for rect in rects:
+                rect.move_ip(-dx, -dy)
+
+
+class Chunk:
+    __slots__ = ('coords', 'rect', 'platforms', 'boxes', 'doors', 'npcs', 'lights', 'slots', 'layer')
+
+    def __init__(self, coords):
+        self.coords = coords
+        self.rect = pygame.Rect(coords[0] * CHUNK_WIDTH, coords[1] * CHUNK_HEIGHT, CHUNK_WIDTH, CHUNK_HEIGHT)
+        # Platform indices overlapping this chunk, in level order
+        self.platforms = []
+        # Everything else belongs to the chunk containing its center
+        self.boxes = []
+        self.doors = []
+        self.npcs = []
+        self.lights = []
+        # (start, stop) of those objects' slots in the level's entity tables, by kind
+        self.slots = {}
+        # Baked static platform layer; only kept while the chunk is loaded
+        self.layer = None
+
+
+def chunk_coords(x, y):
+    return int(x // CHUNK_WIDTH), int(y // CHUNK_HEIGHT)
+
+
+class Trigger:
+    """A volume that reports the player entering, staying in and leaving it.
+
+    A trigger with a radius tests the distance between centers, a point
+    trigger tests the player's center, any other tests rect overlap; one
+    without a rect covers the whole level. While condition() is false the
+    player counts as outside.
+    """
+
+    __slots__ = ('kind', 'owner', 'rect', 'radius', 'point', 'condition')
+
+    def __init__(self, kind, owner, rect=None, radius=None, point=False, condition=None):
+        self.kind = kind
+        self.owner = owner
+        self.rect = rect
+        self.radius = radius
+        self.point = point
+        self.condition = condition
+
+    def contains(self, player_rect):
+        if self.condition is not None and not self.condition():
+            return False
+        if self.rect is None:
+            return True
+        if self.radius is not None:
+            dx = player_rect.centerx - self.rect.centerx
+            dy = player_rect.centery - self.rect.centery
+            return dx * dx + dy * dy < self.radius * self.radius
+        if self.point:
+            return self.rect.collidepoint(player_rect.center)
+        return self.rect.colliderect(player_rect)
+
+
+class TriggerGrid:
+    """Spatial hash of triggers; each tick only the cells under the player are tested."""
+
+    def __init__(self, cell_size=TRIGGER_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.everywhere = []
+        self.inside = set()
+        self.events = []
+
+    def cells_in(self, rect):
+        size = self.cell_size
+        for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+            for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                yield cx, cy
+
+    def add(self, trigger):
+        if trigger.rect is None:
+            self.everywhere.append(trigger)
+            return trigger
+        bounds = trigger.rect
+        if trigger.radius is not None:
+            bounds = pygame.Rect(0, 0, trigger.radius * 2, trigger.radius * 2)
+            bounds.center = trigger.rect.center
+        for cell in self.cells_in(bounds):
+            self.cells.setdefault(cell, []).append(trigger)
+        return trigger
+
+    def update(self, player_rect):
+        """Returns this tick's (event, trigger) pairs, event being 'enter', 'stay' or 'exit'."""
+        candidates = set(self.everywhere)
+        for cell in self.cells_in(player_rect):
+            candidates.update(self.cells.get(cell, ()))
+        inside = {trigger for trigger in candidates if trigger.contains(player_rect)}
+        self.events = [('exit', trigger) for trigger in self.inside - inside]
+        self.events.extend(('stay' if trigger in self.inside else 'enter', trigger) for trigger in inside)
+        self.inside = inside
+        return self.events
 
 
 class Level:
@@ -970,16 +3219,28 @@ class Level:
         self.breakable_boxes = []
         self.player_abilities = {}
         self.keys_required = 0
-        self.fog_particles = []
         self.npcs = []
+        self.entities = EntityStore()
+        self.world_rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        # marshal version 2 writes no back-references, so equal data always gives equal bytes
+        self.bake_digest = bake_cache.digest('level', marshal.dumps(level_data, 2)) if bake_cache.enabled else None
         self.load_level(level_data)
         self.lift_blur = False
 
-        for _ in range(4):
-            self.fog_particles.append(FogParticle(
-                random.randint(-200, SCREEN_WIDTH),
-                random.randint(0, SCREEN_HEIGHT)
-            ))
+        self.chunks = {}
+        self.far_groups = [[] for _ in range(FAR_UPDATE_INTERVAL)]
+        self.focus_chunk = None
+        self.active_chunks = []
+        self.active_ids = set()
+        self.loaded_chunks = {}
+        self.bake_job = None
+        self.active_platforms = []
+        self.active_boxes = []
+        self.tick = 0
+        self.build_chunks()
+        self.triggers = TriggerGrid()
+        self.build_triggers()
+        sync_fog(self.entities)
 
     def load_level(self, level_data):
         platform_data = level_data.get('platforms', [])
@@ -990,62 +3251,264 @@ class Level:
                 self.platforms.append({'rect': pygame.Rect(p[0], p[1], p[2], p[3]), 'solid': True})
 
         self.player_start = level_data.get('player_start', (100, 400))
+        world_width, world_height = level_data.get('world_size', (SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.world_rect = pygame.Rect(0, 0, world_width, world_height)
 
         for door_data in level_data.get('doors', []):
-            door = Door(door_data['x'], door_data['y'], door_data['target_level'], door_data.get('label', ''))
-            if door_data.get('locked', False):
-                door.locked = True
+            locked = door_data.get('locked', False)
+            door = Door(door_data['x'], door_data['y'], door_data['target_level'], self.entities,
+                        door_data.get('label', ''), locked)
+            if locked:
                 self.keys_required += 1
             self.doors.append(door)
+        self.initial_door_locks = [door.locked for door in self.doors]
 
-        self.lights = [Light(*l) for l in level_data.get('lights', [])]
+        self.lights = [Light(*l, self.entities) for l in level_data.get('lights', [])]
 
         for box_data in level_data.get('breakable_boxes', []):
-            box = BreakableBox(box_data['x'], box_data['y'], box_data.get('has_key', False),
+            box = BreakableBox(box_data['x'], box_data['y'], self.entities, box_data.get('has_key', False),
                                box_data.get('is_special_flag', False))
             self.breakable_boxes.append(box)
 
         for npc_data in level_data.get('npcs', []):
-            npc = NPC(npc_data['x'], npc_data['y'], npc_data['dialogues'])
+            npc = NPC(npc_data['x'], npc_data['y'], npc_data['dialogues'], self.entities)
             self.npcs.append(npc)
 
         self.player_abilities = level_data.get('abilities', {})
 
-    def update(self, player, from_level):
-        for fog in self.fog_particles:
-            fog.update()
-        for door in self.doors:
-            door.update()
+    def get_chunk(self, coords):
+        chunk = self.chunks.get(coords)
+        if chunk is None:
+            chunk = self.chunks[coords] = Chunk(coords)
+            self.far_groups[len(self.chunks) % FAR_UPDATE_INTERVAL].append(chunk)
+        return chunk
+
+    def build_chunks(self):
+        # Which platforms overlap which chunk only depends on the level data, so it is baked
+        membership = bake_cache.load_data(self.bake_digest, '.chunks') if self.bake_digest else None
+        if membership is None:
+            membership = {}
+            for index, platform in enumerate(self.platforms):
+                rect = platform['rect']
+                left, top = chunk_coords(rect.left, rect.top)
+                right, bottom = chunk_coords(rect.right - 1, rect.bottom - 1)
+                for cx in range(left, right + 1):
+                    for cy in range(top, bottom + 1):
+                        membership.setdefault((cx, cy), []).append(index)
+            if self.bake_digest:
+                bake_cache.store_data(self.bake_digest, '.chunks', membership)
+        for coords, indices in membership.items():
+            self.get_chunk(coords).platforms.extend(indices)
+        for attr, objects in (('boxes', self.breakable_boxes), ('doors', self.doors), ('npcs', self.npcs)):
+            for obj in objects:
+                getattr(self.get_chunk(chunk_coords(*obj.rect.center)), attr).append(obj)
         for light in self.lights:
-            light.update()
-        for box in self.breakable_boxes:
-            box.update()
-            if box.is_special_flag and box.broken:
-                self.lift_blur = True
+            self.get_chunk(chunk_coords(light.x, light.y)).lights.append(light)
+        # Each chunk's objects get neighbouring slots so update_chunk can walk them as one range
+        for kind, attr in (('box', 'boxes'), ('door', 'doors'), ('npc', 'npcs'), ('light', 'lights')):
+            order = []
+            for chunk in self.chunks.values():
+                objects = getattr(chunk, attr)
+                chunk.slots[kind] = (len(order), len(order) + len(objects))
+                order.extend(objects)
+            self.entities.tables[kind].reorder([obj.slot for obj in order])
+            for slot, obj in enumerate(order):
+                obj.slot = slot
+
+    def build_triggers(self):
+        for door in self.doors:
+            self.triggers.add(Trigger('door', door, door.rect, condition=lambda door=door: not door.locked))
         for npc in self.npcs:
-            npc.update(player.rect, from_level)
-        if hasattr(player, 'fireballs'):
-            for fireball in player.fireballs:
-                if fireball.alive:
-                    fireball.update(self.platforms, self.breakable_boxes)
+            self.triggers.add(Trigger('npc', npc, npc.rect.copy(), radius=NPC_TALK_RADIUS))
         for box in self.breakable_boxes:
-            if box.broken and box.has_key and not box.key_collected:
-                if (abs(player.rect.centerx - box.rect.centerx) < 30 and
-                        abs(player.rect.centery - box.rect.centery) < 30):
-                    if box.collect_key():
-                        player.keys += 1
-        for door in self.doors:
-            if door.locked and player.keys > 0:
-                door.locked = False
-                player.keys -= 1
-
-    def draw_background(self, screen):
+            if box.has_key:
+                # Within 30px of the box center on both axes
+                area = pygame.Rect(0, 0, 59, 59)
+                area.center = box.rect.center
+                self.triggers.add(Trigger('key', box, area, point=True,
+                                          condition=lambda box=box: box.broken and not box.key_collected))
+            if box.is_special_flag:
+                self.triggers.add(Trigger('flag', box, condition=lambda box=box: box.broken))
+
+    def chunks_in_rect(self, rect, margin=0):
+        left, top = chunk_coords(rect.left, rect.top)
+        right, bottom = chunk_coords(rect.right - 1, rect.bottom - 1)
+        chunks = []
+        for cy in range(top - margin, bottom + margin + 1):
+            for cx in range(left - margin, right + margin + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is not None:
+                    chunks.append(chunk)
+        return chunks
+
+    def set_focus(self, rect):
+        """Loads the chunks around rect and unloads the rest; cheap when the focus chunk is unchanged."""
+        coords = chunk_coords(*rect.center)
+        if coords == self.focus_chunk:
+            return
+        self.focus_chunk = coords
+        focus = pygame.Rect(coords[0] * CHUNK_WIDTH, coords[1] * CHUNK_HEIGHT, CHUNK_WIDTH, CHUNK_HEIGHT)
+        previous = self.active_chunks
+        self.active_chunks = self.chunks_in_rect(focus, ACTIVE_CHUNK_RADIUS)
+        self.active_ids = {id(chunk) for chunk in self.active_chunks}
+        for chunk in previous:
+            if id(chunk) not in self.active_ids:
+                for door in chunk.doors:
+                    door.set_awake(False)
+        for chunk_id in [chunk_id for chunk_id in self.loaded_chunks if chunk_id not in self.active_ids]:
+            self.loaded_chunks.pop(chunk_id).layer = None
+        for chunk in self.active_chunks:
+            for door in chunk.doors:
+                door.set_awake(True)
+        indices = sorted({index for chunk in self.active_chunks for index in chunk.platforms})
+        self.active_platforms = [self.platforms[index] for index in indices]
+        self.active_boxes = [box for chunk in self.active_chunks for box in chunk.boxes]
+        if self.bake_job is not None:
+            self.bake_job.cancel()
+        self.bake_job = jobs.submit(self.bake_steps(), JobScheduler.BAKE, "bake chunk layers")
+
+    def bake_steps(self):
+        """Job that bakes the active chunks' layers one per step, ahead of the camera reaching them."""
+        for chunk in self.active_chunks:
+            if chunk.layer is None and chunk.platforms:
+                self.bake_chunk(chunk)
+                yield
+
+    def prebake(self):
+        """Puts every chunk layer not already in the bake cache there, without keeping any loaded."""
+        for chunk in self.chunks.values():
+            if chunk.platforms and not bake_cache.has(bake_cache.digest(self.bake_digest, chunk.coords), '.px'):
+                self.bake_chunk(chunk)
+                chunk.layer = None
+        self.loaded_chunks.clear()
+
+    def bake_chunk(self, chunk):
+        self.loaded_chunks[id(chunk)] = chunk
+        digest = bake_cache.digest(self.bake_digest, chunk.coords) if self.bake_digest else None
+        chunk.layer = surfaces.load_baked(digest, True) if digest else None
+        if chunk.layer is not None:
+            return
+        chunk.layer = surfaces.new(chunk.rect.size, True)
+        chunk.layer.fill((0, 0, 0, 0))
+        self.draw_platforms(chunk.layer, [
+            {'rect': self.platforms[index]['rect'].move(-chunk.rect.x, -chunk.rect.y),
+             'solid': self.platforms[index].get('solid', True)}
+            for index in chunk.platforms
+        ])
+        if digest:
+            bake_cache.store_surface(digest, chunk.layer)
+
+    def update_chunk(self, chunk):
+        for kind, (start, stop) in chunk.slots.items():
+            animator_system(self.entities, kind, start, stop)
+        speaker_system(self.entities, *chunk.slots['npc'])
+
+    def update(self, player):
+        self.tick += 1
+        self.set_focus(player.rect)
+        sync_fog(self.entities)
+        emitter_system(self.entities)
+        motion_system(self.entities)
+        animator_system(self.entities, 'fog')
+        fog_system(self.entities)
+        lifetime_system(self.entities)
+        for chunk in self.active_chunks:
+            self.update_chunk(chunk)
+        # Chunks away from the player are spread over FAR_UPDATE_INTERVAL ticks
+        for chunk in self.far_groups[self.tick % FAR_UPDATE_INTERVAL]:
+            if id(chunk) not in self.active_ids:
+                self.update_chunk(chunk)
+        # The player moves its own fireballs too; the level moving them again is how they have always flown
+        fireball_system(player.entities, self.active_platforms, self.active_boxes, self.world_rect)
+        for event, trigger in self.triggers.update(player.rect):
+            if trigger.kind == 'npc':
+                npc = trigger.owner
+                npc.show_prompt = event != 'exit'
+                if npc.show_prompt:
+                    npc.facing_player = player.rect.centerx > npc.rect.centerx
+            elif event == 'enter':
+                if trigger.kind == 'key' and trigger.owner.collect_key():
+                    player.keys += 1
+                elif trigger.kind == 'flag':
+                    self.lift_blur = True
+        if player.keys > 0:
+            for door in self.doors:
+                if door.locked and player.keys > 0:
+                    door.set_locked(False)
+                    player.keys -= 1
+
+    def capture_changes(self):
+        """What differs from the level as freshly built from its data, keyed by object index."""
+        changes = {}
+        boxes = {i: box.broken | box.key_collected << 1
+                 for i, box in enumerate(self.breakable_boxes) if box.broken or box.key_collected}
+        if boxes:
+            changes['boxes'] = boxes
+        doors = {i: door.locked for i, (door, locked) in enumerate(zip(self.doors, self.initial_door_locks))
+                 if door.locked != locked}
+        if doors:
+            changes['doors'] = doors
+        npcs = {i: dict(npc.dialogue_indices) for i, npc in enumerate(self.npcs) if npc.dialogue_indices}
+        if npcs:
+            changes['npcs'] = npcs
+        if self.lift_blur:
+            changes['lift_blur'] = True
+        return changes
+
+    def apply_changes(self, changes):
+        for i, flag in changes.get('boxes', {}).items():
+            self.breakable_boxes[i].broken = bool(flag & 1)
+            self.breakable_boxes[i].key_collected = bool(flag & 2)
+        for i, locked in changes.get('doors', {}).items():
+            self.doors[i].set_locked(locked)
+        for i, indices in changes.get('npcs', {}).items():
+            self.npcs[i].dialogue_indices = dict(indices)
+        self.lift_blur = changes.get('lift_blur', False)
+
+    def capture_state(self):
+        """Mutable level state packed as one flag byte per box and door, plus lift_blur."""
+        # Boxes go in slot order, straight from their columns; restore_state reads them back the same way
+        breakable = self.entities.tables['box'].columns['breakable']
+        flags = bytearray(broken | collected << 1
+                          for broken, collected in zip(breakable['broken'], breakable['key_collected']))
+        flags.extend(door.locked for door in self.doors)
+        flags.append(self.lift_blur)
+        return bytes(flags)
+
+    def restore_state(self, flags):
+        breakable = self.entities.tables['box'].columns['breakable']
+        broken, collected = breakable['broken'], breakable['key_collected']
+        for slot, flag in enumerate(flags[:len(self.breakable_boxes)]):
+            broken[slot] = flag & 1
+            collected[slot] = flag >> 1
+        for door, flag in zip(self.doors, flags[len(self.breakable_boxes):]):
+            if door.locked != bool(flag):
+                door.set_locked(bool(flag))
+        self.lift_blur = bool(flags[-1])
+
+    def visible_chunks(self, view):
+        # One ring of margin so glows, prompts and speech bubbles near chunk edges still draw
+        return self.chunks_in_rect(view, 1)
+
+    def draw_chunk_layers(self, screen, chunks, view):
+        for chunk in chunks:
+            if not chunk.rect.colliderect(view) or not chunk.platforms:
+                continue
+            if chunk.layer is None:
+                self.bake_chunk(chunk)
+            surfaces.blit(screen, chunk.layer, (chunk.rect.x - view.x, chunk.rect.y - view.y))
+
+    def paint_background(self, background):
         for y in range(SCREEN_HEIGHT):
             ratio = y / SCREEN_HEIGHT
             gray = int(BACKGROUND[0] * (1 - ratio * 0.3))
-            pygame.draw.line(screen, (gray, gray, gray), (0, y), (SCREEN_WIDTH, y))
-        for fog in self.fog_particles:
-            fog.draw(screen)
+            pygame.draw.line(background, (gray, gray, gray), (0, y), (SCREEN_WIDTH, y))
+
+    def draw_background(self, screen):
+        background = surfaces.cached('level_background', (SCREEN_WIDTH, SCREEN_HEIGHT), False,
+                                     self.paint_background, baked=True)
+        surfaces.blit(screen, background, (0, 0))
+        fog_draw_system(self.entities, screen)
 
     def draw_platforms(self, screen, platforms):
         for platform in platforms:
@@ -1053,9 +3516,9 @@ class Level:
             is_drop_platform = not platform.get('solid', True)
             if is_drop_platform:
                 thin_rect = pygame.Rect(platform_rect.x, platform_rect.y, platform_rect.width, 8)
-                platform_surf = pygame.Surface((thin_rect.width, thin_rect.height), pygame.SRCALPHA)
-                pygame.draw.rect(platform_surf, (*SILHOUETTE, 180), (0, 0, thin_rect.width, thin_rect.height))
-                screen.blit(platform_surf, thin_rect.topleft)
+                platform_surf = surfaces.cached(('drop_platform', thin_rect.width), thin_rect.size, True,
+                                                lambda surf: surf.fill((*SILHOUETTE, 180)))
+                surfaces.blit(screen, platform_surf, thin_rect.topleft)
                 pygame.draw.line(screen, DARK_GRAY, (thin_rect.left, thin_rect.top), (thin_rect.right, thin_rect.top),
                                  1)
             else:
@@ -1064,10 +3527,80 @@ class Level:
                                  (platform_rect.right, platform_rect.top), 2)
 
 
+def generate_stress_level(seed=0, platforms=20, drop_platforms=10, breakable_boxes=5, doors=2, lights=3,
+                          npcs=1, world_size=None):
+    """Builds a level dict in the load_levels schema with the requested object counts.
+
+    The world grows with the object count (roughly one screen per 100 objects)
+    unless world_size is given, so density stays playable at every scale.
+    """
+    rng = random.Random(seed)
+    total = platforms + drop_platforms + breakable_boxes + doors + lights + npcs
+    if world_size is None:
+        screens = max(1, math.ceil(total / 100))
+        columns = math.ceil(math.sqrt(screens * 2))
+        rows = math.ceil(screens / columns)
+        world_size = (columns * SCREEN_WIDTH, rows * SCREEN_HEIGHT)
+    world_width, world_height = world_size
+    floor_y = world_height - 100
+
+    def spot(width, height):
+        return rng.randrange(0, max(1, world_width - width)), rng.randrange(0, max(1, floor_y - height))
+
+    platform_data = [(0, floor_y, world_width, 100)]
+    for _ in range(platforms):
+        width = rng.randrange(60, 300)
+        platform_data.append((*spot(width, 20), width, 20))
+    for _ in range(drop_platforms):
+        width = rng.randrange(80, 300)
+        platform_data.append((*spot(width, 20), width, 20, False))
+
+    door_data = []
+    for i in range(doors):
+        x, y = spot(50, 70)
+        door_data.append({'x': x, 'y': y, 'target_level': 0, 'label': str(i + 1)})
+
+    box_data = []
+    for i in range(breakable_boxes):
+        x, y = spot(70, 70)
+        box_data.append({'x': x, 'y': y, 'has_key': rng.random() < 0.3})
+
+    npc_data = []
+    for _ in range(npcs):
+        npc_data.append({'x': rng.randrange(0, world_width), 'y': floor_y,
+                         'dialogues': {'default': ["...", "Still looping?"]}})
+
+    return {
+        'world_size': world_size,
+        'platforms': platform_data,
+        'player_start': (100, floor_y - 40),
+        'doors': door_data,
+        'breakable_boxes': box_data,
+        'lights': [spot(0, 0) for _ in range(lights)],
+        'npcs': npc_data,
+        'abilities': {'jump': True, 'double_jump': True, 'fireball': True},
+    }
+
+
+def spawn_storm(level, player, fireballs=50, particles=2000, seed=0):
+    """Fills the area around the player with fireballs and level dust."""
+    rng = random.Random(seed)
+    view = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    view.center = player.rect.center
+    view.clamp_ip(level.world_rect)
+    for _ in range(fireballs):
+        x, y = rng.randrange(view.left, view.right), rng.randrange(view.top, view.bottom)
+        angle = rng.uniform(0, math.pi * 2)
+        cast_fireball(player.entities, x, y, x + math.cos(angle) * 100, y + math.sin(angle) * 100)
+    for _ in range(particles):
+        level.entities.spawn_dust(rng.randrange(view.left, view.right), rng.randrange(view.top, view.bottom),
+                                  rng.uniform(-2, 2), rng.uniform(-2, 2))
+
+
 class EndingScreen:
     def __init__(self):
         self.stars = []
-        self.num_stars = 150
+        self.num_stars = config['stars']
         self.text_opacity = 0
         self.text_phase = 0
         self.timer = 0
@@ -1135,6 +3668,12 @@ class EndingScreen:
         
         return False
     
+    def paint_star_glow(self, glow_surf, radius):
+        for i in range(int(radius * 2), 0, -quality.settings['glow_step']):
+            alpha = int(255 * (i / (radius * 2)) * 0.5)
+            pygame.draw.circle(glow_surf, (*WHITE, alpha), 
+                             (int(radius * 2), int(radius * 2)), i)
+
     def draw(self, screen):
         # Fill with black
         screen.fill(BLACK)
@@ -1143,18 +3682,18 @@ class EndingScreen:
         for star in self.stars:
             sx = (star['x'] / star['z']) * (SCREEN_WIDTH / 2)
             sy = (star['y'] / star['z']) * (SCREEN_HEIGHT / 2)
-            radius = ((SCREEN_WIDTH - star['z']) / SCREEN_WIDTH) * 4
+            # Radius is quantized to quarter pixels so glow sprites can be cached
+            radius = round(((SCREEN_WIDTH - star['z']) / SCREEN_WIDTH) * 16) / 4
             
             # Only draw if on screen
             if radius > 0:
                 # Create a glowing effect
-                glow_surf = pygame.Surface((radius * 4, radius * 4), pygame.SRCALPHA)
-                for i in range(int(radius * 2), 0, -1):
-                    alpha = int(255 * (i / (radius * 2)) * 0.5)
-                    pygame.draw.circle(glow_surf, (*WHITE, alpha), 
-                                     (int(radius * 2), int(radius * 2)), i)
-                screen.blit(glow_surf, (SCREEN_WIDTH/2 + sx - radius*2, 
-                                      SCREEN_HEIGHT/2 + sy - radius*2))
+                glow_surf = surfaces.cached(('star_glow', radius, quality.settings['glow_step']),
+                                            (radius * 4, radius * 4), True,
+                                            lambda surf, radius=radius: self.paint_star_glow(surf, radius),
+                                            baked=True)
+                surfaces.blit(screen, glow_surf, (SCREEN_WIDTH/2 + sx - radius*2, 
+                                                  SCREEN_HEIGHT/2 + sy - radius*2))
                 
                 # Draw the star core
                 pygame.draw.circle(screen, WHITE, 
@@ -1191,26 +3730,26 @@ class EndingScreen:
         
         # Fade to black when returning to menu
         if self.fade_to_menu:
-            fade_surf = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-            fade_surf.fill(BLACK)
+            fade_surf = surfaces.cached('ending_fade', (SCREEN_WIDTH, SCREEN_HEIGHT), False,
+                                        lambda surf: surf.fill(BLACK))
             fade_surf.set_alpha(min(255, self.fade_timer))
-            screen.blit(fade_surf, (0, 0))
+            surfaces.blit(screen, fade_surf, (0, 0))
 
 
 class Menu:
-    def __init__(self):
+    def __init__(self, can_continue=False):
         self.font_title = pygame.font.Font(None, 100)
         self.font_button = pygame.font.Font(None, 40)
+        names = ['continue', 'start', 'quit'] if can_continue else ['start', 'quit']
         self.buttons = {
-            'start': pygame.Rect(SCREEN_WIDTH // 2 - 120, 400, 240, 50),
-            'quit': pygame.Rect(SCREEN_WIDTH // 2 - 120, 480, 240, 50)
+            name: pygame.Rect(SCREEN_WIDTH // 2 - 120, 400 + i * 80, 240, 50)
+            for i, name in enumerate(names)
         }
         self.hover = None
-        self.particles = []
+        # Hover dust and fog
+        self.entities = EntityStore()
         self.bg_phase = 0
-        self.fog_particles = []
-        for _ in range(4):
-            self.fog_particles.append(FogParticle(random.randint(-200, SCREEN_WIDTH), random.randint(0, SCREEN_HEIGHT)))
+        sync_fog(self.entities)
 
     def update(self):
         mouse_pos = pygame.mouse.get_pos()
@@ -1219,37 +3758,44 @@ class Menu:
             if rect.collidepoint(mouse_pos):
                 self.hover = name
                 if random.random() < 0.1:
-                    self.particles.append(DustParticle(rect.centerx + random.randint(-40, 40), rect.centery))
-        self.particles = [p for p in self.particles if p.life > 0]
-        for particle in self.particles:
-            particle.update()
-        for fog in self.fog_particles:
-            fog.update()
+                    self.entities.spawn_dust(rect.centerx + random.randint(-40, 40), rect.centery)
+        sync_fog(self.entities)
+        motion_system(self.entities)
+        animator_system(self.entities)
+        fog_system(self.entities)
+        lifetime_system(self.entities)
         self.bg_phase += 0.01
 
-    def draw(self, screen):
+    def paint_background(self, background):
         for y in range(SCREEN_HEIGHT):
             gray = int(160 - (y / SCREEN_HEIGHT) * 60)
-            pygame.draw.line(screen, (gray, gray, gray), (0, y), (SCREEN_WIDTH, y))
-        for fog in self.fog_particles:
-            fog.draw(screen)
-        for particle in self.particles:
-            particle.draw(screen)
+            pygame.draw.line(background, (gray, gray, gray), (0, y), (SCREEN_WIDTH, y))
+
+    def paint_title(self, title_surf):
         title = "TTIGSBAMTGOOTD"
-        title_surf = pygame.Surface((600, 150), pygame.SRCALPHA)
         shadow_text = self.font_title.render(title, True, SILHOUETTE)
         title_surf.blit(shadow_text, (300 - shadow_text.get_width() // 2 + 5, 80 + 5))
         text = self.font_title.render(title, True, DARK_GRAY)
         title_surf.blit(text, (300 - text.get_width() // 2, 80))
-        screen.blit(title_surf, (SCREEN_WIDTH // 2 - 300, 100))
+
+    def draw(self, screen):
+        background = surfaces.cached('menu_background', (SCREEN_WIDTH, SCREEN_HEIGHT), False,
+                                     self.paint_background, baked=True)
+        surfaces.blit(screen, background, (0, 0))
+        fog_draw_system(self.entities, screen)
+        particle_draw_system(self.entities, screen)
+        title_surf = surfaces.cached('menu_title', (600, 150), True, self.paint_title, baked=True)
+        surfaces.blit(screen, title_surf, (SCREEN_WIDTH // 2 - 300, 100))
         for name, rect in self.buttons.items():
             if self.hover == name:
-                glow_surf = pygame.Surface((rect.width + 20, rect.height + 20), pygame.SRCALPHA)
-                pygame.draw.rect(glow_surf, (*WHITE, 50), (0, 0, rect.width + 20, rect.height + 20), border_radius=5)
-                screen.blit(glow_surf, (rect.x - 10, rect.y - 10))
+                glow_size = (rect.width + 20, rect.height + 20)
+                glow_surf = surfaces.cached(('button_glow', glow_size), glow_size, True,
+                                            lambda surf: pygame.draw.rect(surf, (*WHITE, 50), surf.get_rect(),
+                                                                          border_radius=5))
+                surfaces.blit(screen, glow_surf, (rect.x - 10, rect.y - 10))
             pygame.draw.rect(screen, SILHOUETTE, rect, border_radius=5)
             pygame.draw.rect(screen, DARK_GRAY, rect, 2, border_radius=5)
-            text = "START" if name == 'start' else "QUIT"
+            text = name.upper()
             text_color = WHITE if self.hover == name else LIGHT_GRAY
             button_text = self.font_button.render(text, True, text_color)
             text_x = rect.x + (rect.width - button_text.get_width()) // 2
@@ -1257,35 +3803,561 @@ class Menu:
             screen.blit(button_text, (text_x, text_y))
 
     def handle_click(self, pos):
-        if self.buttons['start'].collidepoint(pos):
-            return 'start'
-        elif self.buttons['quit'].collidepoint(pos):
-            return 'quit'
+        for name, rect in self.buttons.items():
+            if rect.collidepoint(pos):
+                return name
         return None
 
 
+class WorldState:
+    """Remembers what the player changed in each level between visits.
+
+    Levels are always rebuilt from their (shared, never mutated) level data;
+    only the differences from that prototype are kept here and re-applied on
+    entry, so memory grows with what actually changed.
+    """
+
+    def __init__(self):
+        self.changes = {}
+
+    def clear(self):
+        self.changes.clear()
+
+    def save(self, level):
+        changes = level.capture_changes()
+        if changes:
+            self.changes[level.level_number] = changes
+        else:
+            self.changes.pop(level.level_number, None)
+
+    def restore(self, level):
+        changes = self.changes.get(level.level_number)
+        if changes:
+            level.apply_changes(changes)
+
+
+def encode_save(current_level, from_level, abilities, keys, world_changes):
+    """Packs a quick-save into the versioned little-endian binary format.
+
+    Layout: magic, version, current/from level, ability bitmask, keys, then
+    for each changed level its box flags, door locks, lift_blur and NPC
+    dialogue indices, each as a count followed by (index, value) records.
+    """
+    ability_bits = sum(1 << i for i, name in enumerate(ABILITY_NAMES) if abilities.get(name))
+    out = bytearray(struct.pack('<4sHhhBH', SAVE_MAGIC, SAVE_VERSION, current_level, from_level,
+                                ability_bits, keys))
+    out += struct.pack('<H', len(world_changes))
+    for level_number, changes in sorted(world_changes.items()):
+        out += struct.pack('<hB', level_number, changes.get('lift_blur', False))
+        boxes = changes.get('boxes', {})
+        out += struct.pack('<H', len(boxes))
+        for i, flag in sorted(boxes.items()):
+            out += struct.pack('<HB', i, flag)
+        doors = changes.get('doors', {})
+        out += struct.pack('<H', len(doors))
+        for i, locked in sorted(doors.items()):
+            out += struct.pack('<HB', i, locked)
+        npcs = changes.get('npcs', {})
+        out += struct.pack('<H', len(npcs))
+        for i, indices in sorted(npcs.items()):
+            out += struct.pack('<HB', i, len(indices))
+            for key, index in indices.items():
+                encoded = key.encode('utf-8')
+                out += struct.pack('<B', len(encoded)) + encoded + struct.pack('<H', index)
+    return bytes(out)
+
+
+def decode_save(data):
+    """Inverse of encode_save; raises ValueError for foreign or truncated data."""
+    offset = 0
+
+    def read(fmt):
+        nonlocal offset
+        values = struct.unpack_from(fmt, data, offset)
+        offset += struct.calcsize(fmt)
+        return values
+
+    try:
+        magic, version, current_level, from_level, ability_bits, keys = read('<4sHhhBH')
+        if magic != SAVE_MAGIC or version != SAVE_VERSION:
+            raise ValueError(f"unsupported save (magic {magic!r}, version {version})")
+        world_changes = {}
+        for _ in range(read('<H')[0]):
+            level_number, lift_blur = read('<hB')
+            changes = {}
+            if lift_blur:
+                changes['lift_blur'] = True
+            boxes = dict(read('<HB') for _ in range(read('<H')[0]))
+            if boxes:
+                changes['boxes'] = boxes
+            doors = {i: bool(locked) for i, locked in (read('<HB') for _ in range(read('<H')[0]))}
+            if doors:
+                changes['doors'] = doors
+            npcs = {}
+            for _ in range(read('<H')[0]):
+                i, count = read('<HB')
+                indices = {}
+                for _ in range(count):
+                    length = read('<B')[0]
+                    key = data[offset:offset + length].decode('utf-8')
+                    offset += length
+                    indices[key] = read('<H')[0]
+                npcs[i] = indices
+            if npcs:
+                changes['npcs'] = npcs
+            world_changes[level_number] = changes
+    except struct.error as e:
+        raise ValueError(f"truncated save: {e}")
+    abilities = {name: bool(ability_bits & (1 << i)) for i, name in enumerate(ABILITY_NAMES)}
+    return {'current_level': current_level, 'from_level': from_level, 'abilities': abilities,
+            'keys': keys, 'world_changes': world_changes}
+
+
+class SaveWriter:
+    """Writes saves on a background thread; only the newest pending save is kept."""
+
+    def __init__(self, path=SAVE_PATH):
+        self.path = path
+        self.pending = queue.Queue(maxsize=1)
+        self.thread = None
+
+    def submit(self, data):
+        try:
+            self.pending.get_nowait()  # Superseded by the newer save
+        except queue.Empty:
+            pass
+        self.pending.put_nowait(data)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.write(self.pending.get())
+
+    def write(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".save-")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # Atomic on POSIX and Windows: readers see the old or the new save, never half of one
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not write save file. {e}")
+            # Don't leave a .save- file behind for every failed write
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return decode_save(f.read())
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load save file. {e}")
+            return None
+
+
+class RewindBuffer:
+    """Fixed-size ring of per-tick snapshots for rewinding.
+
+    Every REWIND_KEYFRAME_INTERVAL ticks a compressed keyframe is stored;
+    the ticks in between store only the fields that differ from their
+    keyframe. Seeking any tick therefore decodes at most one keyframe and
+    one delta.
+    """
+
+    def __init__(self, seconds=REWIND_SECONDS, keyframe_interval=REWIND_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        # Whole keyframe groups only, so a slot never outlives its keyframe by accident
+        # One snapshot per world tick, and ticks run at TICK_RATE whatever the fps setting
+        self.capacity = math.ceil(seconds * TICK_RATE / keyframe_interval) * keyframe_interval
+        self.clear()
+
+    def clear(self):
+        self.frames = [None] * self.capacity
+        self.newest = -1
+        # Oldest tick that can still be restored; it only moves forward, since
+        # stepping back does not bring overwritten slots back
+        self.oldest = 0
+        self.bytes_used = 0
+        self.keyframe = None
+        self.decoded = None
+
+    def store(self, tick, data):
+        slot = tick % self.capacity
+        if self.frames[slot] is not None:
+            self.bytes_used -= len(self.frames[slot])
+        self.frames[slot] = data
+        self.bytes_used += len(data)
+
+    def record(self, state):
+        tick = self.newest + 1
+        if tick >= self.capacity:
+            # This slot's old tick is gone, and with it any delta that leaned on it as a keyframe
+            oldest = tick - self.capacity + 1
+            oldest = math.ceil(oldest / self.keyframe_interval) * self.keyframe_interval
+            self.oldest = max(self.oldest, oldest)
+        if tick % self.keyframe_interval == 0:
+            self.keyframe = (tick, state)
+            self.store(tick, b'K' + zlib.compress(marshal.dumps(state)))
+        else:
+            self.store(tick, b'D' + marshal.dumps(self.diff(self.keyframe[1], state)))
+        self.newest = tick
+
+    def diff(self, base, state):
+        (base_scalars, base_rect, base_abilities, base_fireballs), base_flags = base
+        (scalars, rect, abilities, fireballs), flags = state
+        changed = tuple((i, value) for i, (old, value) in enumerate(zip(base_scalars, scalars)) if old != value)
+        return (changed,
+                None if rect == base_rect else rect,
+                None if abilities == base_abilities else abilities,
+                fireballs,
+                None if flags == base_flags else flags)
+
+    def decode_keyframe(self, tick):
+        if self.decoded is None or self.decoded[0] != tick:
+            self.decoded = (tick, marshal.loads(zlib.decompress(self.frames[tick % self.capacity][1:])))
+        return self.decoded[1]
+
+    def seek(self, tick):
+        if not self.oldest <= tick <= self.newest:
+            return None
+        keyframe_tick = tick - tick % self.keyframe_interval
+        base = self.decode_keyframe(keyframe_tick)
+        if tick == keyframe_tick:
+            return base
+        changed, rect, abilities, fireballs, flags = marshal.loads(self.frames[tick % self.capacity][1:])
+        (scalars, base_rect, base_abilities, _), base_flags = base
+        scalars = list(scalars)
+        for i, value in changed:
+            scalars[i] = value
+        return ((tuple(scalars), base_rect if rect is None else rect,
+                 base_abilities if abilities is None else abilities, fireballs),
+                base_flags if flags is None else flags)
+
+    def step_back(self, steps=1):
+        """Moves the newest tick back and returns its state; newer history is dropped."""
+        tick = self.newest - steps
+        state = self.seek(tick)
+        if state is None:
+            return None
+        self.newest = tick
+        keyframe_tick = tick - tick % self.keyframe_interval
+        self.keyframe = (keyframe_tick, self.decode_keyframe(keyframe_tick))
+        return state
+
+
+class GhostRun:
+    """One stretch of a pass through a level: a start position, then one signed-byte
+    (dx, dy) pair and one pose byte per tick. A teleport too far for a byte starts a new run."""
+
+    __slots__ = ('start_tick', 'x', 'y', 'end_x', 'end_y', 'deltas', 'poses')
+
+    def __init__(self, start_tick, x, y):
+        self.start_tick = start_tick
+        self.x = self.end_x = x
+        self.y = self.end_y = y
+        self.deltas = array('b')
+        self.poses = array('B')
+
+    def __len__(self):
+        return len(self.poses)
+
+    def nbytes(self):
+        return len(self.deltas) + len(self.poses) + 64
+
+
+class Ghost:
+    """Playback cursor over a GhostRun; moves one tick at a time in either direction."""
+
+    __slots__ = ('run', 'index', 'x', 'y')
+
+    def __init__(self, run):
+        self.run = run
+        self.index = -1
+        self.x = run.x
+        self.y = run.y
+
+    def seek(self, tick):
+        target = tick - self.run.start_tick
+        if target < 0 or target >= len(self.run):
+            self.index = -1
+            return
+        if self.index < 0:
+            self.index, self.x, self.y = 0, self.run.x, self.run.y
+        deltas = self.run.deltas
+        while self.index < target:
+            self.index += 1
+            self.x += deltas[2 * self.index]
+            self.y += deltas[2 * self.index + 1]
+        while self.index > target:
+            self.x -= deltas[2 * self.index]
+            self.y -= deltas[2 * self.index + 1]
+            self.index -= 1
+
+
+class GhostRecorder:
+    """Records the player's passes through each level and replays earlier ones as translucent ghosts.
+
+    Every pass is kept until the total passes past memory_budget bytes, at
+    which point the oldest, from any level, go first. Ghosts replay in step
+    with the current pass, counted in ticks since the level was entered.
+    """
+
+    POSES = ('idle', 'walking', 'jumping', 'falling', 'landing')
+    WALK_PHASES = 8
+    SPRITE_SIZE = (41, 52)
+    SPRITE_ORIGIN = (8, 6)
+
+    def __init__(self, memory_budget=GHOST_MEMORY_BUDGET, limit=GHOST_LIMIT):
+        self.memory_budget = memory_budget
+        self.limit = limit
+        self.runs = {}
+        self.order = deque()
+        self.bytes_used = 0
+        self.level = None
+        self.tick = 0
+        self.current = []
+        self.recording = False
+        self.ghosts = []
+
+    def begin(self, level_index):
+        self.finish()
+        self.level = level_index
+        self.tick = 0
+        self.recording = True
+        self.ghosts = [Ghost(run) for run in list(self.runs.get(level_index, ()))[-self.limit:]]
+
+    def finish(self):
+        """Files the current pass away so later visits replay it."""
+        for run in self.current:
+            if len(run):
+                self.runs.setdefault(self.level, deque()).append(run)
+                self.order.append((self.level, run))
+                self.bytes_used += run.nbytes()
+        self.current = []
+        self.recording = False
+        self.ghosts = []
+        self.evict(0)
+
+    def evict(self, reserve):
+        while self.order and self.bytes_used + reserve > self.memory_budget:
+            level, run = self.order.popleft()
+            self.runs[level].popleft()
+            self.bytes_used -= run.nbytes()
+
+    def pose(self, player):
+        state = self.POSES.index(player.animation_state) if player.animation_state in self.POSES else 0
+        phase = 0
+        if player.animation_state == "walking":
+            phase = int(player.walk_cycle / (2 * math.pi) * self.WALK_PHASES) % self.WALK_PHASES
+        return state | phase << 3
+
+    def record(self, player):
+        if not self.recording:
+            return
+        x, y = player.rect.topleft
+        run = self.current[-1] if self.current else None
+        if run is None or not (-128 <= x - run.end_x <= 127 and -128 <= y - run.end_y <= 127):
+            run = GhostRun(self.tick, x, y)
+            self.current.append(run)
+        if len(run):
+            run.deltas.append(x - run.end_x)
+            run.deltas.append(y - run.end_y)
+        else:
+            run.deltas.extend((0, 0))
+        run.end_x, run.end_y = x, y
+        run.poses.append(self.pose(player))
+        self.tick += 1
+        for ghost in self.ghosts:
+            ghost.seek(self.tick - 1)
+        if self.tick % 600 == 0:
+            # Make room for the pass in progress; if even that does not fit, stop recording it
+            self.evict(sum(run.nbytes() for run in self.current))
+            if self.bytes_used + sum(run.nbytes() for run in self.current) > self.memory_budget:
+                self.recording = False
+
+    def truncate(self, ticks):
+        """Drops recorded ticks after the first `ticks`, for when play is rewound."""
+        while self.tick > ticks and self.current:
+            run = self.current[-1]
+            run.end_x -= run.deltas[-2]
+            run.end_y -= run.deltas[-1]
+            del run.deltas[-2:]
+            del run.poses[-1]
+            self.tick -= 1
+            if not len(run):
+                self.current.pop()
+        for ghost in self.ghosts:
+            ghost.seek(self.tick - 1)
+
+    def paint_pose(self, pose, surf):
+        # Placed the way the live player is, so the ghost gets its 25x40 rect
+        painter = Player(0, 0)
+        painter.set_position(*self.SPRITE_ORIGIN)
+        painter.animation_state = self.POSES[pose & 7]
+        if painter.animation_state == "walking":
+            painter.walk_cycle = ((pose >> 3) + 0.5) / self.WALK_PHASES * 2 * math.pi
+            painter.arm_swing = math.sin(painter.walk_cycle) * 12
+        elif painter.animation_state == "jumping":
+            painter.arm_swing = -8
+        elif painter.animation_state == "falling":
+            painter.arm_swing = 12
+        painter.draw(surf)
+        surf.fill((255, 255, 255, GHOST_ALPHA), special_flags=pygame.BLEND_RGBA_MULT)
+
+    def draw(self, screen, view):
+        width, height = self.SPRITE_SIZE
+        origin_x, origin_y = self.SPRITE_ORIGIN
+        for ghost in self.ghosts:
+            if ghost.index < 0:
+                continue
+            x = ghost.x - origin_x - view.x
+            y = ghost.y - origin_y - view.y
+            if x + width < 0 or y + height < 0 or x > view.width or y > view.height:
+                continue
+            pose = ghost.run.poses[ghost.index]
+            sprite = surfaces.cached(('ghost', pose, quality.settings['outline_passes']), self.SPRITE_SIZE, True,
+                                     lambda surf: self.paint_pose(pose, surf), baked=True)
+            surfaces.blit(screen, sprite, (x, y))
+
+
 class Game:
     def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        # Only the subsystems the menu needs; audio comes up in load_deferred_assets
+        pygame.display.init()
+        pygame.font.init()
+        startup.mark("display initialized")
+        self.screen = pacer.create_display((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("That time I got summon by a mage to use my intellect and break free from the dungeon")
         self.clock = pygame.time.Clock()
         self.state = GameState.MENU
-        self.menu = Menu()
         self.current_level = 0
         self.from_level = 0
-        self.levels = self.load_levels()
+        self.level_data = None
         self.level = None
+        self.transition_job = None
+        self.music_job = None
         self.player = Player(0, 0)
         self.player.level = None
-        self.light_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        self.ambient_light = 40
-        self.font = pygame.font.Font(None, 20)
-        self.small_font = pygame.font.Font(None, 16)
+        self.light_surface = None
+        self.font = SizedFont(None, 20)
+        self.small_font = SizedFont(None, 16)
         self.transition = TransitionState()
-        self.level_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.ending_screen = EndingScreen()
-
-    def load_levels(self):
+        self.camera = Camera()
+        self.pacing_report = False
+        self.rewind = RewindBuffer()
+        self.world_state = WorldState()
+        self.saves = SaveWriter()
+        self.ghosts = GhostRecorder()
+        self.console = DebugConsole()
+        self.menu = Menu(self.saves.exists())
+        self.rewinding = False
+        # Built on demand when the exit door is reached
+        self.ending_screen = None
+        self.assets_ready = threading.Event()
+        self.menu_music_started = False
+        startup.mark("game constructed")
+
+    @property
+    def levels(self):
+        if self.level_data is None:
+            self.level_data = self.load_levels()
+        return self.level_data
+
+    def load_deferred_assets(self):
+        """Runs on a background thread while the menu is already on screen."""
+        self.levels
+        startup.mark("level data built")
+
+        def ready():
+            startup.mark("sounds loaded")
+            self.assets_ready.set()
+
+        # Bake every level's chunk layers now, so entering a level only maps them in
+        tasks = [(f"level {index} layers", lambda data=data, index=index: Level(data, index).prebake())
+                 for index, data in enumerate(self.levels)] if bake_cache.enabled else []
+        assets.load_all(tasks, ready)
+        startup.mark("music decoded")
+        telemetry.assets(assets)
+        if assets.report_enabled:
+            assets.report()
+
+    def start_menu_music(self, fade_ms=0):
+        self.play_music('menu_theme', 0.4, fade_ms)
+
+    def play_music(self, name, volume, fade_ms=0):
+        """Switches the music track as a background job; a newer request replaces a pending one."""
+        if self.music_job is not None:
+            self.music_job.cancel()
+        self.music_job = jobs.submit(self.music_steps(name, volume, fade_ms), JobScheduler.MUSIC, "music")
+
+    def music_steps(self, name, volume, fade_ms):
+        fade_out_music(fade_ms)
+        # Let the old track fade instead of cutting it off with the next one; the job sleeps meanwhile
+        if fade_ms:
+            yield time.perf_counter() + fade_ms / 1000
+        if not init_audio():
+            return
+        yield
+        track = assets.sounds[name]
+        if track.sound is not None:
+            channel = pygame.mixer.Channel(MUSIC_CHANNEL)
+            channel.play(track.sound, loops=-1)
+            channel.set_volume(volume)
+            return
+        # Still decoding (or it could not be decoded): stream it from the file instead
+        path = find_asset(track.filename)
+        if path is None:
+            return
+        try:
+            pygame.mixer.music.load(path)
+        except pygame.error as e:
+            print(f"Could not load {track.filename}: {e}")
+            return
+        yield
+        pygame.mixer.music.play(-1)
+        pygame.mixer.music.set_volume(volume)
+
+    def get_light_surface(self):
+        """The lightmap, at the current tier's resolution."""
+        scale = quality.settings['lightmap_scale']
+        size = (SCREEN_WIDTH // scale, SCREEN_HEIGHT // scale)
+        if self.light_surface is None or self.light_surface.get_size() != size:
+            self.light_surface = surfaces.new(size, True)
+        return self.light_surface
+
+    def apply_lighting(self, surface, lights):
+        light_surface = self.get_light_surface()
+        ambient = config['ambient_light']
+        light_surface.fill((ambient, ambient, ambient, 255))
+        painted = False
+        for light in lights:
+            painted = light.draw(surface, light_surface) or painted
+        if not painted:
+            # Nothing but ambient light: reuse a full-resolution uniform lightmap instead of rescaling
+            light_surface = surfaces.cached(('ambient_lightmap', ambient, surface.get_size()), surface.get_size(),
+                                            True, lambda surf: surf.fill((ambient, ambient, ambient, 255)))
+            surfaces.blit(surface, light_surface, (0, 0), special_flags=pygame.BLEND_ADD)
+            return
+        if light_surface.get_size() != surface.get_size():
+            light_surface = pygame.transform.scale(light_surface, surface.get_size(),
+                                                   surfaces.cached('lightmap_full', surface.get_size(), True,
+                                                                   lambda surf: None))
+        surfaces.blit(surface, light_surface, (0, 0), special_flags=pygame.BLEND_ADD)
+
+    @staticmethod
+    def load_levels():
         # This combined level list includes the new levels from game1.py
         levels = [
             # Level 1 - Modified from game1.py
@@ -1483,7 +4555,9 @@ class Game:
                 'doors': [{'x': 850, 'y': 630, 'target_level': 7, 'label': '2'},
                           {'x': 950, 'y': 630, 'target_level': 5, 'locked':True, 'label': '1'}],
                 'lights': [(300, 200), (600, 200), (900, 200)],
-                'breakable_boxes': [{'x': 580, 'y': 630}, {'x': 200, 'y': 530}, {'x': 550, 'y': 430, 'has_key': True},
+                # The (550, 200) ceiling seals the middle box in, so nothing can break it; the locked door's key
+                # is the one in the top left corner
+                'breakable_boxes': [{'x': 580, 'y': 630}, {'x': 200, 'y': 530}, {'x': 550, 'y': 430},
                                     {'x': 130, 'y': 230, 'has_key': True, 'is_special_flag': True},
                                     {'x': 1000, 'y': 230}],
                 'npcs': [{'x': 350, 'y': 700, 'dialogues': {
@@ -1521,13 +4595,24 @@ class Game:
 
     def start_level(self, level_index):
         if 0 <= level_index < len(self.levels):
+            started = time.perf_counter()
+            if self.level is not None and self.level.bake_job is not None:
+                self.level.bake_job.cancel()
             self.level = Level(self.levels[level_index], level_index)
+            self.world_state.restore(self.level)
             self.player.level = self.level  # Link player to the current level
             player_x, player_y = self.level.player_start
             self.player.set_position(player_x, player_y)
             self.player.set_abilities(self.level.player_abilities)
+            self.level.set_focus(self.player.rect)
+            self.camera.set_world(self.level.world_rect)
+            self.camera.follow(self.player.rect)
+            self.rewind.clear()
+            self.ghosts.begin(level_index)
             self.current_level = level_index
             self.state = GameState.PLAYING
+            telemetry.record('start_level', level_index, (time.perf_counter() - started) * 1000)
+            telemetry.enter_level(level_index)
 
     def start_transition(self, target_level):
         if self.player.walking_sound_playing:
@@ -1536,28 +4621,40 @@ class Game:
         self.transition.start_level = self.current_level
         self.transition.target_level = target_level
         self.transition.direction = 1
+        self.transition.started = time.perf_counter()
 
         self.from_level = self.current_level
+        self.world_state.save(self.level)
 
-        self.transition.old_level_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.transition.old_level_surface = surfaces.new((SCREEN_WIDTH, SCREEN_HEIGHT))
         self.draw_level_to_surface(self.transition.old_level_surface)
 
         # This logic is simplified because the new levels don't require intermediates
         self.transition.intermediate_surfaces = []
-
-        self.start_level(target_level)
-
-        self.transition.new_level_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.draw_level_to_surface(self.transition.new_level_surface)
+        self.transition.new_level_surface = None
 
         self.transition.phase = "swipe"
         self.transition.progress = 0.0
         self.transition.offset_x = 0
         self.state = GameState.TRANSITIONING
+        # The new level is built and rendered over the next frames while the swipe starts
+        self.transition_job = jobs.submit(self.transition_steps(target_level), JobScheduler.TRANSITION,
+                                          "level transition")
+
+    def transition_steps(self, target_level):
+        self.start_level(target_level)
+        self.state = GameState.TRANSITIONING
+        yield
+        surface = surfaces.new((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.draw_level_to_surface(surface)
+        self.transition.new_level_surface = surface
+        yield
+        self.quick_save()
 
     def draw_intermediate_level_to_surface(self, surface, level, player):
         level.draw_background(surface)
         level.draw_platforms(surface, level.platforms)
+        particle_draw_system(level.entities, surface)
         for box in level.breakable_boxes:
             box.draw(surface)
         for door in level.doors:
@@ -1565,34 +4662,40 @@ class Game:
         for npc in level.npcs:
             npc.draw(surface, self.small_font)
         player.draw(surface)
-        self.light_surface.fill((self.ambient_light, self.ambient_light, self.ambient_light, 255))
-        for light in level.lights:
-            light.draw(surface, self.light_surface)
-        surface.blit(self.light_surface, (0, 0), special_flags=pygame.BLEND_ADD)
+        self.apply_lighting(surface, level.lights)
 
     def draw_level_to_surface(self, surface):
+        view = self.camera.rect
         self.level.draw_background(surface)
-        self.level.draw_platforms(surface, self.level.platforms)
-        for box in self.level.breakable_boxes:
-            box.draw(surface)
-        for door in self.level.doors:
-            door.draw(surface, self.small_font)
-        for npc in self.level.npcs:
-            npc.draw(surface, self.small_font)
-
-        # Using the more detailed blur effect from game1.py
-        if not self.level.lift_blur:
-            self.level.draw_platforms(surface, [
-                {'rect': pygame.Rect(0, 0, 150, 800), 'solid': True},
-                {'rect': pygame.Rect(150, 0, 900, 150), 'solid': True},
-                {'rect': pygame.Rect(1050, 0, 150, 800), 'solid': True}
-            ])
-
-        self.player.draw(surface)
-        self.light_surface.fill((self.ambient_light, self.ambient_light, self.ambient_light, 255))
-        for light in self.level.lights:
-            light.draw(surface, self.light_surface)
-        surface.blit(self.light_surface, (0, 0), special_flags=pygame.BLEND_ADD)
+        chunks = self.level.visible_chunks(view)
+        self.level.draw_chunk_layers(surface, chunks, view)
+        particle_draw_system(self.level.entities, surface, self.camera.offset)
+        self.ghosts.draw(surface, view)
+
+        boxes = [box for chunk in chunks for box in chunk.boxes]
+        doors = [door for chunk in chunks for door in chunk.doors]
+        npcs = [npc for chunk in chunks for npc in chunk.npcs]
+        rects = [obj.rect for obj in boxes + doors + npcs]
+        rects.append(self.player.rect)
+
+        with self.camera.translated(rects):
+            for box in boxes:
+                box.draw(surface)
+            for door in doors:
+                door.draw(surface, self.small_font)
+            for npc in npcs:
+                npc.draw(surface, self.small_font)
+
+            # Using the more detailed blur effect from game1.py
+            if not self.level.lift_blur:
+                self.level.draw_platforms(surface, [
+                    {'rect': pygame.Rect(0, 0, 150, 800).move(self.camera.offset), 'solid': True},
+                    {'rect': pygame.Rect(150, 0, 900, 150).move(self.camera.offset), 'solid': True},
+                    {'rect': pygame.Rect(1050, 0, 150, 800).move(self.camera.offset), 'solid': True}
+                ])
+
+            self.player.draw(surface, self.camera.offset)
+        self.apply_lighting(surface, self.level.lights)
 
     def update_transition(self):
         speed = 0.02
@@ -1600,32 +4703,55 @@ class Game:
             self.transition.progress += speed
             self.transition.offset_x = self.transition.progress * SCREEN_WIDTH
             if self.transition.progress >= 1.0:
+                # Out of swipe before the idle time ran out: do the rest now
+                self.transition_job.finish()
                 self.state = GameState.PLAYING
+                telemetry.record('transition', self.transition.start_level, self.transition.target_level,
+                                 (time.perf_counter() - self.transition.started) * 1000)
 
     def draw_transition(self):
         self.screen.fill(DARK_GRAY)
         old_x = -self.transition.offset_x
-        self.screen.blit(self.transition.old_level_surface, (old_x, 0))
-        new_x = SCREEN_WIDTH - self.transition.offset_x
-        self.screen.blit(self.transition.new_level_surface, (new_x, 0))
+        surfaces.blit(self.screen, self.transition.old_level_surface, (old_x, 0))
+        if self.transition.new_level_surface is not None:
+            new_x = SCREEN_WIDTH - self.transition.offset_x
+            surfaces.blit(self.screen, self.transition.new_level_surface, (new_x, 0))
 
     def update(self):
         if self.state == GameState.MENU:
             self.menu.update()
         elif self.state == GameState.PLAYING:
+            input_latency.ticked()
+            keys = pygame.key.get_pressed()
+            # Hold R to rewind; letting go resumes from the rewound tick
+            self.rewinding = False
+            if keys[pygame.K_r]:
+                state = self.rewind.step_back(2)
+                if state is not None:
+                    self.rewinding = True
+                    if self.player.walking_sound_playing:
+                        walk_sound.stop()
+                        self.player.walking_sound_playing = False
+                    self.restore_snapshot(state)
+                    self.ghosts.truncate(self.rewind.newest + 1)
+                    return
+
             mouse_pos = pygame.mouse.get_pos()
-            self.player.update(self.level.platforms, mouse_pos)
-            self.level.update(self.player, self.from_level)
+            mouse_pos = self.camera.to_world(mouse_pos)
+            self.player.update(self.level.active_platforms, mouse_pos)
+            self.level.update(self.player)
+            self.camera.follow(self.player.rect)
+            self.rewind.record(self.capture_snapshot())
+            self.ghosts.record(self.player)
 
-            keys = pygame.key.get_pressed()
             if keys[pygame.K_e]:
-                for npc in self.level.npcs:
-                    if npc.show_prompt:
-                        npc.interact(self.from_level, self.current_level, mouse_pos)
+                for trigger in self.level.triggers.inside:
+                    if trigger.kind == 'npc':
+                        trigger.owner.interact(self.from_level, self.current_level, mouse_pos)
 
-            for door in self.level.doors:
-                if self.player.rect.colliderect(door.rect) and not door.locked:
-                    # Handle the special exit door
+            for event, trigger in self.level.triggers.events:
+                if event == 'enter' and trigger.kind == 'door':
+                    door = trigger.owner
                     # Handle the special exit door
                     if door.target_level == -1:
                         # Stop walking sound if playing
@@ -1636,14 +4762,10 @@ class Game:
                         # Transition to ending sequence
                         self.state = GameState.ENDING
                         self.ending_screen = EndingScreen()
+                        telemetry.enter_level(-1)
+                        self.ghosts.finish()
                         # Fade out game music and play ending music
-                        pygame.mixer.music.fadeout(1000)
-                        try:
-                            pygame.mixer.music.load("sounds/ending_theme.mp3")
-                            pygame.mixer.music.play(-1)
-                            pygame.mixer.music.set_volume(0.3)
-                        except pygame.error:
-                            pass  # Continue without music if file doesn't exist
+                        self.play_music('ending_theme', 0.3, 1000)
                     else:
                         self.start_transition(door.target_level)
                     break
@@ -1655,15 +4777,24 @@ class Game:
             if self.ending_screen.update():
                 # Return to menu
                 self.state = GameState.MENU
-                self.menu = Menu()  # Reset menu
+                self.menu = Menu(self.saves.exists())  # Reset menu
                 # Play menu music
-                pygame.mixer.music.fadeout(500)
-                try:
-                    pygame.mixer.music.load("sounds/menu_theme.mp3")
-                    pygame.mixer.music.play(-1)
-                    pygame.mixer.music.set_volume(0.4)
-                except pygame.error:
-                    pass
+                self.start_menu_music(500)
+
+    def capture_snapshot(self):
+        return self.player.capture_state(), self.level.capture_state()
+
+    def restore_snapshot(self, state):
+        player_state, level_state = state
+        self.player.restore_state(player_state)
+        self.level.restore_state(level_state)
+        self.level.set_focus(self.player.rect)
+        self.camera.follow(self.player.rect)
+
+    def paint_crosshair(self, crosshair_surf):
+        pygame.draw.circle(crosshair_surf, (*WHITE, 100), (10, 10), 8, 2)
+        pygame.draw.line(crosshair_surf, (*WHITE, 100), (0, 10), (20, 10), 2)
+        pygame.draw.line(crosshair_surf, (*WHITE, 100), (10, 0), (10, 20), 2)
 
     def draw(self):
         if self.state == GameState.MENU:
@@ -1672,11 +4803,8 @@ class Game:
             self.draw_level_to_surface(self.screen)
             if self.player.can_fireball:
                 mouse_x, mouse_y = pygame.mouse.get_pos()
-                crosshair_surf = pygame.Surface((20, 20), pygame.SRCALPHA)
-                pygame.draw.circle(crosshair_surf, (*WHITE, 100), (10, 10), 8, 2)
-                pygame.draw.line(crosshair_surf, (*WHITE, 100), (0, 10), (20, 10), 2)
-                pygame.draw.line(crosshair_surf, (*WHITE, 100), (10, 0), (10, 20), 2)
-                self.screen.blit(crosshair_surf, (mouse_x - 10, mouse_y - 10))
+                crosshair_surf = surfaces.cached('crosshair', (20, 20), True, self.paint_crosshair)
+                surfaces.blit(self.screen, crosshair_surf, (mouse_x - 10, mouse_y - 10))
             ui_y = 20
             if self.player.abilities.get('double_jump'):
                 text = self.font.render("Double Jump", True, LIGHT_GRAY)
@@ -1689,8 +4817,11 @@ class Game:
             if self.player.keys > 0:
                 text = self.font.render(f"Keys: {self.player.keys}", True, WHITE)
                 self.screen.blit(text, (20, ui_y))
-            hint_text = self.small_font.render("S: Drop", True, (*LIGHT_GRAY, 100))
+            hint_text = self.small_font.render("S: Drop   R: Rewind", True, (*LIGHT_GRAY, 100))
             self.screen.blit(hint_text, (20, SCREEN_HEIGHT - 30))
+            if self.rewinding:
+                rewind_text = self.font.render("<< REWIND", True, WHITE)
+                self.screen.blit(rewind_text, (SCREEN_WIDTH - rewind_text.get_width() - 20, 20))
 
         elif self.state == GameState.TRANSITIONING:
             self.draw_transition()
@@ -1698,47 +4829,792 @@ class Game:
         elif self.state == GameState.ENDING:
             self.ending_screen.draw(self.screen)
 
+    def quick_save(self):
+        self.world_state.save(self.level)
+        self.saves.submit(encode_save(self.current_level, self.from_level, self.player.abilities,
+                                      self.player.keys, self.world_state.changes))
+
+    def quick_resume(self):
+        save = self.saves.load()
+        if save is None or not 0 <= save['current_level'] < len(self.levels):
+            return False
+        self.world_state.changes = save['world_changes']
+        self.player.set_abilities(save['abilities'])
+        self.player.keys = save['keys']
+        self.from_level = save['from_level']
+        self.start_level(save['current_level'])
+        return True
+
+    def start_game_music(self):
+        # Switch to in-game music
+        self.play_music('game_theme', 0.4, 500)
+
     def handle_event(self, event):
         if event.type == pygame.QUIT:
             return False
+        if self.console.handle_event(event):
+            return True
+        if self.state == GameState.PLAYING and event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_F5:
+                self.quick_save()
+            elif event.key == pygame.K_F9:
+                self.quick_resume()
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F10:
+            capture.toggle(self.screen)
         if self.state == GameState.MENU:
             if event.type == pygame.MOUSEBUTTONDOWN:
                 action = self.menu.handle_click(event.pos)
-                if action == 'start':
-                    # Switch to in-game music
-                    pygame.mixer.music.fadeout(500)
-                    try:
-                        pygame.mixer.music.load("sounds/game_theme.mp3")
-                        pygame.mixer.music.play(-1)
-                        pygame.mixer.music.set_volume(0.4)
-                    except pygame.error as e:
-                        print(f"Could not load game_theme.mp3: {e}")
+                if action == 'continue':
+                    if self.quick_resume():
+                        self.start_game_music()
+                elif action == 'start':
+                    self.start_game_music()
+                    self.world_state.clear()
                     self.start_level(0)
                 elif action == 'quit':
                     return False
         return True
 
-    def run(self):
-        # Play menu music on startup
-        try:
-            pygame.mixer.music.load("sounds/menu_theme.mp3")
-            pygame.mixer.music.play(-1)
-            pygame.mixer.music.set_volume(0.4)
-        except pygame.error as e:
-            print(f"Could not load menu_theme.mp3: {e}")
+    def record_frame(self, frame_ms):
+        in_level = self.level is not None and self.state in (GameState.PLAYING, GameState.TRANSITIONING)
+        particles = self.player.entities.count('dust')
+        if self.level is not None:
+            particles += self.level.entities.count('dust')
+        telemetry.frame(frame_ms, self.current_level if in_level else -1, self.state.value,
+                        particles, self.player.entities.count('fireball'))
+
+    def watch_allocations(self):
+        allocations.watch('player particles', lambda: self.player.entities.count('dust'))
+        allocations.watch('fireballs', lambda: self.player.entities.count('fireball'))
+        allocations.watch('level entities', lambda: self.level.entities.count())
+        allocations.watch('level fog', lambda: self.level.entities.count('fog'))
+        allocations.watch('sprite cache', lambda: len(surfaces.cache))
 
+    def run(self):
+        first_frame = True
         running = True
+        last_frame = time.perf_counter()
+        tick_debt = 0.0
         while running:
+            if pacer.late_input:
+                pacer.wait_late(self.clock)
+            frame_start = time.perf_counter()
+            pacer.begin_frame()
             for event in pygame.event.get():
+                input_latency.polled(event)
                 running = self.handle_event(event)
-            self.update()
+            # Rounded rather than floored, so frames that jitter around one tick still run one each
+            tick_debt = min(tick_debt + (frame_start - last_frame) * TICK_RATE, MAX_TICKS_PER_FRAME)
+            last_frame = frame_start
+            if self.console.open:
+                tick_debt = 0.0
+            while tick_debt >= 0.5:
+                self.update()
+                tick_debt -= 1
             self.draw()
+            if self.console.open:
+                self.console.draw(self.screen)
             pygame.display.flip()
-            self.clock.tick(FPS)
+            pacer.presented()
+            input_latency.presented()
+            capture.frame(self.screen)
+            frame_ms = (time.perf_counter() - frame_start) * 1000
+            quality.record(frame_ms)
+            if telemetry.enabled:
+                self.record_frame(frame_ms)
+            if allocations.enabled:
+                allocations.end_frame(self.state == GameState.PLAYING)
+            gc_control.frame(self.state == GameState.PLAYING)
+            audio.frame()
+            if first_frame:
+                first_frame = False
+                startup.mark("first frame")
+                # Everything the menu does not need is loaded behind it
+                threading.Thread(target=self.load_deferred_assets, daemon=True).start()
+            elif not self.menu_music_started and self.assets_ready.is_set():
+                self.menu_music_started = True
+                # Level data is built: whatever is alive now lives for the whole session
+                gc_control.freeze()
+                startup.mark("menu music started")
+                # Play menu music once audio is up
+                if self.state == GameState.MENU:
+                    self.start_menu_music()
+                if startup.report_enabled:
+                    startup.report()
+            # Idle time left in the frame goes to background jobs, leaving a little slack for the wait
+            jobs.run(frame_start + pacer.frame_time - pacer.spin_margin)
+            if not pacer.late_input:
+                pacer.wait(self.clock)
+        if self.pacing_report:
+            pacer.report()
+        if input_latency.enabled:
+            input_latency.report()
+        if allocations.enabled:
+            allocations.report()
+        if gc_control.report_enabled:
+            gc_control.report()
+        if audio.report_enabled:
+            audio.report()
+        capture.stop(wait=True)
+        telemetry.close()
         pygame.quit()
         sys.exit()
 
 
+def benchmark_stress(scales=(10, 100, 1000, 10000, 30000), frames=120, storm=False):
+    """Times each subsystem on generated levels of increasing size and prints a table."""
+    game = Game()
+    print(f"{'objects':>8} {'build':>8} {'player':>8} {'level':>8} {'draw':>8}   (ms; per frame except build)")
+    for scale in scales:
+        level_data = generate_stress_level(seed=scale, platforms=scale // 2, drop_platforms=scale // 5,
+                                           breakable_boxes=scale // 10, doors=scale // 20,
+                                           lights=scale // 10, npcs=max(1, scale // 100))
+        game.level_data = [level_data]
+        start = time.perf_counter()
+        game.start_level(0)
+        build_ms = (time.perf_counter() - start) * 1000
+        if storm:
+            spawn_storm(game.level, game.player, seed=scale)
+        timings = {'player': 0.0, 'level': 0.0, 'draw': 0.0}
+        for _ in range(frames):
+            start = time.perf_counter()
+            game.player.update(game.level.active_platforms, game.player.rect.center)
+            timings['player'] += time.perf_counter() - start
+            start = time.perf_counter()
+            game.level.update(game.player)
+            game.camera.follow(game.player.rect)
+            timings['level'] += time.perf_counter() - start
+            start = time.perf_counter()
+            game.draw()
+            timings['draw'] += time.perf_counter() - start
+        print(f"{scale:>8} {build_ms:>8.1f} " +
+              " ".join(f"{timings[name] * 1000 / frames:>8.2f}" for name in ('player', 'level', 'draw')))
+
+
+def bake_assets():
+    """Fills the bake cache with every level's chunk layers and the menu and level sprites."""
+    game = Game()
+    game.menu.draw(game.screen)
+    for index in range(len(game.levels)):
+        game.start_level(index)
+        for chunk in game.level.chunks.values():
+            if chunk.platforms:
+                game.level.bake_chunk(chunk)
+        game.draw()
+    jobs.clear()
+    bake_cache.flush()
+    print(f"Baked {bake_cache.misses} entries into {bake_cache.directory} ({bake_cache.hits} already cached)")
+
+
+class HeldKeys(set):
+    """Stands in for pygame.key.get_pressed() with a fixed set of held keys."""
+
+    def __getitem__(self, key):
+        return key in self
+
+
+BATCH_INPUT_KEYS = (pygame.K_a, pygame.K_d, pygame.K_SPACE, pygame.K_s)  # left, right, jump, drop
+
+
+def random_inputs(rng, count, frames, change=0.1):
+    """frames x 4 x count held-input booleans that flip now and then, the way real play holds keys."""
+    held = rng.random((4, count)) < 0.5
+    inputs = numpy.empty((frames, 4, count), bool)
+    for frame in range(frames):
+        held ^= rng.random((4, count)) < change
+        inputs[frame] = held
+    return inputs
+
+
+def verify_physics(players=32, frames=600, seed=0):
+    """Runs random inputs through Player.update and PlayerBatch side by side and reports any difference."""
+    if numpy is None:
+        print("Warning: --verify-physics needs NumPy (pip install numpy)")
+        return False
+    game = Game()
+    rng = numpy.random.default_rng(seed)
+    # The story levels, plus a generated one for more drop-through platforms
+    levels = list(enumerate(game.levels)) + [('stress', generate_stress_level(seed, platforms=100, drop_platforms=40))]
+    mismatches = 0
+    for index, data in levels:
+        level = Level(data, index if isinstance(index, int) else 0)
+        start_x, start_y = level.player_start
+        group = []
+        for _ in range(players):
+            player = Player(0, 0)
+            player.level = level
+            player.set_position(start_x, start_y)
+            player.set_abilities({'jump': rng.random() < 0.9, 'double_jump': rng.random() < 0.5})
+            group.append(player)
+        batch = PlayerBatch.from_players(group, level.platforms, level.world_rect.width)
+        inputs = random_inputs(rng, players, frames)
+        for frame in range(frames):
+            for i, player in enumerate(group):
+                keys = HeldKeys(key for key, held in zip(BATCH_INPUT_KEYS, inputs[frame, :, i]) if held)
+                player.update(level.platforms, player.rect.center, keys)
+            batch.step(*inputs[frame])
+            rect_x, rect_y = batch.rects()
+            for i, player in enumerate(group):
+                expected = {name: getattr(player, name) for name in PlayerBatch.FIELDS}
+                actual = batch.state(i)
+                if expected != actual or (player.rect.x, player.rect.y) != (rect_x[i], rect_y[i]):
+                    if mismatches < 10:
+                        fields = [name for name in PlayerBatch.FIELDS if expected[name] != actual[name]] or ['rect']
+                        print(f"  level {index} player {i} frame {frame}: " + ", ".join(
+                            f"{name} {expected.get(name, tuple(player.rect))} != "
+                            f"{actual.get(name, (rect_x[i], rect_y[i]))}" for name in fields))
+                    mismatches += 1
+                    # Carry on from the reference state so one slip isn't reported every frame after
+                    for name in PlayerBatch.FIELDS:
+                        getattr(batch, name)[i] = expected[name]
+        print(f"level {index}: {players} players x {frames} frames checked")
+    # Throughput on the first level
+    level = Level(game.levels[0], 0)
+    count, steps = 4096, 300
+    batch = PlayerBatch(level.platforms, level.world_rect.width, count)
+    batch.pos_x[:], batch.pos_y[:] = level.player_start
+    batch.jump_available[:] = True
+    inputs = random_inputs(rng, count, steps)
+    start = time.perf_counter()
+    for frame in range(steps):
+        batch.step(*inputs[frame])
+    elapsed = time.perf_counter() - start
+    print(f"{'OK' if not mismatches else f'{mismatches} MISMATCHES'}; "
+          f"PlayerBatch steps {count * steps / elapsed:,.0f} player-frames/s at {count} states")
+    return not mismatches
+
+
+# Every input combination the reachability search tries each frame: (horizontal, jump held, drop held)
+REACH_ACTIONS = [(dx, jump, drop) for dx in (0, 1, -1) for jump in (False, True) for drop in (False, True)]
+
+
+def describe_inputs(actions):
+    """Run-length form of an input sequence, e.g. 'R*12 RJ*3 -*5'; - is no direction, J jump, D drop."""
+    names = [('L' if dx < 0 else 'R' if dx > 0 else '-') + ('J' if jump else '') + ('D' if drop else '')
+             for dx, jump, drop in actions]
+    runs = []
+    for name in names:
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return " ".join(name if count == 1 else f"{name}*{count}" for name, count in runs) or "(already there)"
+
+
+def reach_state_keys(batch):
+    """One int64 per state; states sharing a key are treated as the same state by the search.
+
+    Position and vel_y are counted in REACH_STATE_STEPs. x gets 21 bits and y 20, offset so
+    the area above the level packs too; search_level checks the level fits.
+    """
+    flags = numpy.zeros(len(batch), numpy.int64)
+    for bit, name in enumerate(('on_ground', 'on_drop_platform', 'dropping', 'drop_key_pressed', 'jump_pressed',
+                                'can_double_jump')):
+        flags |= getattr(batch, name).astype(numpy.int64) << bit
+    x = numpy.round(batch.pos_x / REACH_STATE_STEP).astype(numpy.int64)
+    y = numpy.round(batch.pos_y / REACH_STATE_STEP).astype(numpy.int64) + (1 << 19)
+    velocity = numpy.round(batch.vel_y / REACH_STATE_STEP).astype(numpy.int64) + 2048
+    return (((x << 20 | y) << 12 | velocity) << 6 | flags) << 4 | batch.drop_timer
+
+
+def fireball_hits(origins_x, origins_y, target, platforms, bounds):
+    """Which of these fireball origins hit the target rect when aimed at its center, as fireball_system flies them."""
+    hit = numpy.zeros(len(origins_x), bool)
+    # A fireball moves 12 pixels 59 times before it burns out; nothing further away can reach the target,
+    # and up to the target it never leaves this area
+    reach = 59 * 12 + max(target.size) + 16
+    area = target.inflate(2 * reach, 2 * reach)
+    solid = [platform['rect'] for platform in platforms
+             if platform.get('solid', True) and area.colliderect(platform['rect'])]
+    flying = numpy.nonzero((numpy.abs(origins_x - target.centerx) <= reach)
+                           & (numpy.abs(origins_y - target.centery) <= reach))[0]
+    x = origins_x[flying].astype(float)
+    y = origins_y[flying].astype(float)
+    dx = target.centerx - x
+    dy = target.centery - y
+    distance = numpy.sqrt(dx * dx + dy * dy)
+    aimed = distance > 0
+    vel_x = numpy.where(aimed, dx / numpy.where(aimed, distance, 1) * 12, 12)
+    vel_y = numpy.where(aimed, dy / numpy.where(aimed, distance, 1) * 12, 0)
+    for _ in range(59):  # life 60, and it dies on the update that takes it to 0
+        # Rect attributes round half away from zero when set from a float
+        x = numpy.sign(x + vel_x) * numpy.floor(numpy.abs(x + vel_x) + 0.5)
+        y = numpy.sign(y + vel_y) * numpy.floor(numpy.abs(y + vel_y) + 0.5)
+        alive = numpy.ones(len(x), bool)
+        for rect in solid:
+            alive &= ~((x < rect.right) & (x + 16 > rect.left) & (y < rect.bottom) & (y + 16 > rect.top))
+        struck = alive & (x < target.right) & (x + 16 > target.left) & (y < target.bottom) & (y + 16 > target.top)
+        hit[flying[struck]] = True
+        alive &= ~struck & (x >= bounds.left - 50) & (x <= bounds.right + 50)
+        alive &= (y >= bounds.top - 50) & (y <= bounds.bottom + 50)
+        flying, x, y, vel_x, vel_y = flying[alive], x[alive], y[alive], vel_x[alive], vel_y[alive]
+        if not len(flying):
+            break
+    return hit
+
+def search_level(index, level_data, abilities, max_frames=REACH_MAX_FRAMES):
+    """Breadth-first search over one level's player states for one ability set; runs in a worker process.
+
+    Each frame every state is stepped with every input in REACH_ACTIONS by
+    PlayerBatch, so the first frame a door or key area is reached gives a
+    shortest input sequence. States that agree on their flags and drop timer,
+    and on position and vel_y to within REACH_STATE_STEP, are merged; every
+    path found is exact, but a target reachable only through a merged-away
+    difference smaller than that would be missed.
+    """
+    started = time.perf_counter()
+    level = Level(level_data, index)
+    lowest = level.world_rect.bottom + 200  # Below this the player has fallen out of the level
+    if level.world_rect.right / REACH_STATE_STEP >= 1 << 21 or lowest / REACH_STATE_STEP >= 1 << 19:
+        raise ValueError(f"level {index} is too large to pack its search states")
+    batch = PlayerBatch(level.platforms, level.world_rect.width, 1)
+    batch.pos_x[0], batch.pos_y[0] = level.player_start
+    batch.jump_available[0] = 'jump' in abilities
+    batch.double_jump_available[0] = 'double_jump' in abilities
+    left = numpy.array([dx < 0 for dx, _, _ in REACH_ACTIONS])
+    right = numpy.array([dx > 0 for dx, _, _ in REACH_ACTIONS])
+    jump = numpy.array([held for _, held, _ in REACH_ACTIONS])
+    drop = numpy.array([held for _, _, held in REACH_ACTIONS])
+
+    targets = [('door', i, door.rect) for i, door in enumerate(level.doors)]
+    for i, box in enumerate(level.breakable_boxes):
+        if box.has_key:
+            area = pygame.Rect(0, 0, 59, 59)  # The key trigger, around the box center
+            area.center = box.rect.center
+            targets.append(('key', i, area))
+    found = {}
+    rect_x, rect_y = batch.rects()
+    visited = set(reach_state_keys(batch).tolist())
+    # Per frame: each state's parent in the previous frame, the action that led to it, and its rect
+    layers = [(numpy.array([-1]), numpy.array([-1]), rect_x, rect_y)]
+    frontier = batch
+    while len(frontier) and len(layers) <= max_frames:
+        x, y = layers[-1][2], layers[-1][3]
+        for kind, i, rect in targets:
+            if (kind, i) in found:
+                continue
+            if kind == 'door':
+                inside = (x < rect.right) & (x + batch.width > rect.left) & (y < rect.bottom) & (y + batch.height > rect.top)
+            else:
+                center_x, center_y = x + batch.width // 2, y + batch.height // 2
+                inside = (center_x >= rect.left) & (center_x < rect.right) & (center_y >= rect.top) & (center_y < rect.bottom)
+            if inside.any():
+                found[(kind, i)] = (len(layers) - 1, int(numpy.argmax(inside)))
+        if len(found) == len(targets) and not any(box.has_key for box in level.breakable_boxes):
+            break
+        # Holding jump or drop when it would not trigger only blocks the next press, so skip those inputs
+        can_jump = frontier.jump_available & ~frontier.jump_pressed & (frontier.on_ground | frontier.can_double_jump)
+        can_drop = frontier.on_drop_platform & ~frontier.drop_key_pressed
+        allowed = (~jump | can_jump[:, None]) & (~drop | can_drop[:, None])
+        parents, actions = numpy.nonzero(allowed)
+        children = frontier.select(parents)
+        children.step(left[actions], right[actions], jump[actions], drop[actions])
+        rect_x, rect_y = children.rects()
+        keys = reach_state_keys(children)
+        keys[rect_y > lowest] = -1
+        unique_keys, first = numpy.unique(keys, return_index=True)
+        fresh = [slot for key, slot in zip(unique_keys.tolist(), first.tolist()) if key >= 0 and key not in visited]
+        visited.update(keys[fresh].tolist())
+        fresh = numpy.array(sorted(fresh), numpy.int64)
+        frontier = children.select(fresh)
+        layers.append((parents[fresh], actions[fresh], rect_x[fresh], rect_y[fresh]))
+
+    def inputs_to(frame, slot):
+        actions = []
+        while frame > 0:
+            parents, taken, _, _ = layers[frame]
+            actions.append(REACH_ACTIONS[taken[slot]])
+            slot = parents[slot]
+            frame -= 1
+        return describe_inputs(reversed(actions))
+
+    doors = []
+    for i, door in enumerate(level.doors):
+        reached = found.get(('door', i))
+        doors.append({'index': i, 'target': door.target_level, 'locked': door.locked,
+                      'frames': reached[0] if reached else None,
+                      'inputs': inputs_to(*reached) if reached else None})
+    keys = []
+    # A box breaks if a fireball aimed at it from somewhere reachable gets there; searched as if fireball is granted
+    positions_x = numpy.concatenate([layer[2] for layer in layers])
+    positions_y = numpy.concatenate([layer[3] for layer in layers])
+    frame_of = numpy.repeat(numpy.arange(len(layers)), [len(layer[2]) for layer in layers])
+    slot_of = numpy.concatenate([numpy.arange(len(layer[2])) for layer in layers])
+    _, first = numpy.unique(positions_x << 20 | positions_y + 65536, return_index=True)
+    first.sort()
+    for i, box in enumerate(level.breakable_boxes):
+        if not box.has_key:
+            continue
+        hits = fireball_hits(positions_x[first] + batch.width // 2, positions_y[first] + batch.height // 2,
+                             box.rect, level.platforms, level.world_rect)
+        shot = (int(frame_of[first[numpy.argmax(hits)]]), int(slot_of[first[numpy.argmax(hits)]])) if hits.any() else None
+        reached = found.get(('key', i))
+        keys.append({'index': i, 'shot_frames': shot[0] if shot else None,
+                     'shot_inputs': inputs_to(*shot) if shot else None,
+                     'frames': reached[0] if reached else None,
+                     'inputs': inputs_to(*reached) if reached else None})
+    return {'level': index, 'states': len(visited), 'frames': len(layers) - 1, 'doors': doors, 'keys': keys,
+            'seconds': time.perf_counter() - started}
+
+
+def resolve_reach(result, abilities):
+    """search_level's findings for a full ability set: which keys can be collected and which doors opened."""
+    keys = []
+    for key in result['keys']:
+        if 'fireball' not in abilities:
+            problem = "needs fireball to break the box"
+        elif key['shot_frames'] is None:
+            problem = "no fireball shot reaches the box"
+        elif key['frames'] is None:
+            problem = "the box can be shot but the key cannot be picked up"
+        else:
+            problem = None
+        keys.append(dict(key, problem=problem))
+    # Each key opens the first door still locked, in level order
+    collectible = sum(key['problem'] is None for key in keys)
+    doors = []
+    for door in result['doors']:
+        problem = None if door['frames'] is not None else "out of reach"
+        if door['locked']:
+            if collectible <= 0 and problem is None:
+                problem = "no collectible key opens it"
+            collectible -= 1
+        doors.append(dict(door, problem=problem))
+    return doors, keys
+
+
+def validate_levels(level_data, workers=None):
+    """Searches every level with every ability set it can be entered with, across a process pool.
+
+    Abilities carry over between levels the way Player.set_abilities merges
+    them, so the level graph is explored from level 0 with no abilities and a
+    level is searched again when a door brings the player in with different
+    movement abilities. A door or key only counts as a problem if it cannot
+    be reached with any of the ability sets its level can be entered with.
+    Returns True when there are no problems.
+    """
+    if numpy is None:
+        print("Warning: --validate-levels needs NumPy (pip install numpy)")
+        return False
+    started = time.perf_counter()
+
+    def entering(abilities, index):
+        granted = set(abilities)
+        for name, value in level_data[index].get('abilities', {}).items():
+            if value:
+                granted.add(name)
+            else:
+                granted.discard(name)
+        return index, frozenset(granted)
+
+    # Only jump and double_jump change movement; fireball is settled from the same search by resolve_reach
+    entries = set()
+    searches = {}
+    waiting = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+
+        def enter(entry):
+            if entry in entries:
+                return
+            entries.add(entry)
+            index, abilities = entry
+            search = (index, abilities & {'jump', 'double_jump'})
+            if search in searches:
+                follow(entry, searches[search])
+            elif search in waiting:
+                waiting[search].append(entry)
+            else:
+                waiting[search] = [entry]
+                futures[pool.submit(search_level, index, level_data[index], search[1])] = search
+
+        def follow(entry, result):
+            doors, _ = resolve_reach(result, entry[1])
+            for door in doors:
+                if door['problem'] is None and 0 <= door['target'] < len(level_data):
+                    enter(entering(entry[1], door['target']))
+
+        enter(entering((), 0))
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                search = futures.pop(future)
+                searches[search] = future.result()
+                for entry in waiting.pop(search):
+                    follow(entry, searches[search])
+
+    reached = {}
+    for index, abilities in sorted(entries, key=lambda entry: (entry[0], sorted(entry[1]))):
+        result = searches[(index, abilities & {'jump', 'double_jump'})]
+        doors, keys = resolve_reach(result, abilities)
+        print(f"level {index} with {', '.join(sorted(abilities)) or 'no abilities'}: "
+              f"{result['states']:,} states over {result['frames']} frames in {result['seconds']:.2f}s")
+        for door in doors:
+            where = "the exit" if door['target'] == -1 else f"level {door['target']}"
+            name = f"door {door['index']} to {where}{' (locked)' if door['locked'] else ''}"
+            if door['problem'] is None:
+                reached.setdefault((index, 'door', door['index']), name)
+                print(f"  {name}: {door['frames']} frames  {door['inputs']}")
+            else:
+                print(f"  {name}: NOT REACHED, {door['problem']}")
+        for key in keys:
+            name = f"key in box {key['index']}"
+            if key['problem'] is None:
+                reached.setdefault((index, 'key', key['index']), name)
+                print(f"  {name}: shoot after {key['shot_frames']} frames ({key['shot_inputs']}), "
+                      f"collect after {key['frames']} frames ({key['inputs']})")
+            else:
+                print(f"  {name}: NOT REACHED, {key['problem']}")
+    problems = []
+    for index in range(len(level_data)):
+        if index not in {entry[0] for entry in entries}:
+            problems.append(f"level {index} is never entered from level 0")
+            continue
+        level = Level(level_data[index], index)
+        targets = [('door', i, f"door {i}") for i in range(len(level.doors))]
+        targets += [('key', i, f"key in box {i}") for i, box in enumerate(level.breakable_boxes) if box.has_key]
+        for kind, i, name in targets:
+            if (index, kind, i) not in reached:
+                problems.append(f"level {index} {name} is unreachable with every ability set the level is entered with")
+    print(f"{len(entries)} level and ability combinations from {len(searches)} searches "
+          f"in {time.perf_counter() - started:.1f}s")
+    for problem in problems:
+        print(f"PROBLEM: {problem}")
+    return not problems
+
+
+def read_telemetry(directory=TELEMETRY_DIR):
+    """Returns every session in the rotated logs, oldest first, as lists of records by kind."""
+    layouts = {kind: (name, struct.Struct(layout), fields) for kind, (name, layout, fields) in TELEMETRY_RECORDS.items()}
+    log = Telemetry(directory)
+    sessions = []
+    session = None
+    for generation in range(TELEMETRY_FILES - 1, -1, -1):
+        path = log.path(generation)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        offset = 0
+        while offset < len(data):
+            kind = data[offset]
+            if kind not in layouts or offset + 1 + layouts[kind][1].size > len(data):
+                print(f"Warning: Could not read {path} past byte {offset}, skipping the rest")
+                break
+            name, layout, fields = layouts[kind]
+            values = dict(zip(fields, layout.unpack_from(data, offset + 1)))
+            offset += 1 + layout.size
+            if name == 'session':
+                session = {'started': values['started'], 'build': values['build'].rstrip(b'\0').decode(),
+                           'fps': FPS, 'frame': [], 'dwell': [], 'transition': [], 'start_level': [], 'asset': [],
+                           'frame_rate': []}
+                sessions.append(session)
+            elif session is not None:
+                if name == 'asset':
+                    values['name'] = values['name'].rstrip(b'\0').decode()
+                elif name == 'frame_rate':
+                    session['fps'] = values['fps']
+                elif name == 'frame':
+                    # Logs from before frame_rate records were written ran at the FPS default
+                    values['budget_ms'] = 1000 / session['fps']
+                session[name].append(values)
+    return sessions
+
+
+def frame_percentiles(frames):
+    ordered = sorted(frame['ms'] for frame in frames)
+    if not ordered:
+        return None
+    return [ordered[min(len(ordered) - 1, int(len(ordered) * share))] for share in (0.5, 0.95, 0.99)] + [ordered[-1]]
+
+
+def analyze_telemetry(directory=TELEMETRY_DIR, compare=False):
+    """Summarizes each logged session, or with compare, every build side by side."""
+    sessions = read_telemetry(directory)
+    if not sessions:
+        print(f"No telemetry in {directory}")
+        return
+    if compare:
+        builds = {}
+        for session in sessions:
+            builds.setdefault(session['build'], []).append(session)
+        print(f"{'build':<12} {'sessions':>8} {'frames':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} "
+              f"{'slow%':>6} {'level':>7} {'swipe':>7}   (ms)")
+        for build, group in builds.items():
+            frames = [frame for session in group for frame in session['frame']]
+            if not frames:
+                continue
+            p50, p95, p99, worst = frame_percentiles(frames)
+            slow = sum(frame['ms'] > frame['budget_ms'] for frame in frames) / len(frames) * 100
+            level_ms = sorted(entry['ms'] for session in group for entry in session['start_level'])
+            swipe_ms = sorted(entry['ms'] for session in group for entry in session['transition'])
+            level_p50 = f"{level_ms[len(level_ms) // 2]:7.1f}" if level_ms else f"{'-':>7}"
+            swipe_p50 = f"{swipe_ms[len(swipe_ms) // 2]:7.0f}" if swipe_ms else f"{'-':>7}"
+            print(f"{build:<12} {len(group):8d} {len(frames):8d} {p50:7.2f} {p95:7.2f} {p99:7.2f} {worst:7.2f} "
+                  f"{slow:6.2f} {level_p50} {swipe_p50}")
+        return
+    states = {state.value: state.name.lower() for state in GameState}
+    for session in sessions:
+        frames = session['frame']
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(session['started']))
+        print(f"Session {started}  build {session['build']}  {len(frames)} frames")
+        if frames:
+            p50, p95, p99, worst = frame_percentiles(frames)
+            print(f"  frame work ms  p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}  max {worst:.2f}")
+            # Which level and state the frames over budget came from, and how far over they ran
+            slow = {}
+            for frame in frames:
+                if frame['ms'] > frame['budget_ms']:
+                    entry = slow.setdefault((states.get(frame['state'], '?'), frame['level']), [0, 0.0, 0])
+                    entry[0] += 1
+                    entry[1] += frame['ms'] - frame['budget_ms']
+                    entry[2] = max(entry[2], frame['particles'] + frame['fireballs'])
+            total = sum(count for count, _, _ in slow.values())
+            budgets = "/".join(f"{budget_ms:.1f}" for budget_ms in sorted({frame['budget_ms'] for frame in frames}))
+            print(f"  {total} frames over the {budgets}ms budget ({total / len(frames) * 100:.2f}%)")
+            for (state, level), (count, over_ms, objects) in sorted(slow.items(), key=lambda item: -item[1][1]):
+                where = f"{state} level {level}" if level >= 0 else state
+                print(f"    {where:<26} {count:6d} frames  {over_ms:8.1f}ms over  "
+                      f"up to {objects} particles and fireballs")
+        dwell = {}
+        for entry in session['dwell']:
+            visits = dwell.setdefault(entry['level'], [0, 0.0])
+            visits[0] += 1
+            visits[1] += entry['seconds']
+        for level, (visits, seconds) in sorted(dwell.items()):
+            level_ms = sorted(entry['ms'] for entry in session['start_level'] if entry['level'] == level)
+            build_ms = f"start_level p50 {level_ms[len(level_ms) // 2]:.1f}ms" if level_ms else ""
+            print(f"  level {level}  {visits:3d} visits  {seconds:8.1f}s  {build_ms}")
+        if session['transition']:
+            swipes = sorted(entry['ms'] for entry in session['transition'])
+            print(f"  {len(swipes)} transitions  p50 {swipes[len(swipes) // 2]:.0f}ms  max {swipes[-1]:.0f}ms")
+        if session['asset']:
+            print("  assets " + "  ".join(f"{entry['name']} {entry['ms']:.0f}ms" for entry in session['asset']))
+
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="TTIGSBAMTGOOTD")
+    parser.add_argument("--startup-report", action="store_true", help="print startup timings")
+    parser.add_argument("--stress", type=int, metavar="OBJECTS",
+                        help="play a generated level with roughly this many objects")
+    parser.add_argument("--stress-seed", type=int, default=0)
+    parser.add_argument("--stress-benchmark", action="store_true",
+                        help="time each subsystem on generated levels and exit")
+    parser.add_argument("--verify-physics", action="store_true",
+                        help="check PlayerBatch against Player.update on random inputs and exit")
+    parser.add_argument("--validate-levels", action="store_true",
+                        help="check every door and key can be reached with the abilities granted so far, and exit")
+    parser.add_argument("--storm", action="store_true", help="add fireball and particle storms to --stress-benchmark")
+    parser.add_argument("--pacing", choices=FramePacer.MODES, default='sleep', help="frame pacing strategy")
+    parser.add_argument("--pacing-report", action="store_true", help="print frame interval jitter on exit")
+    parser.add_argument("--late-input", action="store_true",
+                        help="wait before sampling input rather than after presenting")
+    parser.add_argument("--latency-report", action="store_true", help="print input-to-present latency on exit")
+    parser.add_argument("--alloc-report", action="store_true",
+                        help="track surface and heap allocations per frame and report them on exit")
+    parser.add_argument("--gc", choices=GCScheduler.MODES, default='manual',
+                        help="when the garbage collector may run")
+    parser.add_argument("--gc-report", action="store_true", help="print garbage collector pauses on exit")
+    parser.add_argument("--audio-preset", choices=AUDIO_PRESETS, default='balanced',
+                        help="mixer buffer and format: lower latency or fewer dropouts")
+    parser.add_argument("--audio-buffer", type=int, metavar="SAMPLES", help="override the preset's buffer size")
+    parser.add_argument("--audio-frequency", type=int, metavar="HZ", help="override the preset's sample rate")
+    parser.add_argument("--audio-channels", type=int, choices=(1, 2), help="override the preset's channel count")
+    parser.add_argument("--audio-report", action="store_true",
+                        help="monitor the mixer for suspected underruns and report them on exit")
+    parser.add_argument("--audio-latency-test", action="store_true",
+                        help="measure play()-to-output latency for each audio preset and exit")
+    parser.add_argument("--asset-report", action="store_true", help="print per-asset load times once loaded")
+    parser.add_argument("--bake", action="store_true", help="bake every level and sprite into the cache and exit")
+    parser.add_argument("--no-bake-cache", action="store_true", help="neither read nor write the bake cache")
+    parser.add_argument("--capture", action="store_true", help="record frames from launch (F10 toggles in game)")
+    parser.add_argument("--capture-dir", default=CAPTURE_DIR, help="directory clips are recorded into")
+    parser.add_argument("--capture-format", choices=FrameCapture.FORMATS, default='raw',
+                        help="raw bgr0 stream or PNG sequence")
+    parser.add_argument("--no-telemetry", action="store_true", help="do not log this session")
+    parser.add_argument("--telemetry-dir", default=TELEMETRY_DIR, help="directory the session log rotates in")
+    parser.add_argument("--telemetry-build", metavar="LABEL",
+                        help="label sessions with this instead of the source hash (12 characters at most)")
+    parser.add_argument("--analyze-telemetry", action="store_true", help="summarize the logged sessions and exit")
+    parser.add_argument("--compare", action="store_true", help="with --analyze-telemetry, compare builds instead")
+    parser.add_argument("--config", default=CONFIG_PATH, metavar="PATH",
+                        help="JSON settings file, read if it exists (` opens the console to change them live)")
+    parser.add_argument("--preset", choices=CONFIG_PRESETS, help="start from these settings")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="change one setting; repeatable. Settings: " + ", ".join(CONFIG_OPTIONS))
+    parser.add_argument("--quality", choices=[tier['name'] for tier in QUALITY_TIERS],
+                        help="fix the quality tier instead of adapting it to frame time")
+    args = parser.parse_args(argv)
+    settings = {}
+    for assignment in args.set:
+        name, separator, value = assignment.partition('=')
+        try:
+            if not separator:
+                raise ValueError(f"expected NAME=VALUE, not '{assignment}'")
+            settings[name.strip()] = config.parse(name.strip(), value)
+        except ValueError as e:
+            parser.error(f"--set: {e}")
+    args.set = settings
+    return args
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    startup.report_enabled = args.startup_report
+    pacer.mode = args.pacing
+    pacer.late_input = args.late_input
+    input_latency.enabled = args.latency_report
+    gc_control.mode = args.gc
+    gc_control.report_enabled = args.gc_report
+    assets.report_enabled = args.asset_report
+    if args.audio_latency_test:
+        audio_latency_test()
+        sys.exit()
+    audio.configure(args.audio_preset, buffer=args.audio_buffer, frequency=args.audio_frequency,
+                    channels=args.audio_channels)
+    audio.report_enabled = args.audio_report
+    # Later sources win: the file, then the preset, then --set and --quality
+    if os.path.exists(args.config):
+        config.load(args.config)
+    if args.preset:
+        config.use_preset(args.preset)
+    config.update(args.set)
+    if args.quality:
+        config.set('quality', args.quality)
+    bake_cache.enabled = not args.no_bake_cache
+    telemetry.directory = args.telemetry_dir
+    if args.analyze_telemetry:
+        analyze_telemetry(args.telemetry_dir, compare=args.compare)
+        sys.exit()
+    if args.bake:
+        bake_assets()
+        sys.exit()
+    if args.stress_benchmark:
+        benchmark_stress(storm=args.storm)
+        sys.exit()
+    if args.verify_physics:
+        sys.exit(0 if verify_physics() else 1)
+    if args.validate_levels:
+        level_data = Game.load_levels() if not args.stress else [
+            generate_stress_level(args.stress_seed, platforms=args.stress // 2, drop_platforms=args.stress // 5,
+                                  breakable_boxes=args.stress // 10, doors=args.stress // 20)]
+        sys.exit(0 if validate_levels(level_data) else 1)
     game = Game()
+    game.pacing_report = args.pacing_report
+    if not args.no_telemetry:
+        telemetry.start(args.telemetry_build)
+    capture.directory = args.capture_dir
+    capture.format = args.capture_format
+    if args.capture:
+        capture.start(game.screen)
+    if args.alloc_report:
+        allocations.enable()
+        game.watch_allocations()
+    if args.stress:
+        game.level_data = [generate_stress_level(args.stress_seed, platforms=args.stress // 2,
+                                                 drop_platforms=args.stress // 5,
+                                                 breakable_boxes=args.stress // 10, doors=args.stress // 20,
+                                                 lights=args.stress // 10, npcs=max(1, args.stress // 100))]
     game.run()
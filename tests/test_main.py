@@ -0,0 +1,93 @@
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import pytest
+import main
+
+main.bake_cache.enabled = False
+
+
+def awake_doors(level):
+    return [door for door in level.doors if door.table.get(door.slot, 'emitter', 'active')]
+
+
+def test_only_doors_in_active_chunks_emit_dust():
+    level = main.Level(main.generate_stress_level(seed=1, doors=1000), 0)
+    assert not awake_doors(level)
+
+    for x in (0, level.world_rect.centerx, level.world_rect.right - 1):
+        level.set_focus(pygame.Rect(x, level.world_rect.centery, 25, 40))
+        active = {id(door) for chunk in level.active_chunks for door in chunk.doors}
+        awake = awake_doors(level)
+        assert [door for door in awake if id(door) not in active] == []
+        assert len(awake) == len([door for door in level.doors if id(door) in active and not door.locked])
+
+
+def test_ghost_sprite_matches_the_player():
+    recorder = main.GhostRecorder()
+    player = main.Player(0, 0)
+    player.set_position(*recorder.SPRITE_ORIGIN)
+    for state in recorder.POSES:
+        player.animation_state = state
+        drawn = main.surfaces.new(recorder.SPRITE_SIZE, True)
+        player.draw(drawn)
+        ghost = main.surfaces.new(recorder.SPRITE_SIZE, True)
+        recorder.paint_pose(recorder.pose(player), ghost)
+        # Arm swing differs by pose, but head and feet must line up with the player's
+        ghost_rect, drawn_rect = ghost.get_bounding_rect(), drawn.get_bounding_rect()
+        assert (ghost_rect.top, ghost_rect.bottom) == (drawn_rect.top, drawn_rect.bottom)
+
+
+def test_rewind_restores_fireballs_and_boxes():
+    level = main.Level(main.generate_stress_level(seed=2, breakable_boxes=20), 0)
+    player = main.Player(0, 0)
+    player.set_position(*level.player_start)
+    player.entities.spawn_fireball(100, 100, 12, 0)
+    player.entities.spawn_fireball(300, 200, 0, -12, 30)
+    level.breakable_boxes[3].break_box()
+    player_state, level_state = player.capture_state(), level.capture_state()
+
+    main.fireball_system(player.entities, [], [])
+    level.breakable_boxes[5].break_box()
+    player.restore_state(player_state)
+    level.restore_state(level_state)
+
+    assert player.capture_state() == player_state
+    assert player.entities.count('fireball') == 2 and player.entities.count('dust') == 0
+    assert [box.broken for box in level.breakable_boxes] == [i == 3 for i in range(20)]
+
+
+def test_rewind_stops_at_the_oldest_tick_still_in_the_ring():
+    rewind = main.RewindBuffer(seconds=1, keyframe_interval=10)
+    player = main.Player(0, 0)
+    for tick in range(90):
+        player.rect.x = tick
+        rewind.record((player.capture_state(), b''))
+    # 90 ticks into a 60-slot ring: ticks 0-29 were overwritten
+    xs = []
+    state = rewind.step_back(1)
+    while state is not None:
+        xs.append(state[0][1][0])
+        state = rewind.step_back(1)
+    assert xs == list(range(88, 29, -1))
+    assert rewind.newest == 30 and rewind.seek(29) is None
+
+
+def test_save_round_trips_and_rejects_truncated_data():
+    world_changes = {
+        0: {'boxes': {0: 1, 3: 3}, 'doors': {1: False}, 'npcs': {0: {'greeting': 2, 'hint': 1}}},
+        4: {'lift_blur': True, 'doors': {0: True, 2: False}},
+    }
+    abilities = {name: i % 2 == 0 for i, name in enumerate(main.ABILITY_NAMES)}
+    data = main.encode_save(4, 0, abilities, 2, world_changes)
+    assert main.decode_save(data) == {'current_level': 4, 'from_level': 0, 'abilities': abilities,
+                                      'keys': 2, 'world_changes': world_changes}
+
+    for length in range(len(data)):
+        with pytest.raises(ValueError):
+            main.decode_save(data[:length])